@@ -1,12 +1,15 @@
 # aim/agents/persona.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
-from dataclasses import dataclass
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
+import hashlib
 import json
 import logging
 import os
 import random
+import threading
 import time
 from typing import Optional, Any
 
@@ -15,6 +18,11 @@ from ..utils.xml import XmlFormatter
 
 logger = logging.getLogger(__name__)
 
+# Rendered persona fragments, keyed on the persona content hash and the rendering flags
+FRAGMENT_CACHE_SIZE = 64
+_fragment_cache : "OrderedDict[tuple, list[str]]" = OrderedDict()
+_fragment_cache_lock = threading.Lock()
+
 @dataclass
 class Aspect:
     name: str = "Unknown"
@@ -79,6 +87,8 @@ class Persona:
         "Please follow directions, being precise and methodical, utilizing Chain of Thought, Self-RAG, and Semantic Keywords."
     )
     include_date: bool = True
+    # The content hash, computed on first use
+    _content_hash: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def _xml_description(self, *base_path, xml: XmlFormatter, show_time: bool = True, mood: Optional[str] = None, disable_pif: bool = False, disable_guidance: bool = False) -> str:
         for k, v in self.attributes.items():
@@ -100,6 +110,57 @@ class Persona:
 
         return xml
 
+    @property
+    def content_hash(self) -> str:
+        """
+        A hash of everything that goes in to the static persona fragment.
+        """
+        if self._content_hash is not None:
+            return self._content_hash
+        content = {
+            "persona_id": self.persona_id,
+            "persona_version": self.persona_version,
+            "full_name": self.full_name,
+            "system_header": self.system_header,
+            "attributes": self.attributes,
+            "features": self.features,
+            "pif": self.pif,
+            "nshot": self.nshot,
+        }
+        self._content_hash = hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+        return self._content_hash
+
+    def xml_fragment(self, location: str, disable_guidance: bool = False, disable_pif: bool = False, indent: str = "  ") -> list[str]:
+        """
+        The rendered, static body of the persona node. Everything in here depends only on the
+        persona content and the flags, so it is rendered once and reused on every request; which
+        also keeps the prompt prefix byte-stable for the inference server's prefix cache.
+        """
+        key = (self.content_hash, location, disable_guidance, disable_pif, indent)
+        with _fragment_cache_lock:
+            lines = _fragment_cache.get(key)
+            if lines is not None:
+                _fragment_cache.move_to_end(key)
+                return lines
+
+        xml = XmlFormatter(base_indent=indent)
+        xml.add_element(self.full_name, "PersonaId", content=self.persona_id, nowrap=True)
+        xml.add_element(self.full_name, "Location", content=location, nowrap=True)
+        if len(self.system_header) > 0:
+            xml.add_element(self.full_name, "SystemHeader", content=self.system_header, nowrap=True)
+        xml = self._xml_description(self.full_name, xml=xml, show_time=self.include_date, disable_guidance=disable_guidance, disable_pif=disable_pif)
+
+        # Strip the persona node's own start and end tags; the fragment is its body
+        lines = xml.tree.node_at((self.full_name,)).render(indent)[1:-1]
+
+        with _fragment_cache_lock:
+            _fragment_cache[key] = lines
+            _fragment_cache.move_to_end(key)
+            while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+                _fragment_cache.popitem(last=False)
+        logger.debug(f"Rendered persona fragment for {self.persona_id}: {len(lines)} lines")
+        return lines
+
     def xml_decorator(
         self,
         xml: XmlFormatter,
@@ -112,23 +173,21 @@ class Persona:
         """This is where we need to decorate our formatter, returning a document
 <Full Name>
 </Full Name>
+
+        The static persona body comes from the fragment cache; only the per-request pieces
+        (the user we are talking to) are added after it.
         """
  
         location = location or self.default_location
         # We need to add each item as 'content', with the full name being our root key
         xml.add_element(self.full_name, version=self.persona_version,
                         content=f"You are {self.full_name} v{self.persona_version} - Active Memory Enabled. This is your cognative persona:")
-        xml.add_element(self.full_name, "PersonaId", content=self.persona_id, nowrap=True)
-        xml.add_element(self.full_name, "Location", content=location, nowrap=True)
-        if len(self.system_header) > 0:
-            xml.add_element(self.full_name, "SystemHeader", content=self.system_header, nowrap=True)
+        xml.add_fragment(self.full_name, lines=self.xml_fragment(location, disable_guidance=disable_guidance, disable_pif=disable_pif, indent=xml.indent))
 
         if user_id is not None:
             xml.add_element(self.full_name, "SystemHeader", content=f"{self.persona_id} is talking to {user_id}.", nowrap=True)
             xml.add_element(self.full_name, "SystemHeader", content=f"Stay in character, and use your memories to help you. Don't speak for {user_id}.", nowrap=True)
 
-        xml = self._xml_description(self.full_name, xml=xml, show_time=self.include_date, mood=mood, disable_guidance=disable_guidance, disable_pif=disable_pif)
-
         return xml
 
     def system_prompt(
@@ -9,31 +9,45 @@ import click
 from collections import defaultdict
 import logging
 import os
-import pandas as pd
 import sys
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, TYPE_CHECKING
 
 from ...agents import Persona
-from ...chat.app import ChatApp
-from ...conversation.model import ConversationModel
-from ...io.jsonl import write_jsonl, read_jsonl
+from ...io.jsonl import write_jsonl
+from ...io.records import FORMATS, FORMAT_JSONL, Checkpoint, RecordWriter, read_records, record_count
 from ...llm.llm import LLMProvider, OpenAIProvider, ChatConfig
 
+# The chat app and the conversation model pull in pandas, tantivy and friends, so we only import them
+# when a command needs them, and `--help` stays fast
+if TYPE_CHECKING:
+    from ...chat.app import ChatApp
+    from ...conversation.model import ConversationModel
+
 logger = logging.getLogger(__name__)
 
 
 class ContextObject:
     config : ChatConfig
-    cvm : ConversationModel
     persona : Persona
     llm : LLMProvider
 
     def __init__(self):
         self.config = None
-        self.cvm = None
+        self._cvm = None
         self.persona = None
         self.llm = None
 
+    @property
+    def cvm(self) -> "ConversationModel":
+        """The conversation model, created on first use."""
+        if self._cvm is None:
+            self.init_cvm()
+        return self._cvm
+
+    @cvm.setter
+    def cvm(self, cvm: "ConversationModel") -> None:
+        self._cvm = cvm
+
     def accept(self, **kwargs) -> 'ContextObject':
         config_dict = self.config_dict
         for k, v in kwargs.items():
@@ -49,6 +63,7 @@ class ContextObject:
         return self.config.to_dict()
 
     def init_cvm(self) -> None:
+        from ...conversation.model import ConversationModel
         self.cvm = ConversationModel.from_config(self.config)
 
     def init_persona(self) -> None:
@@ -63,7 +78,8 @@ class ContextObject:
 
         self.persona = Persona.from_json_file(persona_file)
 
-    def build_chat(self) -> ChatApp:
+    def build_chat(self) -> "ChatApp":
+        from ...chat.app import ChatApp
         if self.llm is None:
             raise ValueError("LLM not initialized")
         if self.cvm is None:
@@ -86,14 +102,13 @@ class ContextObject:
 @click.pass_context
 def cli(ctx, env_file):
     co = ContextObject.from_env(env_file=env_file)
-    
-    co.cvm = ConversationModel.from_config(co.config)
     ctx.obj = co
 
 @cli.command()
 @click.pass_obj
 def list_conversations(co: ContextObject):
     """List all conversations"""
+    import pandas as pd
     pd.set_option('display.max_columns', 20)
     pd.set_option('display.width', 100)
     df: pd.DataFrame = co.cvm.to_pandas()
@@ -104,6 +119,7 @@ def list_conversations(co: ContextObject):
 @click.pass_obj
 def matrix(co: ContextObject):
     """List all conversations"""
+    import pandas as pd
     pd.set_option('display.max_columns', 20)
     pd.set_option('display.width', 100)
     df: pd.DataFrame = co.cvm.get_conversation_report()
@@ -152,40 +168,123 @@ def export_conversation(co: ContextObject, conversation_id, workdir_folder, file
 
 @cli.command()
 @click.option('--workdir_folder', default=None, help='working directory')
-@click.option('--filename', default=None, help='output file')
+@click.option('--filename', default=None, help='output file, JSONL or Parquet by its suffix')
+@click.option('--format', 'record_format', type=click.Choice(FORMATS), default=None, help='Output format, instead of by the suffix')
+@click.option('--batch-size', default=1000, help='Messages written at a time')
+@click.option('--resume', is_flag=True, help='Continue an interrupted JSONL export from its checkpoint')
 @click.pass_obj
-def export_all(co: ContextObject, workdir_folder, filename):
-    """Export a conversation as a jsonl file"""
+def export_all(co: ContextObject, workdir_folder, filename, record_format, batch_size, resume):
+    """Export every conversation to a JSONL or Parquet file, a conversation at a time"""
+    from ...conversation.loader import ConversationLoader
+
     if filename is None:
         filename = f"dump.jsonl"
 
     workdir_folder = co.accept(workdir_folder=workdir_folder).config.workdir_folder
     output_file = os.path.join(workdir_folder if workdir_folder is not None else '.', filename)
 
-    history = co.cvm.dataframe
-    history.drop(columns=['index'], inplace=True)
-    history = [r.to_dict() for _, r in history.iterrows()]
-    write_jsonl(history, output_file)
+    # Conversations are read straight from their files, there's no need for the index or the embedding model
+    loader = ConversationLoader(conversations_dir=os.path.join(co.config.memory_path, 'conversations'))
+    paths = sorted(loader.conversations_dir.glob("*.jsonl"))
+
+    checkpoint = Checkpoint(f"{output_file}.checkpoint")
+    state = checkpoint.load() if resume else None
+    if state is not None:
+        paths = [path for path in paths if path.name > state["conversation"]]
+        click.echo(f"Resuming after {state['conversation']}, {state['records']} messages already exported")
+    position, records = (state["position"], state["records"]) if state is not None else (0, 0)
 
-    click.echo(f"All data has been exported to {output_file}. ({len(history)} messages)")
+    try:
+        writer = RecordWriter(output_file, record_format, position=position)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    resumable = writer.format == FORMAT_JSONL
+
+    with writer, click.progressbar(paths, label="Exporting conversations") as bar:
+        pending = []
+        for path in bar:
+            pending.extend(message.to_dict() for message in loader.load_file(path))
+            if len(pending) < batch_size:
+                continue
+            writer.write(pending)
+            records += len(pending)
+            pending = []
+            # Only at the end of a conversation, so a resumed export starts with the next one
+            if resumable:
+                writer.flush()
+                checkpoint.save({"conversation": path.name, "position": writer.position, "records": records})
+        writer.write(pending)
+        records += len(pending)
+    checkpoint.clear()
+
+    click.echo(f"All data has been exported to {output_file}. ({records} messages)")
+
+def import_records(co: ContextObject, filename: str, record_format: Optional[str], batch_size: int, resume: bool,
+                   **overrides: Optional[str]) -> Dict[str, int]:
+    """
+    Import the messages of a JSONL or Parquet file, `batch_size` at a time, each batch embedded together and
+    committed to the index at once. The position in the file is checkpointed after every batch; an interrupted
+    import is resumed from there, without duplicating the messages of the batch it was in.
+
+    Returns:
+        Dict[str, int]: The number of messages imported per conversation.
+    """
+    from ...conversation.message import ConversationMessage
+
+    checkpoint = Checkpoint(f"{filename}.checkpoint")
+    state = checkpoint.load()
+    if state is not None and not resume:
+        raise click.UsageError(f"{filename} was partly imported, continue it with --resume or remove {checkpoint.path}")
+    if state is not None:
+        click.echo(f"Resuming {filename}, {state['records']} messages already imported")
+    position, records = (state["position"], state["records"]) if state is not None else (0, 0)
+    # The batch after the checkpoint may have been partly written
+    skip_existing = state is not None
+    # Saved before anything is written, so an import interrupted in its first batch is resumable too
+    checkpoint.save({"position": position, "records": records})
+
+    conversation_ids = defaultdict(int)
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    try:
+        total = record_count(filename, record_format)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    with click.progressbar(length=total, label=f"Importing {os.path.basename(filename)}") as bar:
+        bar.update(position)
+        batch, end = [], position
+        for record, end in read_records(filename, record_format, position=position):
+            batch.append(ConversationMessage.from_dict({**record, **overrides}))
+            if len(batch) < batch_size:
+                continue
+            co.cvm.insert_many(batch, skip_existing=skip_existing)
+            for message in batch:
+                conversation_ids[message.conversation_id] += 1
+            records += len(batch)
+            checkpoint.save({"position": end, "records": records})
+            bar.update(end - position)
+            batch, position, skip_existing = [], end, False
+        co.cvm.insert_many(batch, skip_existing=skip_existing)
+        for message in batch:
+            conversation_ids[message.conversation_id] += 1
+        bar.update(end - position)
+    checkpoint.clear()
+
+    return conversation_ids
 
 @cli.command()
 @click.option('--user-id', default=None, help='User ID for whom to apply the conversation')
 @click.option('--persona-id', default=None, help='Persona ID for whom to apply the conversation')
+@click.option('--format', 'record_format', type=click.Choice(FORMATS), default=None, help='Input format, instead of by the suffix')
+@click.option('--batch-size', default=256, help='Messages embedded and committed at a time')
+@click.option('--resume', is_flag=True, help='Continue an interrupted import from its checkpoint')
 @click.argument('conversation_filename')
 @click.pass_obj
-def import_conversation(co: ContextObject, conversation_filename, user_id, persona_id):
-    """Export a conversation as a jsonl file"""
+def import_conversation(co: ContextObject, conversation_filename, user_id, persona_id, record_format, batch_size, resume):
+    """Import a conversation from a JSONL or Parquet file"""
 
-    conversation_ids = defaultdict(int)
-    data = read_jsonl(conversation_filename)
-    for row in data:
-        conversation_ids[row['conversation_id']] += 1
-        if user_id is not None:
-            row['user_id'] = user_id
-        if persona_id is not None:
-            row['persona_id'] = persona_id
-        co.cvm.insert(**row)
+    conversation_ids = import_records(co, conversation_filename, record_format, batch_size, resume,
+                                      user_id=user_id, persona_id=persona_id)
 
     click.echo(f"Conversation {conversation_filename} has been imported.")
     
@@ -193,16 +292,15 @@ def import_conversation(co: ContextObject, conversation_filename, user_id, perso
         click.echo(f"Conversation {conversation_id} has been imported. ({count} messages)")
 
 @cli.command()
+@click.option('--format', 'record_format', type=click.Choice(FORMATS), default=None, help='Input format, instead of by the suffix')
+@click.option('--batch-size', default=256, help='Messages embedded and committed at a time')
+@click.option('--resume', is_flag=True, help='Continue an interrupted import from its checkpoint')
 @click.argument('dump_filename')
 @click.pass_obj
-def import_all(co: ContextObject, dump_filename):
-    """Import the contents of a conversation dump from a jsonl file"""
+def import_all(co: ContextObject, dump_filename, record_format, batch_size, resume):
+    """Import the contents of a conversation dump from a JSONL or Parquet file"""
 
-    conversation_ids = defaultdict(int)
-    data = read_jsonl(dump_filename)
-    for row in data:
-        conversation_ids[row['conversation_id']] += 1
-        co.cvm.insert(**row)
+    conversation_ids = import_records(co, dump_filename, record_format, batch_size, resume)
 
     click.echo(f"Conversation {dump_filename} has been imported.")
     
@@ -259,15 +357,18 @@ def chat(co: ContextObject, model_url, api_key, user_id, persona_id, conversatio
 @click.option('--mood', default=None, help='The mood of the persona')
 @click.option('--no-retry', is_flag=True, help='Do not prompt the user for input')
 @click.option('--guidance', is_flag=True, help='Prompt for guidance for the conversation')
+@click.option('--resume', is_flag=True, help='Reuse the stored completions of a failed run of the same pipeline')
+@click.option('--run-id', default=None, help='Checkpoint the run under this id, and continue it from there if it was interrupted')
 @click.argument('query', nargs=-1)
 @click.pass_obj
-def pipeline(co: ContextObject, pipeline_type, persona_id, conversation_id, mood, query, no_retry, guidance):
+def pipeline(co: ContextObject, pipeline_type, persona_id, conversation_id, mood, query, no_retry, guidance, resume, run_id):
     """Run the journal pipeline"""
     from ...pipeline.factory import pipeline_factory, BasePipeline
     co.accept(
         persona_id=persona_id,
         conversation_id=conversation_id,
         no_retry=no_retry,
+        resume=resume,
         mood=mood,
         query_text=' '.join(query),
     )
@@ -278,25 +379,30 @@ def pipeline(co: ContextObject, pipeline_type, persona_id, conversation_id, mood
         print(f"Guidance: {co.config.guidance}")
 
     base = BasePipeline.from_config(co.config)
+    base.run_id = run_id
+    base.pipeline_type = pipeline_type
     pipeline = pipeline_factory(pipeline_type=pipeline_type)
     asyncio.run(pipeline(self=base, **(co.config_dict)))
+    base.finish_run()
 
 @cli.command()
 @click.option('--conversations-dir', default="memory/conversations", help='Directory containing conversation JSONL files')
 @click.option('--index-dir', default="memory/indices", help='Directory for storing indices')
 @click.option('--debug', is_flag=True, help='Enable debug output')
 @click.option('--device', default="cpu", help='Device to use for indexing')
+@click.option('--shard', default=None, help='Only rebuild the shard of this persona or user, with INDEX_SHARD_BY set')
 @click.pass_obj
-def rebuild_index(co: ContextObject, conversations_dir: str, index_dir: str, device:str, debug: bool):
+def rebuild_index(co: ContextObject, conversations_dir: str, index_dir: str, device:str, debug: bool, shard: Optional[str]):
     """Rebuild search indices from conversation JSONL files"""
     from ...conversation.loader import ConversationLoader
-    from ...conversation.index import SearchIndex
-    from pathlib import Path
+
+    if shard is not None and not co.config.index_shard_by:
+        raise click.UsageError("--shard needs INDEX_SHARD_BY to be set")
 
     try:
         # Initialize loader and index
         loader = ConversationLoader(conversations_dir)
-        index = SearchIndex(index_path=Path(index_dir), embedding_model=co.config.embedding_model, device=device)
+        index = open_cli_index(co, index_dir, device)
         
         # Load all conversations
         click.echo("Loading conversations...")
@@ -320,7 +426,10 @@ def rebuild_index(co: ContextObject, conversations_dir: str, index_dir: str, dev
             click.echo(f"ID: {documents[0]['doc_id']}")
             click.echo(f"Content: {documents[0]['content'][:100]}")
             
-        index.add_documents(documents)
+        if shard is not None:
+            index.rebuild(documents, key=shard)
+        else:
+            index.rebuild(documents)
         
         click.echo("Index rebuild complete!")
         
@@ -331,6 +440,59 @@ def rebuild_index(co: ContextObject, conversations_dir: str, index_dir: str, dev
             click.echo(traceback.format_exc())
         raise click.Abort()
 
+@cli.command()
+@click.option('--index-dir', default="memory/indices", help='Directory of the search index')
+@click.option('--batch-size', default=1000, help='Documents per commit')
+@click.option('--device', default="cpu", help='Device to use for re-embedding')
+@click.pass_obj
+def migrate_vectors(co: ContextObject, index_dir: str, batch_size: int, device: str):
+    """Normalize and re-encode the stored vectors to the configured VECTOR_DTYPE and EMBEDDING_POOLING"""
+    index = open_cli_index(co, index_dir, device)
+    migrated = index.migrate_vectors(batch_size=batch_size)
+    click.echo(f"Migrated {migrated} vectors to {co.config.vector_dtype}, {index.vectorizer.pooling} pooling")
+
+@cli.command()
+@click.option('--index-dir', default="memory/indices", help='Directory of the search index')
+@click.option('--shard', default=None, help='Only compact the shard of this persona or user, with INDEX_SHARD_BY set')
+@click.option('--vacuum', is_flag=True, help='Copy the live documents into a single segment, dropping deleted documents')
+@click.option('--if-due', is_flag=True, help='Only compact indexes that are idle and due under the compaction policy')
+@click.pass_obj
+def compact_index(co: ContextObject, index_dir: str, shard: Optional[str], vacuum: bool, if_due: bool):
+    """Merge the segments of the search index and reclaim the space of deleted documents"""
+    from ...conversation.maintenance import IndexMaintenance
+
+    if shard is not None and not co.config.index_shard_by:
+        raise click.UsageError("--shard needs INDEX_SHARD_BY to be set")
+    maintenance = IndexMaintenance.from_config(co.config, index=open_cli_index(co, index_dir))
+    done = maintenance.run_once(key=shard, force=not if_due, vacuum=vacuum)
+    for key, action in done.items():
+        click.echo(f"{key or 'index'}: {action}")
+    click.echo(f"Index compaction complete, {len(done)} compacted")
+
+@cli.command()
+@click.option('--index-dir', default="memory/indices", help='Directory of the search index')
+@click.option('--shard', default=None, help='Only the shard of this persona or user, with INDEX_SHARD_BY set')
+@click.pass_obj
+def index_stats(co: ContextObject, index_dir: str, shard: Optional[str]):
+    """Show the segment count, deleted documents and size of the search index"""
+    from ...conversation.maintenance import IndexMaintenance
+
+    maintenance = IndexMaintenance.from_config(co.config, index=open_cli_index(co, index_dir))
+    click.echo(f"{'index':<20} {'segments':>8} {'docs':>8} {'deleted':>8} {'ratio':>6} {'MiB':>8}  due")
+    for key, stats in maintenance.stats(shard).items():
+        click.echo(f"{key or 'index':<20} {stats.segments:8d} {stats.docs:8d} {stats.deleted_docs:8d} "
+                   f"{stats.deleted_ratio:6.2f} {stats.size_bytes / 2**20:8.2f}  {maintenance.policy.due(stats) or '-'}")
+
+def open_cli_index(co: ContextObject, index_dir: str, device: str = "cpu"):
+    """The conversation index, sharded as configured"""
+    from ...conversation.shards import open_index
+    from pathlib import Path
+
+    return open_index(Path(index_dir), shard_by=co.config.index_shard_by, embedding_model=co.config.embedding_model, device=device,
+                      embedding_backend=co.config.embedding_backend, embedding_threads=co.config.embedding_threads,
+                      embedding_pooling=co.config.embedding_pooling, vector_dtype=co.config.vector_dtype,
+                      query_max_terms=co.config.query_max_terms)
+
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
 
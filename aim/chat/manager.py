@@ -5,19 +5,24 @@ from typing import List, Dict, Optional
 
 from ..constants import ROLE_USER, ROLE_ASSISTANT
 from ..io.documents import Library
+from ..io.document_index import DocumentIndex
 from ..llm.llm import ChatConfig
 from ..conversation.model import ConversationModel
 from ..agents import Roster
+from .summary import RollingSummary
 
 
 class ChatManager:
-    def __init__(self, cvm: ConversationModel, config: ChatConfig, roster: Roster):
+    def __init__(self, cvm: ConversationModel, config: ChatConfig, roster: Roster, summarizer: Optional[RollingSummary] = None,
+                 document_index: Optional[DocumentIndex] = None):
         self.cvm = cvm
         self.config = config
         self.roster = roster
-        self.library = Library(documents_dir=config.documents_dir)
+        self.summarizer = summarizer
+        self.library = Library(documents_dir=config.documents_dir, watch=True, index=document_index)
         self.current_document : Optional[str] = None
         self.current_workspace : Optional[str] = None
+        self.current_branch : int = 0
 
         self.history : List[Dict[str, str]] = []
 
@@ -79,4 +84,7 @@ class ChatManager:
     def from_config(cls, config: ChatConfig) -> "ChatManager":
         cvm = ConversationModel.from_config(config)
         roster = Roster.from_config(config)
-        return cls(cvm=cvm, config=config, roster=roster)
+        summarizer = RollingSummary.from_config(config)
+        # The document index shares the conversation index's embedding model
+        document_index = DocumentIndex.from_config(config, vectorizer=cvm.index.vectorizer) if config.documents_dir is not None else None
+        return cls(cvm=cvm, config=config, roster=roster, summarizer=summarizer, document_index=document_index)
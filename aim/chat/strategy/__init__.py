@@ -11,5 +11,7 @@ def chat_strategy_for(chat_strategy: str, chat: ChatManager) -> ChatTurnStrategy
         return SimpleTurnStrategy(chat)
     elif chat_strategy == "xmlmemory":
         return XMLMemoryTurnStrategy(chat)
+    elif chat_strategy == "xmlmemory-stable":
+        return XMLMemoryTurnStrategy(chat, prefix_stable=True)
     else:
         raise ValueError(f"Unknown chat strategy: {chat_strategy}")
\ No newline at end of file
@@ -2,11 +2,9 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 from collections import defaultdict
-import copy
 from datetime import datetime, timedelta
 import logging
 import pandas as pd
-import random
 from typing import Optional
 
 from ..manager import ChatManager
@@ -14,17 +12,34 @@ from ...constants import TOKEN_CHARS
 from ...utils.xml import XmlFormatter
 from .base import ChatTurnStrategy
 from ...utils.keywords import extract_semantic_keywords
+from ...utils.turns import trim_history
 from ...agents.persona import Persona
 logger = logging.getLogger(__name__)
 
 
 class XMLMemoryTurnStrategy(ChatTurnStrategy):
-    def __init__(self, chat : ChatManager):
+    """
+    Builds chat turns with a conscious memory (HUD) block.
+
+    With `prefix_stable`, the turns are ordered from most to least stable - the conversation
+    history first, and the volatile memory and time block in the final user turn - so that
+    the prompt prefix is byte-identical between requests, and the inference server's prefix
+    cache can be reused.
+
+    In both layouts, history over budget is trimmed by dropping the oldest whole blocks of
+    `history_trim_block` turns, so retries and regenerations build the same prompt.
+    """
+    def __init__(self, chat : ChatManager, prefix_stable: bool = False):
         self.chat = chat
         self.pinned : list[str] = []
+        self.thought_content : Optional[str] = None
         # TODO We need to calculate the actual tokens. This guesstimating is not working well.
         self.max_character_length = int((16384 - 4096) * (TOKEN_CHARS - 2.00))
         self.hud_name = "HUD Display Output"
+        self.prefix_stable = prefix_stable
+        self.history_header = "[~~ Conversation History ~~]"
+        self.history_trim_block = 8
+        self.cacheable_prefix_length : int = 0
 
     def user_turn_for(self, persona: Persona, user_input: str, history: list[dict[str, str]] = []) -> dict[str, str]:
         return {"role": "user", "content": user_input}
@@ -71,6 +86,19 @@ class XMLMemoryTurnStrategy(ChatTurnStrategy):
             logger.info(f"Current Document: {self.chat.current_document}")
             document_contents = self.chat.library.read_document(self.chat.current_document)
             doc_size = len(document_contents.split())
+            top_chunks = self.chat.config.document_chunks
+            if top_chunks > 0 and len(document_contents) > top_chunks * self.chat.config.document_chunk_size:
+                # Too large to include whole, so we only include the most relevant excerpts
+                query_texts = [q for q in [query, *user_queries[-2:]] if q]
+                try:
+                    chunks = self.chat.library.relevant_chunks(self.chat.current_document, query_texts, top_n=top_chunks)
+                except Exception as e:
+                    # The index is only an optimization; include the whole document instead
+                    logger.warning(f"Could not find the relevant chunks of {self.chat.current_document}: {e}")
+                    chunks = None
+                if chunks:
+                    document_contents = "\n[...]\n".join(chunk for _, chunk in chunks)
+                    logger.info(f"Document excerpts: {len(chunks)} chunks, {len(document_contents)} characters")
             formatter.add_element("document", content=document_contents,
                 metadata=dict(
                     name=self.chat.current_document,
@@ -200,8 +228,10 @@ class XMLMemoryTurnStrategy(ChatTurnStrategy):
             List[Dict[str, str]]: The chat turns, in the alternating format [{"role": "user", "content": user_input}, {"role": "assistant", "content": assistant_turn}].
         """
         
-        # Make a deep copy of the history
-        history = copy.deepcopy(history)
+        summarizer = getattr(self.chat, 'summarizer', None)
+        if summarizer is not None:
+            # Swap the oldest turns for their rolling summary, once it's ready
+            history = summarizer.substitute(history, conversation_id=self.chat.config.conversation_id, branch=getattr(self.chat, 'current_branch', 0))
 
         history_len = sum(len(h['content']) for h in history)
         thought_len = len(self.thought_content or "")
@@ -210,36 +240,12 @@ class XMLMemoryTurnStrategy(ChatTurnStrategy):
         history_len_pct = history_len / self.max_character_length
         logger.info(f"Generating chat turns. Thought Length: {thought_len} Current History Length: {len(history)} System: {content_len_pct:.2f} History: {history_len_pct:.2f}")
 
-        fold_consciousness = 4
         history_cutoff_threshold = 0.5
 
         # if our history is over 50%, we need to remove some of the older user/assistant turns
         if history_len_pct > history_cutoff_threshold:
-            # Calculate overage
-            overage = int((history_len_pct - history_cutoff_threshold) * self.max_character_length)
             logger.info(f"History is over {history_cutoff_threshold:.2f}, removing older turns.")
-            removed = 0
-            while overage > 0:
-                # Randomly select a turn to remove, weighting by the position in the history
-                weights = range(len(history) - 2, 2, -1)
-                total = sum(weights)
-                weights = [w / total for w in weights]
-                choices = len(history) - 4
-                if choices <= 0:
-                    break
-                remove_turn_index = random.choices(range(choices), weights=weights)[0]
-                # if this is an assistant turn, go back one
-                if history[remove_turn_index]['role'] == 'assistant':
-                    remove_turn_index -= 1
-                
-                # remove the turn
-                overage -= len(history[remove_turn_index]['content'])
-                del history[remove_turn_index]
-                overage -= len(history[remove_turn_index]['content'])
-                del history[remove_turn_index]
-                removed += 2
-                
-            history = history[-(len(history) // 2):]
+            history, removed = trim_history(history, int(history_cutoff_threshold * self.max_character_length), block_size=self.history_trim_block)
             history_len = sum(len(h['content']) for h in history)
             logger.info(f"History overage removed: {removed}")
 
@@ -253,7 +259,26 @@ class XMLMemoryTurnStrategy(ChatTurnStrategy):
                 assistant_queries=assistant_turn_history,
                 content_len=(content_len or 0)+history_len+thought_len
                 )
-        
+
+        if self.prefix_stable:
+            turns = self._stable_turns(persona, user_input, history, consciousness)
+        else:
+            turns = self._memory_first_turns(persona, user_input, history, consciousness)
+
+        if self.prefix_stable:
+            # Everything before the final user turn is unchanged from the last request, if the history was
+            self.cacheable_prefix_length = (content_len or 0) + sum(len(t['content']) for t in turns[:-1])
+        else:
+            # Only the system message; the consciousness turn right after it changes with every request
+            self.cacheable_prefix_length = content_len or 0
+        logger.info(f"Expected cacheable prefix: {self.cacheable_prefix_length} characters (~{self.cacheable_prefix_length // TOKEN_CHARS} tokens)")
+
+        return turns
+
+    def _memory_first_turns(self, persona: Persona, user_input: str, history: list[dict[str, str]], consciousness: str) -> list[dict[str, str]]:
+        """
+        The consciousness block is the first user turn, followed by the history.
+        """
         consciousness_turn = {"role": "user", "content": consciousness}
         
         wakeup = persona.get_wakeup()
@@ -277,8 +302,25 @@ class XMLMemoryTurnStrategy(ChatTurnStrategy):
                 if turns[i]['role'] == 'user':
                     last_user_content = turns[i]['content']
                     last_user_content += f"\n\n{self.thought_content}"
-                    turns[i]['content'] = last_user_content
+                    turns[i] = {**turns[i], 'content': last_user_content}
                     logger.info(f"Thought inserted at {i}")
                     break
         
         return turns
+
+    def _stable_turns(self, persona: Persona, user_input: str, history: list[dict[str, str]], consciousness: str) -> list[dict[str, str]]:
+        """
+        The history comes first, untouched, and the consciousness block and thought are placed
+        in the final user turn, ahead of the user input.
+        """
+        turns = [*history]
+        if len(turns) > 0 and turns[0]['role'] == 'assistant':
+            turns.insert(0, {"role": "user", "content": self.history_header})
+
+        final_content = consciousness
+        if self.thought_content:
+            final_content += f"\n\n{self.thought_content}"
+        final_content += f"\n\n{user_input}\n\n"
+        turns.append({"role": "user", "content": final_content})
+
+        return turns
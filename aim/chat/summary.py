@@ -0,0 +1,170 @@
+# aim/chat/summary.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+import dataclasses
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from ..config import ChatConfig
+from ..constants import ROLE_USER, TOKEN_CHARS
+from ..llm.llm import LLMProvider
+from ..llm.models import LanguageModelV2, ModelCategory
+from ..utils.turns import trim_history
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_MESSAGE = (
+    "You are a precise conversation summarizer. You write compact, factual summaries of conversations, "
+    "keeping names, decisions, open questions, and the emotional tone. You never invent details."
+)
+
+
+class RollingSummary:
+    """
+    An online, incremental summary of the oldest part of a long conversation.
+
+    When the history is over `threshold_tokens`, the oldest whole blocks of turns that would be trimmed are
+    summarized in the background by an analysis model, and the summary is substituted in for those turns on
+    the next request. Summaries are cached per (conversation_id, branch, first turn, last turn), and each new
+    summary extends the longest cached summary of the same conversation, so only the newest block is read.
+    """
+
+    def __init__(self, provider: LLMProvider, config: ChatConfig, threshold_tokens: int, block_size: int = 8,
+                 max_tokens: int = 512, cache_size: int = 256):
+        self.provider = provider
+        self.config = config
+        self.threshold_tokens = threshold_tokens
+        self.block_size = block_size
+        self.max_tokens = max_tokens
+        self.cache_size = cache_size
+        self.summaries : OrderedDict[tuple[str, int, int, int], str] = OrderedDict()
+        self.pending : dict[tuple[str, int, int, int], Future] = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rolling-summary")
+
+    @property
+    def threshold_chars(self) -> int:
+        return self.threshold_tokens * TOKEN_CHARS
+
+    def conversation_key(self, conversation_id: Optional[str], history: list[dict[str, str]]) -> str:
+        """
+        The conversation id, or a stable stand-in derived from the opening turn if we don't have one.
+        """
+        if conversation_id is not None:
+            return conversation_id
+        opening = history[0]['content'] if len(history) > 0 else ""
+        return "anon-" + hashlib.sha1(opening.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, conversation_id: str, branch: int, start: int, end: int) -> Optional[str]:
+        with self.lock:
+            key = (conversation_id, branch, start, end)
+            summary = self.summaries.get(key)
+            if summary is not None:
+                self.summaries.move_to_end(key)
+            return summary
+
+    def _put(self, key: tuple[str, int, int, int], summary: str) -> None:
+        with self.lock:
+            self.summaries[key] = summary
+            self.summaries.move_to_end(key)
+            while len(self.summaries) > self.cache_size:
+                self.summaries.popitem(last=False)
+
+    def _previous(self, conversation_id: str, branch: int, end: int) -> tuple[int, Optional[str]]:
+        """
+        The longest cached summary of this conversation that ends before `end`, and where it ends.
+        """
+        with self.lock:
+            candidates = [
+                (k[3], v) for k, v in self.summaries.items()
+                if k[0] == conversation_id and k[1] == branch and k[2] == 0 and k[3] < end
+            ]
+        if len(candidates) == 0:
+            return 0, None
+        return max(candidates, key=lambda c: c[0])
+
+    def substitute(self, history: list[dict[str, str]], conversation_id: Optional[str] = None, branch: int = 0) -> list[dict[str, str]]:
+        """
+        Returns the history with its oldest blocks replaced by their summary, if the history is over the
+        threshold. If the summary of those blocks isn't ready, it is requested, and the newest summary of fewer
+        of them stands in for it meanwhile; without one, the history is returned as is.
+        """
+        trimmed, removed = trim_history(history, self.threshold_chars, block_size=self.block_size)
+        if removed == 0:
+            return history
+
+        conversation_id = self.conversation_key(conversation_id, history)
+        end, summary = removed, self.get(conversation_id, branch, 0, removed)
+        if summary is None:
+            self.request(conversation_id, branch, history[:removed])
+            end, summary = self._previous(conversation_id, branch, removed + 1)
+            if summary is None:
+                return history
+            trimmed = history[end:]
+
+        logger.info(f"Substituting summary of turns 0-{end} for {conversation_id}/{branch}: {len(summary)} characters")
+        header = f"[~~ Summary of the conversation so far ~~]\n{summary}"
+        if len(trimmed) > 0 and trimmed[0]['role'] == ROLE_USER:
+            return [{**trimmed[0], 'content': f"{header}\n\n{trimmed[0]['content']}"}, *trimmed[1:]]
+        return [{"role": ROLE_USER, "content": header}, *trimmed]
+
+    def request(self, conversation_id: str, branch: int, turns: list[dict[str, str]]) -> Future:
+        """
+        Schedules the summary of `turns`, the oldest turns of the conversation, in the background.
+        """
+        key = (conversation_id, branch, 0, len(turns))
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(self._summarize, key, turns)
+            self.pending[key] = future
+        return future
+
+    def _summarize(self, key: tuple[str, int, int, int], turns: list[dict[str, str]]) -> Optional[str]:
+        conversation_id, branch, _, end = key
+        try:
+            start, previous = self._previous(conversation_id, branch, end)
+            transcript = "\n\n".join(f"{t['role'].capitalize()}: {t['content']}" for t in turns[start:])
+            prompt = ""
+            if previous is not None:
+                prompt += f"<summary>\n{previous}\n</summary>\n\n"
+            prompt += f"<transcript>\n{transcript}\n</transcript>\n\n"
+            prompt += "Update the summary so that it covers the whole conversation above. Write only the summary, in a few short paragraphs."
+
+            # Our config is shared with the request handlers, so we work on a copy
+            config = dataclasses.replace(self.config, system_message=SUMMARY_SYSTEM_MESSAGE, max_tokens=self.max_tokens,
+                                         temperature=0.3, response_format=None, stop_sequences=[])
+            summary = "".join(c for c in self.provider.stream_turns([{"role": ROLE_USER, "content": prompt}], config) if c).strip()
+            if len(summary) == 0:
+                logger.warning(f"Empty summary for {key}")
+                return None
+
+            self._put(key, summary)
+            logger.info(f"Summarized turns {start}-{end} of {conversation_id}/{branch}: {len(summary)} characters")
+            return summary
+        except Exception as e:
+            logger.error(f"Error summarizing {key}: {e}")
+            return None
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
+
+    @classmethod
+    def from_config(cls, config: ChatConfig) -> Optional["RollingSummary"]:
+        """
+        Creates a rolling summary with the first configured analysis model, or None if it is disabled or there is none.
+        """
+        if config.summary_threshold <= 0:
+            return None
+        models = LanguageModelV2.filter_category(list(LanguageModelV2.index_models(config).values()), {ModelCategory.ANALYSIS})
+        if len(models) == 0:
+            logger.warning("Rolling summary is enabled, but no analysis model is configured")
+            return None
+        model = models[0]
+        logger.info(f"Rolling summary using {model.name} above {config.summary_threshold} tokens")
+        return cls(provider=model.llm_factory(config), config=config, threshold_tokens=config.summary_threshold)
@@ -14,14 +14,31 @@ def get_env(dotenv_path: Optional[str] = None) -> Dict[str, str]:
         load_dotenv()
 
     return {
+        "chat_strategy": os.getenv("CHAT_STRATEGY", "xmlmemory"),
+        "compaction_threshold": int(os.getenv("COMPACTION_THRESHOLD", 64 * 1024)),
+        "completion_cache_path": os.getenv("COMPLETION_CACHE_PATH", "memory/completions") or None,
+        "completion_cache_ttl": float(os.getenv("COMPLETION_CACHE_TTL", 7 * 24 * 3600)),
         "conversation_id": os.getenv("CONVERSATION_ID", None),
         "device": os.getenv("DEVICE", "cpu"),
+        "document_chunk_size": int(os.getenv("DOCUMENT_CHUNK_SIZE", 1500)),
+        "document_chunks": int(os.getenv("DOCUMENT_CHUNKS", 8)),
         "documents_dir": os.getenv("DOCUMENTS_DIR", "local/documents"),
+        "embedding_backend": os.getenv("EMBEDDING_BACKEND", "torch"),
         "embedding_model": os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+        "embedding_pooling": os.getenv("EMBEDDING_POOLING", "cls"),
+        "embedding_threads": int(os.getenv("EMBEDDING_THREADS", 0)),
         "guidance": os.getenv("GUIDANCE", None),
+        "index_idle_seconds": float(os.getenv("INDEX_IDLE_SECONDS", 300)),
+        "index_maintenance_interval": float(os.getenv("INDEX_MAINTENANCE_INTERVAL", 3600)),
+        "index_max_deleted_ratio": float(os.getenv("INDEX_MAX_DELETED_RATIO", 0.2)),
+        "index_max_segments": int(os.getenv("INDEX_MAX_SEGMENTS", 16)),
+        "index_shard_by": os.getenv("INDEX_SHARD_BY", None) or None,
+        "ingest_async_threshold": int(os.getenv("INGEST_ASYNC_THRESHOLD", 1000)),
+        "ingest_batch_size": int(os.getenv("INGEST_BATCH_SIZE", 256)),
         "memory_path": os.getenv("MEMORY_PATH", "memory"),
         "llm_provider": os.getenv("LLM_PROVIDER", "openai"),
         "max_tokens": int(os.getenv("MAX_TOKENS", 256)),
+        "max_upload_size": int(os.getenv("MAX_UPLOAD_SIZE", 64 * 1024 * 1024)),
         "memory_window": int(os.getenv("MEMORY_WINDOW", 12)),
         "compat_api_key": os.getenv("COMPAT_API_KEY", None),
         "compat_model_url": os.getenv("COMPAT_MODEL_URL", None),
@@ -39,11 +56,17 @@ def get_env(dotenv_path: Optional[str] = None) -> Dict[str, str]:
         "persona_location": os.getenv("PERSONA_LOCATION", None),
         "persona_mood": os.getenv("PERSONA_MOOD", "Inquisitive"),
         "persona_path": os.getenv("PERSONA_PATH", "configs/personas"),
+        "pipeline_state_path": os.getenv("PIPELINE_STATE_PATH", "memory/pipelines") or None,
+        "pipeline_state_ttl": float(os.getenv("PIPELINE_STATE_TTL", 7 * 24 * 3600)),
+        "query_cache_size": int(os.getenv("QUERY_CACHE_SIZE", 64 * 1024 * 1024)),
+        "query_max_terms": int(os.getenv("QUERY_MAX_TERMS", 32)),
         "recall_size": int(os.getenv("RECALL_SIZE", 3)),
         "server_api_key": os.getenv("SERVER_API_KEY", None),
+        "summary_threshold": int(os.getenv("SUMMARY_THRESHOLD", 0)),
         "temperature": float(os.getenv("TEMPERATURE", 0.7)),
         "top_n": int(os.getenv("TOP_N", 3)),
         "user_id": os.getenv("USER_ID", "user"),
+        "vector_dtype": os.getenv("VECTOR_DTYPE", "float32"),
         "workdir_folder": os.getenv("OUTPUT_FOLDER", "export"),
         "tools_path": os.getenv("TOOLS_PATH", "config/tools"),
         "discord_app_id": os.getenv("DISCORD_APP_ID", None),
@@ -58,15 +81,37 @@ class ChatConfig:
     queue_name: str = "pipeline_tasks"
     device: str = "cpu"
     memory_path: str = "memory"
+    compaction_threshold: int = 64 * 1024
+    index_shard_by: Optional[str] = None
+    index_maintenance_interval: float = 3600
+    index_idle_seconds: float = 300
+    index_max_segments: int = 16
+    index_max_deleted_ratio: float = 0.2
+    query_cache_size: int = 64 * 1024 * 1024
+    query_max_terms: int = 32
+    ingest_batch_size: int = 256
+    ingest_async_threshold: int = 1000
+    completion_cache_path: Optional[str] = "memory/completions"
+    completion_cache_ttl: float = 7 * 24 * 3600
+    pipeline_state_path: Optional[str] = "memory/pipelines"
+    pipeline_state_ttl: float = 7 * 24 * 3600
     embedding_model: str = "mixedbread-ai/mxbai-embed-large-v1"
+    embedding_backend: str = "torch"
+    embedding_threads: int = 0
+    embedding_pooling: str = "cls"
+    vector_dtype: str = "float32"
     persona_path: str = "config/persona"
     tools_path: str = "config/tools"
     model_config_path: str = "config/models.yaml"
     workdir_folder: str = "export"
     documents_dir: Optional[str] = None
+    document_chunk_size: int = 1500
+    document_chunks: int = 8
+    max_upload_size: int = 64 * 1024 * 1024
     user_id: str = "user"
     persona_id: str = "assistant"
     conversation_id: Optional[str] = None
+    chat_strategy: str = "xmlmemory"
     llm_provider: str = "openai"
     local_model_url: Optional[str] = None
     local_api_key: Optional[str] = None
@@ -83,6 +128,7 @@ class ChatConfig:
     top_n: int = 3
     recall_size: int = 3
     memory_window: int = 8
+    summary_threshold: int = 0
     query_text: Optional[str] = None
     generations: int = 1
     presence: Optional[float] = None
@@ -92,6 +138,7 @@ class ChatConfig:
     persona_mood: str = "Inquisitive"
     debug: bool = False
     no_retry: bool = False
+    resume: bool = False
     guidance: Optional[str] = None
     stop_sequences: List[str] = field(
         default_factory=lambda: ['I cannot']
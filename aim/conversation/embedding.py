@@ -1,34 +1,297 @@
 # aim/conversation/embedding.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
+import json
+import logging
 import numpy as np
-import torch
-from transformers import AutoTokenizer, AutoModel
-from typing import Optional
+import os
+from pathlib import Path
+import threading
+from typing import Any, Optional
+
+from .vectors import POOLING_CLS, POOLING_DEFAULT, POOLING_MEAN, POOLINGS, normalize
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = "torch"
+BACKEND_INT8 = "int8"
+BACKEND_ONNX = "onnx"
+BACKENDS = (BACKEND_TORCH, BACKEND_INT8, BACKEND_ONNX)
+
+# Exported ONNX models, reused across runs as exporting takes a while
+ONNX_CACHE = Path.home() / ".cache" / "aim" / "onnx"
+ONNX_OPSET = 17
+
+# An optimized backend must embed these within this cosine similarity of the eager model, or it isn't used
+PARITY_TEXTS = [
+    "Hello, how are you today?",
+    "The quick brown fox jumps over the lazy dog.",
+    "I remember we talked about the garden last spring, and you said the roses never bloomed.",
+    "Embeddings map text into a vector space where similar meanings are close together.",
+]
+PARITY_THRESHOLD = 0.99
+
+# Loaded tokenizers and runners, shared by every embedding of the same model, backend, device and pooling in
+# the process
+_models : dict[tuple[str, str, str, str], tuple[Any, Any]] = {}
+_models_lock = threading.Lock()
+
+
+class EagerRunner:
+    """
+    Runs a torch model, as loaded or dynamically quantized, returning its last hidden state.
+    """
+
+    def __init__(self, model: Any, backend: str = BACKEND_TORCH):
+        self.model = model
+        self.backend = backend
+
+    def to(self, device: str) -> "EagerRunner":
+        self.model.to(device)
+        return self
+
+    def __call__(self, inputs: Any) -> np.ndarray:
+        import torch
+
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+        return outputs.last_hidden_state.float().cpu().numpy()
+
+
+class OnnxRunner:
+    """
+    Runs an exported model in ONNX Runtime, on the CPU, returning its last hidden state.
+    """
+
+    def __init__(self, session: Any):
+        self.session = session
+        self.backend = BACKEND_ONNX
+        self.input_names = {i.name for i in session.get_inputs()}
+
+    def to(self, device: str) -> "OnnxRunner":
+        return self
+
+    def __call__(self, inputs: Any) -> np.ndarray:
+        feed = {name: value.cpu().numpy() for name, value in inputs.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def export_onnx(model: Any, tokenizer: Any, onnx_path: Path) -> None:
+    """
+    Export a model to ONNX, with dynamic batch and sequence axes.
+    """
+    import torch
+
+    sample = dict(tokenizer(PARITY_TEXTS[:2], return_tensors="pt", padding=True))
+    names = list(sample.keys())
+    axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = onnx_path.with_name(f".{onnx_path.name}.tmp")
+    logger.info(f"Exporting embedding model to {onnx_path}")
+    with torch.no_grad():
+        torch.onnx.export(model, (sample,), str(temp_path), input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=ONNX_OPSET)
+    temp_path.replace(onnx_path)
+
+
+def onnx_path(model_name: str, pooling: str, quantization: str = "fp32") -> Path:
+    """
+    Where the ONNX export of a model is cached, by everything the export and its parity check depend on.
+    """
+    return ONNX_CACHE / f"{model_name.replace('/', '--')}-{pooling}-{quantization}-opset{ONNX_OPSET}.onnx"
+
+
+def build_runner(backend: str, model: Any, tokenizer: Any, model_name: str, threads: int = 0, pooling: str = POOLING_CLS) -> Any:
+    """
+    Build the runner for a backend from the eager model. Raises ImportError if the backend isn't installed.
+    """
+    if backend == BACKEND_TORCH:
+        return EagerRunner(model)
+    if backend == BACKEND_INT8:
+        import torch
+        # Weights of the linear layers to int8; activations are quantized on the fly
+        quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return EagerRunner(quantized, backend=BACKEND_INT8)
+    if backend == BACKEND_ONNX:
+        import onnxruntime
+
+        path = onnx_path(model_name, pooling)
+        if not path.exists():
+            export_onnx(model, tokenizer, path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+        return OnnxRunner(session)
+    raise ValueError(f"Unknown embedding backend {backend}, expected one of {', '.join(BACKENDS)}")
+
+
+def parity(tokenizer: Any, reference: Any, candidate: Any, pooling: str = POOLING_CLS, texts: list[str] = PARITY_TEXTS) -> float:
+    """
+    The lowest cosine similarity between the pooled embeddings of two runners, over the given texts.
+    """
+    lowest = 1.0
+    for text in texts:
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+        mask = inputs["attention_mask"].cpu().numpy()
+        a, b = pool(reference(inputs), mask, pooling)[0], pool(candidate(inputs), mask, pooling)[0]
+        lowest = min(lowest, float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))))
+    return lowest
+
+
+def load_model(model_name: str, backend: str = BACKEND_TORCH, threads: int = 0, device: str = "cpu",
+               pooling: str = POOLING_CLS) -> tuple[Any, Any]:
+    """
+    Load a tokenizer and runner, once per process, and move the model to its device for good.
+
+    An optimized backend is checked against the eager model, with the pooling it will be used with, and the
+    eager model is used instead if the backend isn't installed or doesn't reach PARITY_THRESHOLD.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend}, expected one of {', '.join(BACKENDS)}")
+
+    key = (model_name, backend, device, pooling)
+    with _models_lock:
+        if key not in _models:
+            # Deferred, as importing transformers (and torch) takes seconds
+            import torch
+            from transformers import AutoTokenizer, AutoModel
+            if threads > 0:
+                torch.set_num_threads(threads)
+
+            eager = next((loaded for (name, loaded_backend, loaded_device, _), loaded in _models.items()
+                          if (name, loaded_backend, loaded_device) == (model_name, BACKEND_TORCH, device)), None)
+            if eager is not None:
+                tokenizer, runner = eager
+            else:
+                logger.info(f"Loading embedding model {model_name} on {device}")
+                # the clean_up_tokenization_spaces is explicitly set to the default to suppress a warning
+                tokenizer = AutoTokenizer.from_pretrained(model_name, clean_up_tokenization_spaces=False)
+                runner = EagerRunner(AutoModel.from_pretrained(model_name, trust_remote_code=True)).to(device)
+
+            if backend != BACKEND_TORCH:
+                try:
+                    candidate = build_runner(backend, runner.model, tokenizer, model_name, threads, pooling)
+                    score = parity(tokenizer, runner, candidate, pooling)
+                    if score >= PARITY_THRESHOLD:
+                        logger.info(f"Using the {backend} backend for {model_name}, parity {score:.4f}")
+                        runner = candidate
+                    else:
+                        logger.warning(f"The {backend} backend for {model_name} has parity {score:.4f}, below {PARITY_THRESHOLD}; using torch")
+                except ImportError as e:
+                    logger.warning(f"The {backend} backend is not available ({e}); using torch")
+
+            _models[key] = (tokenizer, runner)
+        return _models[key]
+
+
+def is_loaded(model_name: str, backend: str = BACKEND_TORCH, device: str = "cpu", pooling: str = POOLING_CLS) -> bool:
+    return (model_name, backend, device, pooling) in _models
+
+
+def default_pooling(model_name: str) -> str:
+    """
+    The pooling a model was trained with, from its sentence-transformers pooling config; CLS if it has none.
+    """
+    name = "1_Pooling/config.json"
+    try:
+        if os.path.isdir(model_name):
+            path = os.path.join(model_name, name)
+        else:
+            from huggingface_hub import hf_hub_download
+            path = hf_hub_download(model_name, name)
+        with open(path) as f:
+            config = json.load(f)
+    except Exception:
+        return POOLING_CLS
+    if config.get("pooling_mode_mean_tokens") and not config.get("pooling_mode_cls_token"):
+        return POOLING_MEAN
+    return POOLING_CLS
+
+
+def pool(hidden_state: np.ndarray, attention_mask: np.ndarray, pooling: str) -> np.ndarray:
+    """
+    Pool a (batch, sequence, hidden) state to one vector per input: the CLS token, or the mean of the tokens.
+    """
+    if pooling == POOLING_MEAN:
+        mask = attention_mask[:, :, None].astype(np.float32)
+        return (hidden_state * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+    return hidden_state[:, 0, :]
 
 
 class HuggingFaceEmbedding:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: Optional[str] = None):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", device: Optional[str] = None,
+                 backend: str = BACKEND_TORCH, threads: int = 0, pooling: str = POOLING_CLS):
         """
         HuggingFaceEmbedding class for generating embeddings using Hugging Face models.
 
+        The model is loaded on first use, or by calling `load`.
+
         Args:
             model_name (str): The name of the pre-trained model to use.
             device (str): The device to use for computation (e.g., "cpu", "cuda:0", etc.).
+            backend (str): How to run the model on the CPU: "torch", "int8" (dynamic quantization) or "onnx".
+            threads (int): Intra-op threads for inference, or 0 for the runtime's default.
+            pooling (str): "cls", "mean", or "default" for the pooling the model was trained with.
 
         Usage:
             embedding = HuggingFaceEmbedding()
             text_embedding_vector = embedding("This is a sample text.")
         """
         self.model_name = model_name
-        # Initialize the tokenizer and model
-        # the clean_up_tokenization_spaces is explicitly set to the default to suppress a warning
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name, clean_up_tokenization_spaces=False)
-        self.model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
-        if device is not None:
-            self.work_device = device
-        else:
-            self.work_device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.device = device
+        self.backend = backend
+        self.threads = threads
+        if pooling not in POOLINGS:
+            raise ValueError(f"Unknown pooling {pooling}, expected one of {', '.join(POOLINGS)}")
+        self._pooling = pooling
+        self._work_device : Optional[str] = device
+
+    @classmethod
+    def from_config(cls, config) -> "HuggingFaceEmbedding":
+        return cls(model_name=config.embedding_model, device=config.device,
+                   backend=config.embedding_backend, threads=config.embedding_threads, pooling=config.embedding_pooling)
+
+    @property
+    def pooling(self) -> str:
+        if self._pooling == POOLING_DEFAULT:
+            self._pooling = default_pooling(self.model_name)
+        return self._pooling
+
+    @property
+    def run_backend(self) -> str:
+        # The optimized backends run on the CPU only
+        return self.backend if self.work_device == "cpu" else BACKEND_TORCH
+
+    @property
+    def tokenizer(self):
+        return load_model(self.model_name, self.run_backend, self.threads, self.work_device, self.pooling)[0]
+
+    @property
+    def model(self):
+        return load_model(self.model_name, self.run_backend, self.threads, self.work_device, self.pooling)[1]
+
+    @property
+    def work_device(self) -> str:
+        if self._work_device is None:
+            import torch
+            self._work_device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        return self._work_device
+
+    @property
+    def loaded(self) -> bool:
+        return is_loaded(self.model_name, self.run_backend, self.work_device, self.pooling)
+
+    def load(self) -> "HuggingFaceEmbedding":
+        """
+        Load the model now, rather than on first use, and warm it up with an embedding.
+        """
+        load_model(self.model_name, self.run_backend, self.threads, self.work_device, self.pooling)
+        # The first inference pays for allocation and kernel selection
+        self("warm up")
+        return self
 
     def __call__(self, text: str) -> np.ndarray:
         """
@@ -40,16 +303,8 @@ class HuggingFaceEmbedding:
         Returns:
             np.ndarray: The embedding vector for the input text.
         """
-        
-        if self.work_device != "cpu":
-            self.model.to(self.work_device)
-        
-        result = self._get_embedding(text)
-        
-        if self.work_device != "cpu":
-            self.model.to('cpu')
-        
-        return result
+        # The model stays on its device; moving it for every call would race between concurrent callers
+        return self._get_embedding(text)
 
     def _get_embedding(self, text: str) -> np.ndarray:
         """
@@ -59,32 +314,38 @@ class HuggingFaceEmbedding:
             text (str): The input text to calculate the embedding for.
         
         Returns:
-            np.ndarray: The embedding vector for the input text.
+            np.ndarray: The L2 normalized embedding vector for the input text.
         """
+        return self._get_embeddings([text])[0]
 
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    def _get_embeddings(self, texts: list[str]) -> list[np.ndarray]:
+        """
+        The L2 normalized embedding vectors of a batch of texts, from a single forward pass.
+        """
+
+        inputs = self.tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
         
         if self.work_device != "cpu":
-            inputs = inputs.to('cuda:0')
-        
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-        
-        embeddings: np.ndarray = outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
+            inputs = inputs.to(self.work_device)
         
-        return embeddings[0]
+        hidden_state: np.ndarray = self.model(inputs)
+        attention_mask = inputs["attention_mask"].cpu().numpy()
 
-    def transform(self, texts: list[str]) -> list[np.ndarray]:
+        # Normalizing also copies, so the vectors don't hold on to the whole hidden state
+        return [normalize(vector) for vector in pool(hidden_state, attention_mask, self.pooling)]
+
+    def transform(self, texts: list[str], batch_size: int = 32) -> list[np.ndarray]:
         """
-        Transforms a list of texts into a list of embeddings.
+        Transforms a list of texts into a list of embeddings, `batch_size` texts per forward pass.
+
+        Texts are batched with others of similar length, so they're padded as little as possible.
         """
 
-        if self.work_device != "cpu":
-            self.model.to(self.work_device)
-        
-        results = [self._get_embedding(text) for text in texts]
+        results : list[Optional[np.ndarray]] = [None] * len(texts)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, vector in zip(batch, self._get_embeddings([texts[i] for i in batch])):
+                results[i] = vector
 
-        if self.work_device != "cpu":
-            self.model.to('cpu')
-        
         return results
\ No newline at end of file
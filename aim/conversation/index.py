@@ -2,29 +2,99 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Optional
+from typing import Any, Iterator, Optional
+import json
 import logging
 import numpy as np
 import pandas as pd
-import re
+import shutil
+import threading
+import time
 from tantivy import Index, Document as TantivyDocument, SchemaBuilder, Query, Occur, Order
 from ..constants import DOC_CONVERSATION
 from .embedding import HuggingFaceEmbedding
 from .message import VISIBLE_COLUMNS, QUERY_COLUMNS
+from .query_builder import QueryBuilder
+from .vector_store import VectorStore
+from .vectors import DTYPES, DTYPE_FLOAT32, POOLING_CLS, decode_vector, vector_format
+from .writer import file_lock
 
 logger = logging.getLogger(__name__)
 
+# Bumped whenever the schema changes; older indexes are migrated when opened
+SCHEMA_VERSION = 2
+
+
+def last_days(days: float) -> tuple[int, None]:
+    """
+    A time range covering the last `days` days, for `query_time_range`.
+    """
+    return int(time.time() - days * 24 * 60 * 60), None
+
+
+@dataclass
+class IndexStats:
+    """The shape of an index on disk, for deciding when it needs compacting"""
+    segments: int = 0
+    docs: int = 0
+    deleted_docs: int = 0
+    index_bytes: int = 0
+    vector_bytes: int = 0
+    dead_vectors: int = 0
+    last_commit: float = 0.0
+
+    @property
+    def deleted_ratio(self) -> float:
+        """The share of the documents in the segments that are deleted"""
+        return self.deleted_docs / self.docs if self.docs > 0 else 0.0
+
+    @property
+    def size_bytes(self) -> int:
+        return self.index_bytes + self.vector_bytes
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "deleted_ratio": self.deleted_ratio, "size_bytes": self.size_bytes}
+
+
 class SearchIndex:
     """Tantivy-based search index for conversations"""
 
-    def __init__(self, index_path: Path, embedding_model: str = "arkohut/jina-embeddings-v3", device: str = "cpu"):
+    def __init__(self, index_path: Path, embedding_model: str = "arkohut/jina-embeddings-v3", device: str = "cpu",
+                 embedding_backend: str = "torch", embedding_threads: int = 0, embedding_pooling: str = POOLING_CLS,
+                 vector_dtype: str = DTYPE_FLOAT32, query_max_terms: int = 32):
         self.index_path = index_path
         if embedding_model == "arkohut/jina-embeddings-v3":
             raise ValueError("You must specify an embedding model")
-        self.vectorizer = HuggingFaceEmbedding(model_name=embedding_model, device=device)
+        if vector_dtype not in DTYPES:
+            raise ValueError(f"Unknown vector dtype {vector_dtype}, expected one of {', '.join(DTYPES)}")
+        self.vectorizer = HuggingFaceEmbedding(model_name=embedding_model, device=device, backend=embedding_backend,
+                                               threads=embedding_threads, pooling=embedding_pooling)
+        self.vector_dtype = vector_dtype
+        self._vectors : Optional[VectorStore] = None
+        self._write_lock = threading.Lock()
+        self.query_builder = QueryBuilder(field_name="content", max_terms=query_max_terms)
+        # Bumped on every change made here; with the identity of meta.json, which tantivy replaces on every
+        # commit, it tells whether the index changed since a search
+        self._generation = 0
+        self._meta_identity : Optional[tuple[int, int, int]] = None
 
-        # Build schema
+        # Build schema and create/open index
+        self.schema = self._build_schema()
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        self.index = self._open_index()
+
+    @staticmethod
+    def _build_schema(version: int = SCHEMA_VERSION):
+        """
+        The schema of the index, as of a schema version.
+
+        Version 0 kept the vectors in the doc store; version 2 made the filtered fields indexed fast fields.
+        """
+        # The fields we filter on; fast, so filters and range scans read columns rather than the doc store
+        filtered = {"fast": True} if version >= 2 else {}
         builder = SchemaBuilder()
         builder.add_float_field("importance", stored=True)
         builder.add_float_field("sentiment_a", stored=True)
@@ -36,42 +106,120 @@ class SearchIndex:
         builder.add_integer_field("status", stored=True)
         builder.add_integer_field("timestamp", stored=True, fast=True, indexed=True)
         builder.add_text_field("content", stored=True, tokenizer_name="en_stem")
-        builder.add_text_field("conversation_id", stored=True, tokenizer_name="raw")
+        builder.add_text_field("conversation_id", stored=True, tokenizer_name="raw", **filtered)
         builder.add_text_field("doc_id", stored=True, tokenizer_name="raw")
-        builder.add_text_field("document_type", stored=True, tokenizer_name="raw")
+        builder.add_text_field("document_type", stored=True, tokenizer_name="raw", **filtered)
         builder.add_text_field("inference_model", stored=True, tokenizer_name="raw")
         builder.add_text_field("listener_id", stored=True, tokenizer_name="raw")
         builder.add_text_field("metadata", stored=True, tokenizer_name="raw")
         builder.add_text_field("observer", stored=True, tokenizer_name="raw")
-        builder.add_text_field("persona_id", stored=True, tokenizer_name="raw")
+        builder.add_text_field("persona_id", stored=True, tokenizer_name="raw", **filtered)
         builder.add_text_field("role", stored=True, tokenizer_name="raw")
         builder.add_text_field("speaker_id", stored=True, tokenizer_name="raw")
-        builder.add_text_field("user_id", stored=True, tokenizer_name="raw")
-        builder.add_bytes_field("index_a", stored=True)
-        builder.add_bytes_field("index_b", stored=True)
+        builder.add_text_field("user_id", stored=True, tokenizer_name="raw", **filtered)
+        if version == 0:
+            builder.add_bytes_field("index_a", stored=True)
+            builder.add_bytes_field("index_b", stored=True)
+        return builder.build()
+
+    @property
+    def version_path(self) -> Path:
+        return self.index_path / "schema.version"
+
+    def _stored_version(self) -> Optional[int]:
+        """
+        The schema version of the index on disk, or None if there is no index yet.
+        """
+        if self.version_path.exists():
+            return int(self.version_path.read_text().strip())
+        if not (self.index_path / "meta.json").exists():
+            return None
+        # Indexes from before the version file: find the schema that opens them
+        for version in range(SCHEMA_VERSION, -1, -1):
+            try:
+                Index(self._build_schema(version), str(self.index_path))
+                return version
+            except ValueError:
+                continue
+        raise ValueError(f"The index in {self.index_path} has an unknown schema")
+
+    def _open_index(self) -> Index:
+        version = self._stored_version()
+        if version is not None and version != SCHEMA_VERSION:
+            with file_lock(self.index_path):
+                # Another process may have migrated it while we waited
+                version = self._stored_version()
+                if version != SCHEMA_VERSION:
+                    self._migrate(Index(self._build_schema(version), str(self.index_path)), version)
+        index = Index(self.schema, str(self.index_path))
+        if version is None:
+            self.version_path.write_text(f"{SCHEMA_VERSION}\n")
+        return index
+
+    def _migrate(self, previous_index: Index, version: int, batch_size: int = 1000) -> None:
+        """
+        Copy an index of an older schema version into the current schema, and swap it into place. Vectors
+        stored in the doc store are moved to the vector store; nothing is embedded again.
+
+        Copying the current version leaves only the live documents, in a single segment. Hold the index's
+        lock exclusively while migrating.
+        """
+        if version != SCHEMA_VERSION:
+            logger.info(f"Migrating {self.index_path} from schema version {version} to {SCHEMA_VERSION}")
+        temp_path = self.index_path.with_name(f".{self.index_path.name}.migrating")
+        shutil.rmtree(temp_path, ignore_errors=True)
+        temp_path.mkdir(parents=True)
+
+        index = Index(self.schema, str(temp_path))
+        searcher = previous_index.searcher()
+        hits = searcher.search(Query.all_query(), limit=searcher.num_docs).hits if searcher.num_docs > 0 else []
+        vectors = None
+        writer = index.writer()
+        for start in range(0, len(hits), batch_size):
+            batch = []
+            for _, doc_addr in hits[start:start + batch_size]:
+                stored = self._stored_document(searcher, doc_addr)
+                data = bytes(stored.pop("index_a", b""))
+                stored.pop("index_b", None)
+                writer.add_document(self.to_doc(stored))
+                if len(data) == 0:
+                    continue
+                if vectors is None:
+                    # Vectors from before pooling was configurable were CLS pooled
+                    format = vector_format(data)
+                    vectors = VectorStore(temp_path / "vectors", self.vector_dtype, format[1] if format is not None else POOLING_CLS)
+                batch.append((stored["doc_id"], decode_vector(data)))
+            if vectors is not None:
+                vectors.put_many(batch)
+        writer.commit()
 
-        # Build schema and create/open index
-        self.schema = builder.build()
-        self.index_path.mkdir(parents=True, exist_ok=True)
-        self.index = Index(self.schema, str(self.index_path))
-
-    def _vector_to_bytes(self, vector: np.ndarray) -> bytes:
-        """Convert numpy vector to bytes, preserving shape and dtype."""
-        return vector.astype(np.float32).tobytes()
-
-    def _bytes_to_vector(self, byte_list: list[int]) -> np.ndarray:
-        """Convert Tantivy's list[int] bytes representation back to numpy vector."""
-        # Convert list of ints to bytes
-        byte_data = bytes(byte_list)
-        # Convert bytes back to float32 array 
-        vector = np.frombuffer(byte_data, dtype=np.float32)
-        #logger.info(f"Converted vector shape: {vector.shape}")
-        return vector
-
-    def to_doc(self, doc: dict, index_a : np.ndarray) -> TantivyDocument:
+        if (self.index_path / "vectors").exists():
+            self.vectors.move(temp_path / "vectors")
+        self._swap_in(temp_path)
+        logger.info(f"Copied {len(hits)} documents into {self.index_path}")
+
+    def _swap_in(self, temp_path: Path) -> None:
+        """
+        Replace the index, and its vectors, with one built beside it. Hold the index's lock exclusively.
+        """
+        previous = self.index_path.with_name(f".{self.index_path.name}.previous")
+        (temp_path / "schema.version").write_text(f"{SCHEMA_VERSION}\n")
+        shutil.rmtree(previous, ignore_errors=True)
+        self.index_path.rename(previous)
+        temp_path.rename(self.index_path)
+        shutil.rmtree(previous, ignore_errors=True)
+        # The vectors moved with the swap; map them again from their new place
+        self._vectors = None
+
+    @property
+    def vectors(self) -> VectorStore:
+        """The embeddings of the indexed documents, by doc_id"""
+        if self._vectors is None:
+            self._vectors = VectorStore(self.index_path / "vectors", self.vector_dtype, self.vectorizer.pooling)
+        return self._vectors
+
+    def to_doc(self, doc: dict) -> TantivyDocument:
         """Convert a dictionary to a tantivy document"""
-        index_a_bytes = self._vector_to_bytes(index_a)
-        #logger.info(f"Index has shape {index_a.shape}")
         return TantivyDocument(
             doc_id=doc["doc_id"],
             content=doc["content"],
@@ -94,39 +242,49 @@ class SearchIndex:
             inference_model=doc.get("inference_model", ""),
             metadata=doc.get("metadata", ""),
             status=doc.get("status", 0),
-            index_a=index_a_bytes,
         )
 
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """
+        Hold the index for writing. Tantivy allows one writer per index, so writers take turns: within the
+        process on our lock, and across processes on the index's lock file.
+        """
+        with self._write_lock, file_lock(self.index_path):
+            yield
+
     def add_document(self, doc: dict) -> None:
         """Add a single document to the index"""
-        index_a = self.vectorizer(doc["content"])
-        tantivy_doc = self.to_doc(doc, index_a)
-        writer = self.index.writer()
-        writer.add_document(tantivy_doc)
-        writer.commit()
-        self.index.reload()
-
-    def add_documents(self, documents: list[dict]) -> None:
-        """Add multiple documents to the index efficiently"""
-        writer = self.index.writer()
+        self.add_documents([doc])
 
-        # vectorize all documents first
-        indices = self.vectorizer.transform([doc["content"] for doc in documents])
+    def add_documents(self, documents: list[dict], vectors: Optional[list[np.ndarray]] = None) -> None:
+        """Add multiple documents to the index efficiently, with their vectors if they are already embedded"""
+        # vectorize all documents first, before taking the writer from anyone else
+        indices = self.vectorizer.transform([doc["content"] for doc in documents]) if vectors is None else vectors
 
-        for i, doc in enumerate(documents):
-            index_a = indices[i]
-            tantivy_doc = self.to_doc(doc, index_a=index_a)
-            writer.add_document(tantivy_doc)
-
-        writer.commit()
-        self.index.reload()
+        with self._writing():
+            self.vectors.put_many((doc["doc_id"], index_a) for doc, index_a in zip(documents, indices))
+            writer = self.index.writer()
+            for doc in documents:
+                writer.add_document(self.to_doc(doc))
+            writer.commit()
+            self._committed()
 
     def search(self, query_texts: list[str] = [],
                query_document_type: Optional[str | list[str]] = None, filter_document_type: Optional[str | list[str]] = None,
-               query_persona_id: Optional[str] = None, query_conversation_id: Optional[str] = None,
+               query_persona_id: Optional[str] = None, query_conversation_id: Optional[str] = None, query_user_id: Optional[str] = None,
                filter_doc_ids: Optional[list[str]] = None, query_limit: int = 20,
-               descending: Optional[bool] = None) -> pd.DataFrame:
-        """Search the index and return scored results"""
+               descending: Optional[bool] = None,
+               query_time_range: Optional[tuple[Optional[int], Optional[int]]] = None,
+               query_vector: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Search the index and return scored results.
+
+        Only the query texts are scored, each by at most `query_max_terms` of its most salient terms; the
+        conversation, persona, document type, doc_id and time range filters are exact term and range queries
+        over fast fields, and don't change the scores. `query_time_range` is an inclusive (after, before) pair of timestamps, either of which may be None.
+        `query_vector`, the embedding of the query, is only used by a sharded index to merge its shards' hits.
+        """
 
         searcher = self.index.searcher()
 
@@ -137,37 +295,34 @@ class SearchIndex:
         if len(query_texts) > 0:
             text_subqueries = []
             for query_text in query_texts:
-                query_text = re.sub(r"\s+", ' ', re.sub(r'[^\w\s]|\n', ' ', query_text)).lower()
-                logger.info(f"Parsing query: {len(query_text)}")
-                text_query = self.index.parse_query(query=query_text, default_field_names=["content"])
-                text_subqueries.append((Occur.Should, text_query))
+                text_query = self.query_builder.build(self.index, searcher, query_text)
+                if text_query is not None:
+                    text_subqueries.append((Occur.Should, text_query))
             subqueries.append((Occur.Must, Query.boolean_query(text_subqueries)))
         else:
             subqueries.append((Occur.Must, Query.all_query()))
 
         # Add conditions based on provided arguments
         if query_conversation_id:
-            conversation_query = self.index.parse_query(query=query_conversation_id, default_field_names=["conversation_id"])
-            subqueries.append((Occur.Must, conversation_query))
+            subqueries.append((Occur.Must, self._filter("conversation_id", query_conversation_id)))
 
         if query_document_type:
-            doc_type_queries = [(Occur.Should, self.index.parse_query(query=dt, default_field_names=["document_type"]))
-                                for dt in (query_document_type if isinstance(query_document_type, list) else [query_document_type])]
-            subqueries.append((Occur.Must, Query.boolean_query(subqueries=doc_type_queries)))
+            subqueries.append((Occur.Must, self._filter("document_type", query_document_type)))
 
         if filter_document_type:
-            filter_type_queries = [(Occur.Should, self.index.parse_query(query=ft, default_field_names=["document_type"]))
-                                for ft in (filter_document_type if isinstance(filter_document_type, list) else [filter_document_type])]
-            subqueries.append((Occur.MustNot, Query.boolean_query(subqueries=filter_type_queries)))
+            subqueries.append((Occur.MustNot, self._filter("document_type", filter_document_type)))
 
         if query_persona_id:
-            persona_query = self.index.parse_query(query=query_persona_id, default_field_names=["persona_id"])
-            subqueries.append((Occur.Must, persona_query))
+            subqueries.append((Occur.Must, self._filter("persona_id", query_persona_id)))
+
+        if query_user_id:
+            subqueries.append((Occur.Must, self._filter("user_id", query_user_id)))
 
         if filter_doc_ids:
-            doc_id_queries = [(Occur.Should, self.index.parse_query(query=doc_id, default_field_names=["doc_id"]))
-                            for doc_id in filter_doc_ids]
-            subqueries.append((Occur.MustNot, Query.boolean_query(subqueries=doc_id_queries)))
+            subqueries.append((Occur.MustNot, self._filter("doc_id", list(filter_doc_ids))))
+
+        if query_time_range is not None and query_time_range != (None, None):
+            subqueries.append((Occur.Must, self._time_filter(*query_time_range)))
 
         # Combine all subqueries into a single query
         query = Query.boolean_query(subqueries=subqueries)
@@ -187,26 +342,31 @@ class SearchIndex:
 
         results = {}
         doc_hits = defaultdict(int)
+        doc_scores = {}
         doc_ref = {}
         for score, doc_addr in search_results.hits:
-            doc_ref[doc_addr.doc] = doc_addr
-            doc_hits[doc_addr.doc] += 1
+            # Doc numbers are per segment
+            doc_no = (doc_addr.segment_ord, doc_addr.doc)
+            doc_ref[doc_no] = doc_addr
+            doc_hits[doc_no] += 1
+            doc_scores[doc_no] = max(score, doc_scores.get(doc_no, score))
         
-        for doc_no, doc_addr in doc_ref.items():
-            doc = searcher.doc(doc_addr)
-            byte_list : list[int] = doc.get_first("index_a")
-            index_a = self._bytes_to_vector(byte_list)
+        docs = {doc_no: searcher.doc(doc_addr) for doc_no, doc_addr in doc_ref.items()}
+        vectors = self.vectors.get_many([doc.get_first("doc_id") for doc in docs.values()])
+        missing = np.zeros(0, dtype=np.float32)
+
+        for (doc_no, doc), index_a in zip(docs.items(), vectors):
             result = {
                 k: doc.get_first(k) for k in QUERY_COLUMNS
             }
-            result["index_a"] = index_a
+            result["index_a"] = index_a if index_a is not None else missing
             result["hits"] = doc_hits[doc_no]
             if "doc_id" in result:
                 doc_id = result["doc_id"]
                 if doc_id in results:
                     result["hits"] += results[doc_id][1]["hits"]
 
-                results[doc_id] = (score, result)
+                results[doc_id] = (doc_scores[doc_no], result)
 
         if len(results.keys()) == 0:
             return pd.DataFrame(columns=QUERY_COLUMNS + ['distance', 'hits'])
@@ -214,29 +374,251 @@ class SearchIndex:
         results = pd.DataFrame([{**d, 'distance': ts} for ts, d in results.values()])
         return results
 
-    def rebuild(self, documents: list[dict]) -> None:
-        """Clear and rebuild the entire index"""
-        # Clear existing index
-        if self.index_path.exists():
-            import shutil
+    def _filter(self, field_name: str, values: str | list[str]) -> Query:
+        """
+        A non-scoring filter matching any of the exact values of a raw field.
+        """
+        values = values if isinstance(values, list) else [values]
+        if len(values) == 1:
+            query = Query.term_query(schema=self.schema, field_name=field_name, field_value=values[0])
+        else:
+            query = Query.term_set_query(schema=self.schema, field_name=field_name, field_values=values)
+        return Query.const_score_query(query, score=0.0)
+
+    def _time_filter(self, after: Optional[int] = None, before: Optional[int] = None) -> Query:
+        """
+        A non-scoring filter on the timestamp, a range scan over its fast field.
+        """
+        lower = int(after) if after is not None else "*"
+        upper = int(before) if before is not None else "*"
+        query = self.index.parse_query(f"timestamp:[{lower} TO {upper}]", default_field_names=["timestamp"])
+        return Query.const_score_query(query, score=0.0)
+
+    def _stored_document(self, searcher, doc_addr) -> dict:
+        """The stored fields of a document, as a flat dictionary"""
+        return {k: v[0] for k, v in searcher.doc(doc_addr).to_dict().items() if len(v) > 0}
+
+    def _doc_id_query(self, doc_id: str) -> Query:
+        return Query.term_query(schema=self.schema, field_name="doc_id", field_value=doc_id)
+
+    def update_documents(self, updates: list[tuple[str, dict]] = [], deletes: list[str] = []) -> None:
+        """
+        Apply updates and deletions to the index in a single commit.
+
+        Every mutated document is deleted by its doc_id term, and updated documents are re-added with their
+        new fields in the same batch. The vector is kept unless the content changed.
+        """
+        if len(updates) == 0 and len(deletes) == 0:
+            return
+
+        with self._writing():
+            searcher = self.index.searcher()
+            readd : list[dict] = []
+            stale : list[dict] = []
+            for doc_id, update in updates:
+                results = searcher.search(self._doc_id_query(doc_id), limit=1)
+                if not results.hits:
+                    logger.warning(f"No indexed document {doc_id} to update")
+                    continue
+                stored = self._stored_document(searcher, results.hits[0][1])
+                doc = {**stored, **update}
+                readd.append(doc)
+                if ("content" in update and update["content"] != stored.get("content")) or doc["doc_id"] not in self.vectors:
+                    stale.append(doc)
+
+            if len(stale) > 0:
+                vectors = self.vectorizer.transform([doc["content"] for doc in stale])
+                self.vectors.put_many((doc["doc_id"], index_a) for doc, index_a in zip(stale, vectors))
+
+            writer = self.index.writer()
+            for doc_id in [*deletes, *(doc_id for doc_id, _ in updates)]:
+                writer.delete_documents("doc_id", doc_id)
+            for doc in readd:
+                writer.add_document(self.to_doc(doc))
+            writer.commit()
+            self.vectors.delete_many(deletes)
+            self._committed()
+
+    def find_doc_ids(self, conversation_id: str, persona_id: Optional[str] = None, user_id: Optional[str] = None) -> list[str]:
+        """
+        The doc_ids of every indexed document in a conversation, optionally only those of a persona and user.
+        """
+        subqueries = [(Occur.Must, Query.term_query(schema=self.schema, field_name="conversation_id", field_value=conversation_id))]
+        if persona_id is not None:
+            subqueries.append((Occur.Must, Query.term_query(schema=self.schema, field_name="persona_id", field_value=persona_id)))
+        if user_id is not None:
+            subqueries.append((Occur.Must, Query.term_query(schema=self.schema, field_name="user_id", field_value=user_id)))
 
-            shutil.rmtree(self.index_path)
+        searcher = self.index.searcher()
+        if searcher.num_docs == 0:
+            return []
+        results = searcher.search(Query.boolean_query(subqueries), limit=searcher.num_docs)
+        return [searcher.doc(doc_addr).get_first("doc_id") for _, doc_addr in results.hits]
 
-        # Reinitialize
-        self.__init__(self.index_path)
+    def documents(self, batch_size: int = 1000) -> Iterator[list[tuple[dict, Optional[np.ndarray]]]]:
+        """Every indexed document's stored fields and its vector, if it has one, in batches"""
+        searcher = self.index.searcher()
+        if searcher.num_docs == 0:
+            return
+        hits = searcher.search(Query.all_query(), limit=searcher.num_docs).hits
+        for start in range(0, len(hits), batch_size):
+            docs = [self._stored_document(searcher, doc_addr) for _, doc_addr in hits[start:start + batch_size]]
+            yield list(zip(docs, self.vectors.get_many([doc["doc_id"] for doc in docs])))
+
+    def _embed_all(self, batch_size: int) -> Iterator[tuple[str, np.ndarray]]:
+        """Embed every indexed document again, from its content"""
+        searcher = self.index.searcher()
+        if searcher.num_docs == 0:
+            return
+        hits = searcher.search(Query.all_query(), limit=searcher.num_docs).hits
+        for start in range(0, len(hits), batch_size):
+            docs = [searcher.doc(doc_addr) for _, doc_addr in hits[start:start + batch_size]]
+            vectors = self.vectorizer.transform([doc.get_first("content") for doc in docs])
+            yield from zip((doc.get_first("doc_id") for doc in docs), vectors)
+            logger.info(f"Embedded {min(start + batch_size, len(hits))}/{len(hits)} documents")
+
+    def migrate_vectors(self, batch_size: int = 1000) -> int:
+        """
+        Bring the vector store to the index's dtype and pooling.
+
+        With the same pooling, the stored vectors are re-encoded as they are; with another pooling, every
+        document is embedded again from its content.
+
+        Returns:
+            The number of vectors migrated.
+        """
+        target = (self.vector_dtype, self.vectorizer.pooling)
+        if self.vectors.format == target:
+            return 0
+        self._generation += 1
+        if self.vectors.pooling == target[1]:
+            return self.vectors.rewrite(self.vectors.items(), *target)
+        return self.vectors.rewrite(self._embed_all(batch_size), *target)
+
+    def reload(self) -> None:
+        """Pick up commits made by other writers"""
+        self.index.reload()
 
-        # Add all documents
-        self.add_documents(documents)
+    def _committed(self) -> None:
+        """Search our own changes from now on"""
+        self.index.reload()
+        self._generation += 1
+
+    def generation(self) -> tuple[int, ...]:
+        """
+        A token that changes whenever the index does, by our commits or by another process's; a commit seen
+        here first is reloaded, so searches made under the new token see it.
+        """
+        try:
+            stat = (self.index_path / "meta.json").stat()
+        except FileNotFoundError:
+            return (self._generation,)
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity != self._meta_identity:
+            if self._meta_identity is not None:
+                self.index.reload()
+            self._meta_identity = identity
+        return (self._generation, *identity)
+
+    def stats(self) -> IndexStats:
+        """
+        Segment and document counts from the index meta, and the size of the index and its vectors.
+        """
+        meta_path = self.index_path / "meta.json"
+        if not meta_path.exists():
+            return IndexStats()
+        meta = json.loads(meta_path.read_text())
+        segments = meta.get("segments", [])
+        index_bytes = sum(p.stat().st_size for p in self.index_path.iterdir() if p.is_file())
+        return IndexStats(
+            segments=len(segments),
+            docs=sum(segment["max_doc"] for segment in segments),
+            deleted_docs=sum((segment.get("deletes") or {}).get("num_deleted_docs", 0) for segment in segments),
+            index_bytes=index_bytes,
+            vector_bytes=self.vectors.size_bytes,
+            dead_vectors=self.vectors.dead_rows,
+            last_commit=meta_path.stat().st_mtime,
+        )
+
+    def merge(self) -> None:
+        """
+        Merge segments by tantivy's log merge policy, and remove the files of the merged segments.
+
+        Writers are dropped right after their commit, which cancels the merges it scheduled; here we wait
+        for them. The policy only merges segments of similar size, and leaves the deleted documents of a
+        lone segment in place.
+        """
+        with self._writing():
+            writer = self.index.writer()
+            writer.commit()
+            writer.wait_merging_threads()
+            writer = self.index.writer()
+            writer.garbage_collect_files()
+            del writer
+            self._committed()
+
+    def vacuum(self) -> None:
+        """
+        Copy the live documents into a fresh single segment index, and swap it into place.
+
+        We hold the index for writing from the copy until the swap, so no writer in any process commits
+        anything that is left behind in the old index.
+        """
+        with self._writing():
+            self.index.reload()
+            self._migrate(self.index, SCHEMA_VERSION)
+            self.index = Index(self.schema, str(self.index_path))
+            self._generation += 1
+
+    def compact(self, vacuum: bool = False) -> None:
+        """
+        Reclaim the space of deleted documents: the vector store rows of deleted doc_ids, and the segments,
+        merged by the merge policy or, with `vacuum`, copied into a single segment without deleted documents.
+        """
+        if self.vectors.dead_rows > 0:
+            self.vectors.rewrite(self.vectors.items())
+        if vacuum:
+            self.vacuum()
+        else:
+            self.merge()
+
+    def rebuild(self, documents: list[dict], batch_size: int = 1000) -> None:
+        """
+        Replace the entire index with the given documents.
+
+        The new index is built beside the live one, which is searched until it is swapped in. We hold the
+        index for writing throughout, so no writer in any process commits anything the swap throws away.
+        """
+        temp_path = self.index_path.with_name(f".{self.index_path.name}.rebuilding")
+        with self._writing():
+            shutil.rmtree(temp_path, ignore_errors=True)
+            temp_path.mkdir(parents=True)
+            index = Index(self.schema, str(temp_path))
+            vectors = VectorStore(temp_path / "vectors", self.vector_dtype, self.vectorizer.pooling)
+            writer = index.writer()
+            for start in range(0, len(documents), batch_size):
+                batch = documents[start:start + batch_size]
+                indices = self.vectorizer.transform([doc["content"] for doc in batch])
+                vectors.put_many((doc["doc_id"], index_a) for doc, index_a in zip(batch, indices))
+                for doc in batch:
+                    writer.add_document(self.to_doc(doc))
+            writer.commit()
+            del writer
+
+            self._swap_in(temp_path)
+            self.index = Index(self.schema, str(self.index_path))
+            self._generation += 1
         logger.info(f"Rebuilt index with {len(documents)} documents")
 
-    def get_document(self, doc_id: str) -> Optional[dict]:
+    def get_document(self, doc_id: str, quiet: bool = False) -> Optional[dict]:
         """Retrieve a specific document by ID"""
         searcher = self.index.searcher()
         query = Query.term_query(schema=self.schema, field_name="doc_id", field_value=doc_id)
         results = searcher.search(query, limit=1)
         
         if not results.hits:
-            logger.warning(f"No results found for {doc_id} {query} {results}")
+            if not quiet:
+                logger.warning(f"No results found for {doc_id} {query} {results}")
             return None
             
         _, doc_addr = results.hits[0]
@@ -0,0 +1,101 @@
+# aim/conversation/ingest.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+import logging
+import threading
+import time
+from typing import Any, Optional
+
+from ..config import ChatConfig
+from ..utils.ids import new_id
+from .message import ConversationMessage
+from .model import ConversationModel
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+@dataclass
+class IngestJob:
+    """The progress of a bulk insert running in the background"""
+    job_id: str
+    total: int
+    status: str = JOB_QUEUED
+    inserted: int = 0
+    error: Optional[str] = None
+    created: float = 0.0
+    finished: Optional[float] = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class BulkIngest:
+    """
+    Inserts many messages at once, `batch_size` at a time through `ConversationModel.insert_many`: one append
+    per conversation, one batched embedding and one index commit per batch.
+
+    Payloads of more than `async_threshold` messages are inserted in the background, one job at a time so
+    they don't contend for the index writer; the last `max_jobs` jobs are kept for their status.
+    """
+
+    def __init__(self, cvm: ConversationModel, batch_size: int = 256, async_threshold: int = 1000, max_jobs: int = 100):
+        self.cvm = cvm
+        self.batch_size = batch_size
+        self.async_threshold = async_threshold
+        self.max_jobs = max_jobs
+        self.jobs : OrderedDict[str, IngestJob] = OrderedDict()
+        self.lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk-ingest")
+
+    @classmethod
+    def from_config(cls, config: ChatConfig, cvm: ConversationModel) -> "BulkIngest":
+        return cls(cvm, batch_size=config.ingest_batch_size, async_threshold=config.ingest_async_threshold)
+
+    def is_async(self, count: int) -> bool:
+        return self.async_threshold > 0 and count > self.async_threshold
+
+    def ingest(self, messages: list[ConversationMessage], job: Optional[IngestJob] = None) -> int:
+        """Insert the messages now, returning how many were inserted"""
+        inserted = 0
+        for start in range(0, len(messages), self.batch_size):
+            inserted += self.cvm.insert_many(messages[start:start + self.batch_size])
+            if job is not None:
+                job.inserted = inserted
+        return inserted
+
+    def submit(self, messages: list[ConversationMessage]) -> IngestJob:
+        """Insert the messages in the background, returning the job to follow them by"""
+        job = IngestJob(job_id=new_id(), total=len(messages), created=time.time())
+        with self.lock:
+            self.jobs[job.job_id] = job
+            # Forget the oldest finished jobs
+            for job_id in [k for k, j in self.jobs.items() if j.finished is not None][:max(len(self.jobs) - self.max_jobs, 0)]:
+                del self.jobs[job_id]
+        self._executor.submit(self._run, job, messages)
+        logger.info(f"Queued bulk insert {job.job_id} of {job.total} messages")
+        return job
+
+    def _run(self, job: IngestJob, messages: list[ConversationMessage]) -> None:
+        job.status = JOB_RUNNING
+        try:
+            self.ingest(messages, job)
+            job.status = JOB_DONE
+            logger.info(f"Bulk insert {job.job_id} done, {job.inserted} messages")
+        except Exception as e:
+            logger.exception(f"Bulk insert {job.job_id} failed after {job.inserted} of {job.total} messages")
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished = time.time()
+
+    def job(self, job_id: str) -> Optional[IngestJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
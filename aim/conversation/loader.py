@@ -4,11 +4,61 @@
 import json
 import logging
 from pathlib import Path
+from typing import Any, Optional
 
 from .message import ConversationMessage
+from .writer import atomic_write, file_lock
 
 logger = logging.getLogger(__name__)
 
+MUTATION_UPDATE = "update"
+MUTATION_DELETE = "delete"
+MUTATION_DELETE_WHERE = "delete_where"
+
+
+def mutations_path(conversation_path: Path) -> Path:
+    """
+    The path of the mutation log that goes with a conversation file.
+    """
+    return conversation_path.with_suffix(".mutations.log")
+
+
+def apply_mutations(entries: list[dict[str, Any]], mutations: list[dict[str, Any]], offsets: Optional[list[int]] = None) -> list[dict[str, Any]]:
+    """
+    Apply a mutation log, in order, to the raw entries of a conversation.
+
+    Updates are merged into the entry with the matching doc_id; tombstones drop the entry with the matching
+    doc_id, or every entry matching all of the given fields that was already in the file when the tombstone
+    was written (its byte `offset` in the conversation file is before the tombstone's).
+    """
+    if len(mutations) == 0:
+        return entries
+
+    by_id = {entry['doc_id']: i for i, entry in enumerate(entries)}
+    live : list[Optional[dict[str, Any]]] = list(entries)
+    for mutation in mutations:
+        op = mutation['op']
+        if op == MUTATION_UPDATE:
+            i = by_id.get(mutation['doc_id'])
+            if i is not None and live[i] is not None:
+                live[i] = {**live[i], **mutation['data']}
+        elif op == MUTATION_DELETE:
+            i = by_id.get(mutation['doc_id'])
+            if i is not None:
+                live[i] = None
+        elif op == MUTATION_DELETE_WHERE:
+            where = mutation['where']
+            before = mutation.get('offset')
+            for i, entry in enumerate(live):
+                if before is not None and offsets is not None and offsets[i] >= before:
+                    break
+                # Tombstones written before unset filters were dropped carry them as None
+                if entry is not None and all(entry.get(k) == v for k, v in where.items() if v is not None):
+                    live[i] = None
+        else:
+            logger.warning(f"Unknown mutation {op}, skipping")
+    return [entry for entry in live if entry is not None]
+
 
 class ConversationLoader:
     """Handles loading and saving conversations from JSONL files"""
@@ -38,22 +88,110 @@ class ConversationLoader:
         if not conversation_path.exists():
             raise FileNotFoundError(f"Conversation {conversation_path.name} not found")
 
-        messages = []
-        with open(conversation_path, 'r') as f:
+        entries, offsets = [], []
+        offset = 0
+        with open(conversation_path, 'rb') as f:
             for line_num, line in enumerate(f, 1):
                 try:
-                    entry = json.loads(line)
-                    message = ConversationMessage.from_dict(entry)
-                    messages.append(message)
+                    entries.append(json.loads(line))
+                    offsets.append(offset)
                 except json.JSONDecodeError as e:
+                    if not line.endswith(b'\n'):
+                        # A torn trailing line, from a crash mid-append; the message was never written
+                        logger.warning(f"Skipping torn line in {conversation_path}:{line_num}: {e}")
+                        break
                     logger.error(f"JSON decode error in {conversation_path}:{line_num}: {e}")
                     raise
-                except KeyError as e:
-                    logger.error(f"Missing required field in {conversation_path}:{line_num}: {e}")
-                    raise
-                
+                offset += len(line)
+
+        entries = apply_mutations(entries, self.load_mutations(conversation_path), offsets)
+
+        messages = []
+        for entry in entries:
+            try:
+                messages.append(ConversationMessage.from_dict(entry))
+            except KeyError as e:
+                logger.error(f"Missing required field in {conversation_path}:{entry.get('doc_id')}: {e}")
+                raise
+
         return messages
 
+    def load_mutations(self, conversation_path: Path) -> list[dict[str, Any]]:
+        """Load the mutation log of a conversation file, if it has one"""
+        log_path = mutations_path(conversation_path)
+        if not log_path.exists():
+            return []
+
+        mutations = []
+        with open(log_path, 'r') as f:
+            for line_num, line in enumerate(f, 1):
+                try:
+                    mutations.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    # A torn final record from a crash mid-append; the mutation never completed
+                    logger.warning(f"Skipping unreadable mutation in {log_path}:{line_num}: {e}")
+        return mutations
+
+    def append_mutation(self, conversation_id: str, mutation: dict[str, Any]) -> int:
+        """
+        Append a mutation to a conversation's log.
+
+        Returns:
+            The size of the mutation log in bytes.
+        """
+        conversation_path = self.conversations_dir / f"{conversation_id}.jsonl"
+        log_path = mutations_path(conversation_path)
+        record = (json.dumps(mutation) + '\n').encode('utf-8')
+        # Shares the conversation's lock with its appends, so a compaction can't drop the mutation with the log
+        with file_lock(conversation_path, exclusive=False), open(log_path, 'a+b') as f:
+            size = f.seek(0, 2)
+            if size > 0:
+                # Don't run on from a torn record, if a previous append was cut short
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    record = b'\n' + record
+            f.write(record)
+            return f.tell()
+
+    def recover(self, file_path: Path) -> int:
+        """
+        Repair the end of a JSONL file after a crash: a torn trailing line is truncated, and a complete
+        trailing line missing its newline gets one, so the next append starts on a line of its own.
+
+        Returns:
+            The number of bytes truncated.
+        """
+        with open(file_path, 'r+b') as f:
+            size = f.seek(0, 2)
+            if size == 0:
+                return 0
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return 0
+
+            # Scan back to the start of the trailing line
+            start, block = size, 64 * 1024
+            while start > 0:
+                read_from = max(0, start - block)
+                f.seek(read_from)
+                newline = f.read(start - read_from).rfind(b'\n')
+                if newline >= 0:
+                    start = read_from + newline + 1
+                    break
+                start = read_from
+
+            f.seek(start)
+            tail = f.read()
+            try:
+                json.loads(tail)
+                f.write(b'\n')
+                logger.info(f"Terminated the trailing line of {file_path}")
+                return 0
+            except json.JSONDecodeError:
+                f.truncate(start)
+                logger.warning(f"Truncated a torn trailing line of {len(tail)} bytes from {file_path}")
+                return len(tail)
+
     def load_conversation(self, conversation_id: str) -> list[ConversationMessage]:
         """
         Loads a conversation from the collection.
@@ -74,10 +212,10 @@ class ConversationLoader:
     def save_conversation(self, conversation_id: str, messages: list[ConversationMessage]) -> None:
         """Save messages to a conversation file"""
         file_path = self.conversations_dir / f"{conversation_id}.jsonl"
-        with open(file_path, 'w') as f:
-            for message in messages:
-                json.dump(message.to_dict(), f)
-                f.write('\n')
+        with file_lock(file_path):
+            atomic_write(file_path, (message.to_json() + '\n' for message in messages))
+            # The messages we were given are the whole conversation, so any pending mutations are superseded
+            mutations_path(file_path).unlink(missing_ok=True)
 
 def load_test_conversation() -> list[ConversationMessage]:
     """Create a test conversation for integration testing"""
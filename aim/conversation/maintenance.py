@@ -0,0 +1,129 @@
+# aim/conversation/maintenance.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+import asyncio
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import time
+from typing import Optional
+
+from ..config import ChatConfig
+from .index import IndexStats, SearchIndex
+from .shards import ShardedIndex, open_index
+
+logger = logging.getLogger(__name__)
+
+COMPACT_MERGE = "merge"
+COMPACT_VACUUM = "vacuum"
+
+
+@dataclass
+class CompactionPolicy:
+    """
+    When an index is due for compaction, from its stats.
+
+    Too many segments, or dead vector rows, call for a merge; too many deleted documents call for a vacuum.
+    Either only runs once nothing has been committed to the index for `idle_seconds`.
+    """
+    max_segments: int = 16
+    max_deleted_ratio: float = 0.2
+    idle_seconds: float = 300
+
+    @classmethod
+    def from_config(cls, config: ChatConfig) -> "CompactionPolicy":
+        return cls(max_segments=config.index_max_segments, max_deleted_ratio=config.index_max_deleted_ratio,
+                   idle_seconds=config.index_idle_seconds)
+
+    def due(self, stats: IndexStats) -> Optional[str]:
+        """The compaction the index needs, or None"""
+        if stats.deleted_ratio > self.max_deleted_ratio:
+            return COMPACT_VACUUM
+        if stats.segments > self.max_segments or stats.dead_vectors > self.max_deleted_ratio * stats.docs:
+            return COMPACT_MERGE
+        return None
+
+    def idle(self, stats: IndexStats, now: Optional[float] = None) -> bool:
+        """Whether the index has gone without a commit for long enough"""
+        return (now or time.time()) - stats.last_commit >= self.idle_seconds
+
+
+class IndexMaintenance:
+    """
+    Keeps the conversation index, or each of its shards, compacted.
+
+    `run_once` compacts every index that is idle and due under the policy; `run` does so every `interval`
+    seconds until stopped.
+    """
+
+    def __init__(self, index: SearchIndex | ShardedIndex, policy: Optional[CompactionPolicy] = None, interval: float = 3600):
+        self.index = index
+        self.policy = policy or CompactionPolicy()
+        self.interval = interval
+
+    @classmethod
+    def from_config(cls, config: ChatConfig, index: Optional[SearchIndex | ShardedIndex] = None) -> "IndexMaintenance":
+        if index is None:
+            index = open_index(Path('.', config.memory_path, 'indices'), shard_by=config.index_shard_by,
+                               embedding_model=config.embedding_model, embedding_backend=config.embedding_backend,
+                               embedding_threads=config.embedding_threads, embedding_pooling=config.embedding_pooling,
+                               vector_dtype=config.vector_dtype)
+        return cls(index, CompactionPolicy.from_config(config), config.index_maintenance_interval)
+
+    def indexes(self, key: Optional[str] = None) -> dict[str, SearchIndex]:
+        """The index, or its shards, by shard key; the key of an unsharded index is empty"""
+        if not isinstance(self.index, ShardedIndex):
+            return {"": self.index}
+        return {k: self.index.shard(k) for k in ([key] if key is not None else self.index.keys())}
+
+    def stats(self, key: Optional[str] = None) -> dict[str, IndexStats]:
+        return {k: index.stats() for k, index in self.indexes(key).items()}
+
+    def compact(self, index: SearchIndex, action: str) -> None:
+        before = index.stats()
+        start = time.perf_counter()
+        index.compact(vacuum=action == COMPACT_VACUUM)
+        if action == COMPACT_MERGE and index.stats().segments > self.policy.max_segments:
+            # The merge policy left too many segments behind; copy them into one
+            action = COMPACT_VACUUM
+            index.vacuum()
+        after = index.stats()
+        logger.info(f"Compacted {index.index_path} by {action} in {time.perf_counter() - start:.2f}s: "
+                    f"{before.segments} -> {after.segments} segments, {before.deleted_docs} -> {after.deleted_docs} deleted, "
+                    f"{before.size_bytes} -> {after.size_bytes} bytes")
+
+    def run_once(self, key: Optional[str] = None, force: bool = False, vacuum: bool = False) -> dict[str, str]:
+        """
+        Compact the indexes that are idle and due, or with `force` all of them now; `vacuum` forces a vacuum.
+
+        Returns:
+            The compaction done on each index, by shard key.
+        """
+        done = {}
+        for k, index in self.indexes(key).items():
+            stats = index.stats()
+            action = COMPACT_VACUUM if vacuum else self.policy.due(stats)
+            if force and action is None:
+                action = COMPACT_MERGE
+            if action is None or not (force or self.policy.idle(stats)):
+                continue
+            try:
+                self.compact(index, action)
+                done[k] = action
+            except ValueError as e:
+                # Most likely a writer holds the index lock; the next round tries again
+                logger.warning(f"Could not compact {index.index_path}: {e}")
+        return done
+
+    async def run(self, stop: asyncio.Event) -> None:
+        """Compact due indexes every `interval` seconds, off the event loop, until `stop` is set"""
+        logger.info(f"Index maintenance every {self.interval}s with {self.policy}")
+        while not stop.is_set():
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.exception(f"Index maintenance failed: {e}")
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
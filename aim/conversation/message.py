@@ -2,13 +2,14 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 from dataclasses import dataclass
+import json
 import logging
 import re
 import time
 from typing import Optional
-from wonderwords import RandomWord
 
 from ..constants import LISTENER_ALL, ROLE_USER, ROLE_ASSISTANT
+from ..utils.ids import new_id
 
 logger = logging.getLogger(__name__)
 
@@ -17,8 +18,12 @@ VISIBLE_COLUMNS = ['doc_id', 'document_type', 'user_id', 'persona_id', 'conversa
                    'emotion_a', 'emotion_b', 'emotion_c', 'emotion_d']
 QUERY_COLUMNS = VISIBLE_COLUMNS + ["weight", "sentiment_v", "sentiment_a", "sentiment_d", "importance", "timestamp"]
 
+# Shared by every message; we only ever encode plain dicts, so there are no cycles to check for
+_json_encoder = json.JSONEncoder(check_circular=False)
+_json_decode = json.JSONDecoder().decode
 
-@dataclass
+
+@dataclass(slots=True)
 class ConversationMessage:
     """Represents a single message in a conversation"""
 
@@ -100,16 +105,11 @@ class ConversationMessage:
         return f"{header}\n\n{self.content}"
 
     @classmethod
-    def next_doc_id(self) -> str:
+    def next_doc_id(cls) -> str:
         """
-        Returns a valid unique doc ID. TODO ensure uniqueness
+        Returns a unique doc ID, ordered by creation time.
         """
-
-        # A converation id is three random words separated by dashes
-        random_words = RandomWord()
-        doc_id = "-".join(random_words.word() for _ in range(3))
-
-        return doc_id
+        return new_id()
 
     @classmethod
     def create(cls, conversation_id: str, sequence_no: int, role: str, content: str, speaker_id: str,
@@ -168,37 +168,49 @@ class ConversationMessage:
 
     @classmethod
     def from_dict(cls, data: dict) -> "ConversationMessage":
+        get = data.get
+        # Positional, in field order, to skip keyword matching on a hot path
         return cls(
-            doc_id=data["doc_id"],
-            document_type=data["document_type"],
-            user_id=data["user_id"],
-            persona_id=data["persona_id"],
-            conversation_id=data["conversation_id"],
-            branch=data["branch"],
-            sequence_no=data["sequence_no"],
-            speaker_id=data.get("speaker_id"),
-            listener_id=data.get("listener_id"),
-            reference_id=data.get("reference_id"),
-            role=data["role"],
-            content=data["content"],
-            emotion_a=data.get("emotion_a"),
-            emotion_b=data.get("emotion_b"),
-            emotion_c=data.get("emotion_c"),
-            emotion_d=data.get("emotion_d"),
-            sentiment_v=data.get("sentiment_v", 0.0),
-            sentiment_a=data.get("sentiment_a", 0.0),
-            sentiment_d=data.get("sentiment_d", 0.0),
-            importance=data.get("importance", 0.0),
-            observer=data.get("observer"),
-            weight=data.get("weight", 1.0),
-            timestamp=data["timestamp"],
-            inference_model=data.get("inference_model"),
-            metadata=data.get("metadata"),
-            status=data.get("status", 0),
+            data["doc_id"],
+            data["document_type"],
+            data["user_id"],
+            data["persona_id"],
+            data["conversation_id"],
+            data["branch"],
+            data["sequence_no"],
+            get("speaker_id"),
+            get("listener_id"),
+            data["role"],
+            data["content"],
+            data["timestamp"],
+            get("emotion_a"),
+            get("emotion_b"),
+            get("emotion_c"),
+            get("emotion_d"),
+            get("sentiment_v", 0.0),
+            get("sentiment_a", 0.0),
+            get("sentiment_d", 0.0),
+            get("importance", 0.0),
+            get("observer"),
+            get("weight", 1.0),
+            get("reference_id"),
+            get("inference_model"),
+            get("metadata"),
+            get("status", 0),
         )
 
+    @classmethod
+    def from_json(cls, line: str | bytes) -> "ConversationMessage":
+        """
+        Decodes a message from a line of a conversation file.
+        """
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        return cls.from_dict(_json_decode(line))
+
     def to_dict(self) -> dict:
-        result = {
+        # Optional fields that are None are written with their defaults
+        return {
             "doc_id": self.doc_id,
             "document_type": self.document_type,
             "user_id": self.user_id,
@@ -211,46 +223,22 @@ class ConversationMessage:
             "weight": self.weight,
             "timestamp": self.timestamp,
             "status": self.status,
+            "emotion_a": self.emotion_a,
+            "emotion_b": self.emotion_b,
+            "emotion_c": self.emotion_c,
+            "emotion_d": self.emotion_d,
+            "sentiment_v": 0.0 if self.sentiment_v is None else self.sentiment_v,
+            "sentiment_a": 0.0 if self.sentiment_a is None else self.sentiment_a,
+            "sentiment_d": 0.0 if self.sentiment_d is None else self.sentiment_d,
+            "importance": 0.0 if self.importance is None else self.importance,
+            "reference_id": self.reference_id,
+            "observer": "none" if self.observer is None else self.observer,
+            "inference_model": "default" if self.inference_model is None else self.inference_model,
+            "metadata": "" if self.metadata is None else self.metadata,
         }
 
-        # Add optional fields if they're not None
-        optional_fields = [
-            "emotion_a",
-            "emotion_b",
-            "emotion_c",
-            "emotion_d",
-            "sentiment_v",
-            "sentiment_a",
-            "sentiment_d",
-            "importance",
-            "reference_id",
-            "observer",
-            "inference_model",
-            "metadata",
-        ]
-        
-        default_fields = {
-            "emotion_a": None,
-            "emotion_b": None,
-            "emotion_c": None,
-            "emotion_d": None,
-            "sentiment_v": 0.0,
-            "sentiment_a": 0.0,
-            "sentiment_d": 0.0,
-            "importance": 0.0,
-            "reference_id": None,
-            "observer": "none",
-            "inference_model": "default",
-            "metadata": "",
-            "status": 0,
-            "speaker_id": result['user_id'] if result['role'] == ROLE_USER else result['persona_id'],
-            "listener_id": result['user_id'] if result['role'] == ROLE_ASSISTANT else result['persona_id'],
-        }
-        for field in optional_fields:
-            value = getattr(self, field)
-            if value is not None:
-                result[field] = value
-            elif field in default_fields:
-                result[field] = default_fields[field]
-
-        return result
+    def to_json(self) -> str:
+        """
+        Encodes the message as a line of a conversation file, without the newline.
+        """
+        return _json_encoder.encode(self.to_dict())
@@ -2,23 +2,26 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
-import faiss
 import logging
 import numpy as np
 import os
 import pandas as pd
 from pathlib import Path
+import threading
 import time
 from typing import Optional, Set, List, Dict, Any
-from wonderwords import RandomWord
 
 from ..config import ChatConfig
+from ..utils.ids import new_alias_id
 from ..constants import DOC_ANALYSIS, DOC_CONVERSATION, DOC_JOURNAL, DOC_NER, DOC_STEP, LISTENER_ALL, DOC_MOTD
-from .index import SearchIndex
+from .shards import open_index
 from .message import ConversationMessage, VISIBLE_COLUMNS, QUERY_COLUMNS
-from .loader import ConversationLoader
+from .writer import ConversationWriter, file_lock
+from .loader import ConversationLoader, MUTATION_UPDATE, MUTATION_DELETE, MUTATION_DELETE_WHERE, mutations_path
+from .vectors import DTYPE_FLOAT32, POOLING_CLS, similarity
+from .query_cache import QueryCache, query_key
 
 logger = logging.getLogger(__name__)
 
@@ -26,12 +29,26 @@ logger = logging.getLogger(__name__)
 class ConversationModel:
     collection_name : str = 'memory'
 
-    def __init__(self, memory_path: str, embedding_model: str, **kwargs):
+    def __init__(self, memory_path: str, embedding_model: str, compaction_threshold: int = 64 * 1024,
+                 embedding_backend: str = "torch", embedding_threads: int = 0, embedding_pooling: str = POOLING_CLS,
+                 vector_dtype: str = DTYPE_FLOAT32, index_shard_by: Optional[str] = None, query_cache_size: int = 64 * 1024 * 1024,
+                 query_max_terms: int = 32, **kwargs):
         super().__init__(**kwargs)
 
-        self.index = SearchIndex(Path('.', memory_path, 'indices'), embedding_model=embedding_model)
+        # One index, or one per persona or user that queries for a single one are routed to
+        self.index = open_index(Path('.', memory_path, 'indices'), shard_by=index_shard_by, embedding_model=embedding_model,
+                                embedding_backend=embedding_backend, embedding_threads=embedding_threads,
+                                embedding_pooling=embedding_pooling, vector_dtype=vector_dtype, query_max_terms=query_max_terms)
         self.memory_path = memory_path
+        # Results of identical queries, until the index changes
+        self.query_cache = QueryCache(max_bytes=query_cache_size)
         self.loader = ConversationLoader(conversations_dir=os.path.join(memory_path, 'conversations'))
+        # Mutation logs larger than this many bytes are compacted into their conversation in the background
+        self.compaction_threshold = compaction_threshold
+        self._lock = threading.Lock()
+        self._compacting : Set[str] = set()
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-compaction")
+        self.writer = ConversationWriter(recover=self.loader.recover)
 
     @classmethod
     def init_folders(cls, memory_path: str):
@@ -51,7 +68,11 @@ class ConversationModel:
         Creates a new conversation model from the given config.
         """
         cls.init_folders(config.memory_path)
-        return cls(memory_path=config.memory_path, embedding_model=config.embedding_model)
+        return cls(memory_path=config.memory_path, embedding_model=config.embedding_model, compaction_threshold=config.compaction_threshold,
+                   embedding_backend=config.embedding_backend, embedding_threads=config.embedding_threads,
+                   embedding_pooling=config.embedding_pooling, vector_dtype=config.vector_dtype,
+                   index_shard_by=config.index_shard_by, query_cache_size=config.query_cache_size,
+                   query_max_terms=config.query_max_terms)
 
     @property
     def collection_path(self) -> Path:
@@ -64,7 +85,7 @@ class ConversationModel:
         """
         Refreshes the collection.
         """
-        self.index.index.reload()
+        self.index.reload()
         
     def load_conversation(self, conversation_id: str) -> list[ConversationMessage]:
         """
@@ -78,16 +99,11 @@ class ConversationModel:
         """
         # Get our document
         document_name = self.collection_path / f"{message.conversation_id}.jsonl"
-        create = True if not document_name.exists() else False
-        
-        if create:
-            # Create an empty document
-            with open(document_name, 'w') as f:
-                f.write(json.dumps(message.to_dict()) + '\n')
-        else:
-            # Append the message
-            with open(document_name, 'a') as f:
-                f.write(json.dumps(message.to_dict()) + '\n')
+        # Appends must not interleave with a compaction rewriting the file, but we wait for the commit outside
+        # of our lock, so concurrent appends share it
+        with self._lock:
+            ticket = self.writer.append(document_name, message.to_json() + '\n', sync=False)
+        self.writer.wait(ticket)
 
     def insert(self, message: ConversationMessage) -> None:
         """
@@ -95,40 +111,99 @@ class ConversationModel:
         """
 
         logger.info(f"Inserting {message.doc_id} into {self.collection_name}/{message.conversation_id}")
-        # First, check if we already have the document
-        document_name = self.collection_path / f"{message.conversation_id}.jsonl"
-        if not document_name.exists():
-            # Create an empty document
-            with open(document_name, 'w') as f:
-                f.write('')
-        
-        # Append the message
+        # Append the message, creating the document if we don't have it yet
         self._append_message(message)
         self.index.add_document(message.to_dict())
-        
+
+    def insert_many(self, messages: list[ConversationMessage], skip_existing: bool = False) -> int:
+        """
+        Inserts a batch of messages, with one append per conversation, one batched embedding and one index
+        commit for all of them.
+
+        With `skip_existing`, messages already in their conversation, or already indexed, aren't written there
+        again, so a batch that was interrupted part way can be inserted again.
+
+        Returns:
+            int: The number of messages indexed.
+        """
+        if len(messages) == 0:
+            return 0
+
+        by_conversation : Dict[str, List[ConversationMessage]] = defaultdict(list)
+        for message in messages:
+            by_conversation[message.conversation_id].append(message)
+
+        tickets = []
+        for conversation_id, conversation in by_conversation.items():
+            if skip_existing:
+                existing = {message.doc_id for message in self.loader.load_or_new(conversation_id)}
+                conversation = [message for message in conversation if message.doc_id not in existing]
+            if len(conversation) == 0:
+                continue
+            document_name = self.collection_path / f"{conversation_id}.jsonl"
+            with self._lock:
+                tickets.append(self.writer.append(document_name, "".join(message.to_json() + '\n' for message in conversation), sync=False))
+        if len(tickets) > 0:
+            self.writer.wait(max(tickets))
+
+        if skip_existing:
+            messages = [message for message in messages if self.index.get_document(message.doc_id, quiet=True) is None]
+        if len(messages) > 0:
+            logger.info(f"Inserting {len(messages)} messages into {self.collection_name}")
+            self.index.add_documents([message.to_dict() for message in messages])
+        return len(messages)
+
+    def _schedule_compaction(self, conversation_id: str, log_size: int) -> None:
+        """
+        Compacts a conversation in the background, once its mutation log has grown past the threshold.
+        """
+        if self.compaction_threshold <= 0 or log_size < self.compaction_threshold:
+            return
+        with self._lock:
+            if conversation_id in self._compacting:
+                return
+            self._compacting.add(conversation_id)
+        self._compactor.submit(self.compact_conversation, conversation_id)
+
+    def compact_conversation(self, conversation_id: str) -> None:
+        """
+        Rewrites a conversation with its mutation log applied, and removes the log.
+        """
+        try:
+            document_name = self.collection_path / f"{conversation_id}.jsonl"
+            log_name = mutations_path(document_name)
+            # Other processes may be appending to the file, or its log, while we read them
+            with self._lock, file_lock(document_name):
+                if not document_name.exists() or not log_name.exists():
+                    return
+                messages = self.loader.load_file(document_name)
+                self.writer.rewrite(document_name, (message.to_json() + '\n' for message in messages))
+                log_name.unlink()
+            logger.info(f"Compacted {conversation_id}: {len(messages)} messages")
+        except Exception as e:
+            logger.error(f"Error compacting {conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._compacting.discard(conversation_id)
+
+    def _append_mutation(self, conversation_id: str, mutation: dict[str, Any]) -> None:
+        with self._lock:
+            log_size = self.loader.append_mutation(conversation_id, mutation)
+        self._schedule_compaction(conversation_id, log_size)
+
     def update_document(self, conversation_id: str, document_id: str, update_data: dict[str, Any]) -> None:
         """
         Updates a document in the collection.
+
+        The update is appended to the conversation's mutation log, and merged in when the conversation is read.
         """
         # Get our document
         document_name = self.collection_path / f"{conversation_id}.jsonl"
         if not document_name.exists():
             raise FileNotFoundError(f"Conversation {conversation_id} not found")
 
-        # find the message, and replace it
-        new_document = []
-        with open(document_name, 'r') as f:
-            for line in f:
-                line : dict = json.loads(line)
-                if line['doc_id'] == document_id:
-                    # This is unsafe
-                    line.update(update_data)
-                new_document.append(json.dumps(line) + "\n")
-
-        # Write the new document
-        with open(document_name, 'w') as f:
-            for line in new_document:
-                f.write(line)
+        self._append_mutation(conversation_id, {"op": MUTATION_UPDATE, "doc_id": document_id, "data": update_data})
+        self.index.update_documents(updates=[(document_id, update_data)])
 
     def delete_conversation(self, conversation_id: str, persona_id : Optional[str] = None, user_id : Optional[str] = None) -> None:
         """
@@ -141,25 +216,31 @@ class ConversationModel:
             raise FileNotFoundError(f"Conversation {conversation_id} not found")
 
         if persona_id is None and user_id is None:
-            document_name.unlink()
+            doc_ids = self.index.find_doc_ids(conversation_id)
+            with self._lock, file_lock(document_name):
+                self.writer.release(document_name)
+                document_name.unlink()
+                mutations_path(document_name).unlink(missing_ok=True)
+            self.index.update_documents(deletes=doc_ids)
             return
-        
-        new_document = []
-        with open(document_name, 'r') as f:
-            for line in f:
-                line = json.loads(line)
-                if line['persona_id'] == persona_id and line['user_id'] == user_id:
-                    continue
-                new_document.append(json.dumps(line) + "\n")
-
-        # Write the new document
-        with open(document_name, 'w') as f:
-            for line in new_document:
-                f.write(line)
+
+        # Only the messages already written are deleted, not any appended after the tombstone
+        # A filter left unset matches anything, as it does in the index
+        where = {key: value for key, value in {"persona_id": persona_id, "user_id": user_id}.items() if value is not None}
+        with self._lock:
+            offset = document_name.stat().st_size
+            log_size = self.loader.append_mutation(conversation_id, {
+                "op": MUTATION_DELETE_WHERE, "where": where, "offset": offset
+            })
+        self._schedule_compaction(conversation_id, log_size)
+        self.index.update_documents(deletes=self.index.find_doc_ids(conversation_id, persona_id=persona_id, user_id=user_id))
 
     def delete_document(self, conversation_id: str, message_id: str) -> None:
         """
         Deletes a document from the collection.
+
+        A tombstone is appended to the conversation's mutation log, and the document is dropped when the
+        conversation is read.
         """
 
         # Get our document
@@ -167,29 +248,19 @@ class ConversationModel:
         if not document_name.exists():
             raise FileNotFoundError(f"Conversation {conversation_id} not found")
 
-        # find the message, and replace it
-        new_document = []
-        with open(document_name, 'r') as f:
-            for line in f:
-                line = json.loads(line)
-                if line['doc_id'] == message_id:
-                    continue
-                new_document.append(json.dumps(line) + "\n")
-
-        # Write the new document
-        with open(document_name, 'w') as f:
-            for line in new_document:
-                f.write(line)
+        self._append_mutation(conversation_id, {"op": MUTATION_DELETE, "doc_id": message_id})
+        self.index.update_documents(deletes=[message_id])
     
     def query(self, query_texts: List[str], filter_doc_ids: Optional[Set[str]] = None, top_n: Optional[int] = None,
               query_document_type: Optional[str | list[str]] = None, query_conversation_id: Optional[str] = None,
-              max_length: Optional[int] = None,
+              max_length: Optional[int] = None, query_time_range: Optional[tuple[Optional[int], Optional[int]]] = None,
+              query_persona_id: Optional[str] = None,
               turn_decay: float = 0.7, temporal_decay: float = 0.99, length_boost_factor: float = 0.0,
               filter_metadocs: bool = True, **kwargs) -> pd.DataFrame:
         """
         Queries the conversation collection and returns a DataFrame containing the top `top_n` most relevant conversation entries based on the given query texts, filters, and decay factors.
         
-        The query is performed using the collection's search functionality, with optional filters applied to exclude certain document types, document IDs, and text content. The relevance score for each entry is calculated as a combination of the text similarity to the query texts, the temporal decay based on the entry's timestamp, and the entry's weight.
+        The query is performed using the collection's search functionality, with optional filters applied to exclude certain document types, document IDs, and text content, or to keep a `query_time_range` of (after, before) timestamps, or a single persona's entries. The relevance score for each entry is calculated as a combination of the text similarity to the query texts, the temporal decay based on the entry's timestamp, and the entry's weight.
         
         The returned DataFrame includes the following columns:
         - `content`: The content of the conversation entry.
@@ -202,6 +273,8 @@ class ConversationModel:
         - `date`: The date and time of the conversation entry.
         - `speaker`: The speaker of the conversation entry (either the user's ID or the persona's ID).
         - `score`: The relevance score of the conversation entry.
+
+        Results are cached until the index changes; a repeated query returns a copy of the cached results.
         """
 
         filter_document_type = [DOC_NER, DOC_STEP] if filter_metadocs and not query_document_type else None
@@ -209,8 +282,21 @@ class ConversationModel:
         if len(query_texts) == 0:
             logger.warning("No query texts provided, returning empty DataFrame")
             return pd.DataFrame(columns=VISIBLE_COLUMNS + ['date', 'speaker', 'score'])
+
+        key = query_key(query_texts, filter_doc_ids=filter_doc_ids, top_n=top_n, query_document_type=query_document_type,
+                        query_conversation_id=query_conversation_id, max_length=max_length, query_time_range=query_time_range,
+                        query_persona_id=query_persona_id, turn_decay=turn_decay, temporal_decay=temporal_decay,
+                        length_boost_factor=length_boost_factor, filter_metadocs=filter_metadocs, **kwargs)
+        generation = self.index.generation()
+        cached = self.query_cache.get(key, generation)
+        if cached is not None:
+            return cached
+
+        # Vectorize our query text once: a sharded index merges its shards' hits by it, and we rerank by it
+        query_vector = self.query_cache.vector(query_texts[-1], self.index.vectorizer)
         results = self.index.search(query_texts, query_document_type=query_document_type, filter_doc_ids=filter_doc_ids, filter_document_type=filter_document_type, query_conversation_id=query_conversation_id,
-                                    query_limit=top_n * 2)
+                                    query_time_range=query_time_range, query_persona_id=query_persona_id, query_limit=top_n * 2,
+                                    query_vector=query_vector)
 
         if query_conversation_id is not None:
             conversation = self._query_conversation(conversation_id=query_conversation_id, query_document_type=query_document_type)
@@ -245,16 +331,8 @@ class ConversationModel:
         # Our results come back with hits, representing the number of matches for a single document. We need to boost the score as the hits go up; but not as linearly as the hits do.
         results['hits_score'] = np.log2(results['hits'] + 1)
 
-        # Vectorize our query texts and get the similarity scores
-        query_vectors = np.array(self.index.vectorizer.transform([query_texts[-1]]))
-        faiss_index = faiss.IndexFlatL2(query_vectors[0].shape[0])
-        result_indices = np.stack(results['index_a'].to_numpy())
-        faiss_index.add(result_indices)
-        distance, index = faiss_index.search(query_vectors, results.shape[0])
-        distance_index = zip(distance[0], index[0])
-
-        distance_index = sorted(distance_index, key=lambda x: x[1])
-        results['rerank'] = [1 / d if d > 0 else 0 for d, _ in distance_index]
+        # Rerank by cosine similarity to the query; the vectors are normalized, so that's their inner product
+        results['rerank'] = np.clip(similarity(query_vector, results['index_a']), 0, None)
 
         results['length_score'] = (np.log2(results['content'].str.len() + 1) * length_boost_factor) + 1
         # Scale with the following rules - 
@@ -286,8 +364,10 @@ class ConversationModel:
 
         if max_length is not None:
             results = results[results['cumlen'] <= max_length]
-            
-        return results[VISIBLE_COLUMNS + ['date', 'speaker', 'score']]
+
+        results = results[VISIBLE_COLUMNS + ['date', 'speaker', 'score']]
+        self.query_cache.put(key, generation, results)
+        return results
 
     def get_motd(self, top_n: int = 1) -> pd.DataFrame:
         results = self.index.search(query_document_type=DOC_MOTD, query_limit=top_n, descending=True)
@@ -332,22 +412,11 @@ class ConversationModel:
         results = self._fix_dataframe(results)
         return results[VISIBLE_COLUMNS + ['date', 'speaker']]
 
-    def next_conversation_id(self) -> str:
+    def next_conversation_id(self, user_id: Optional[str] = None, persona_id: Optional[str] = None) -> str:
         """
-        Returns a valid unique conversation ID for a given user.
+        Returns a unique conversation ID, ordered by creation time, with a two word alias to tell them apart.
         """
-
-        # A converation id is three random words separated by dashes
-        random_words = RandomWord()
-        conversation_id = "-".join(random_words.word() for _ in range(2))
-
-        # We need to check if the conversation ID already exists
-        converation_file = self.collection_path / f"{conversation_id}.jsonl"
-        
-        if converation_file.exists():
-            return self.next_conversation_id()
-
-        return conversation_id
+        return new_alias_id(2)
 
     def _query_conversation(self, conversation_id: str, query_document_type: Optional[str | list[str]] = None, filter_document_type: Optional[str | list[str]] = None, **kwargs) -> pd.DataFrame:
         """
@@ -445,24 +514,20 @@ class ConversationModel:
 
     def to_pandas(self) -> pd.DataFrame:
         """
-        If you really need all of the data...
+        If you really need all of the data... Read through the loader, so pending mutations are applied.
         """
-        files = self.collection_path.glob('*.jsonl')
         results = []
-        lineno = 0
-        for file in files:
+        for file in self.collection_path.glob('*.jsonl'):
             try:
-                with open(file, 'r') as f:
-                    for i, line in enumerate(f):
-                        lineno = i
-                        if len(line) == 0:
-                            continue
-                        jline = json.loads(line)
-                        # If we rename the file, we need to update the conversation_id
-                        jline['conversation_id'] = file.stem
-                        jline['lineno'] = lineno
-                        results.append(jline)
-            except json.decoder.JSONDecodeError as e:
-                logger.warning(f"Could not read {file} line {lineno}: {e}")
+                messages = self.loader.load_file(file)
+            except FileNotFoundError:
+                # Deleted since we listed it
+                continue
+            for lineno, message in enumerate(messages):
+                row = message.to_dict()
+                # If we rename the file, we need to update the conversation_id
+                row['conversation_id'] = file.stem
+                row['lineno'] = lineno
+                results.append(row)
 
         return pd.DataFrame(results)
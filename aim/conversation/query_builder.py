@@ -0,0 +1,100 @@
+# aim/conversation/query_builder.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import Counter, OrderedDict
+import logging
+import math
+import re
+import threading
+from typing import Optional
+from tantivy import Index, Query, Occur
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def query_terms(text: str) -> list[str]:
+    """The lowercased words of a query text, without punctuation"""
+    return _WHITESPACE.split(_PUNCTUATION.sub(" ", text).lower().strip()) if text.strip() else []
+
+
+class QueryBuilder:
+    """
+    Builds the full text query of a query text from its most salient terms.
+
+    A text with at most `max_terms` distinct words queries all of them, each boosted by its count in the text,
+    which scores as parsing the whole text did. A longer one, such as a recalled memory, only queries the
+    `max_terms` with the highest tf-idf, boosted by their log count, so the clause count is bounded however
+    long the text is. Only the `candidate_factor * max_terms` most frequent (then longest) words are looked
+    up for their document frequency.
+
+    Each word is parsed once, by the index's tokenizer, and its document frequency counted once; both are
+    kept in an LRU that is dropped when the index has grown or shrunk by `refresh_ratio`.
+    """
+
+    def __init__(self, field_name: str = "content", max_terms: int = 32, candidate_factor: int = 8,
+                 cache_size: int = 65536, refresh_ratio: float = 0.1):
+        self.field_name = field_name
+        self.max_terms = max_terms
+        self.candidate_factor = candidate_factor
+        self.cache_size = cache_size
+        self.refresh_ratio = refresh_ratio
+        self.terms : OrderedDict[str, tuple[Query, Optional[int]]] = OrderedDict()
+        self.num_docs = 0
+        self.lock = threading.Lock()
+
+    def _term(self, index: Index, searcher, word: str, count: bool) -> tuple[Query, Optional[int]]:
+        """The parsed query of a word, and its document frequency if `count`"""
+        with self.lock:
+            cached = self.terms.get(word)
+            if cached is not None:
+                self.terms.move_to_end(word)
+                if cached[1] is not None or not count:
+                    return cached
+        query = cached[0] if cached is not None else index.parse_query(word, default_field_names=[self.field_name])
+        doc_freq = searcher.search(query, limit=1, count=True).count if count else None
+        with self.lock:
+            self.terms[word] = (query, doc_freq)
+            while len(self.terms) > self.cache_size:
+                self.terms.popitem(last=False)
+        return query, doc_freq
+
+    def _check_num_docs(self, num_docs: int) -> None:
+        with self.lock:
+            if abs(num_docs - self.num_docs) > self.refresh_ratio * max(self.num_docs, 1):
+                self.terms.clear()
+                self.num_docs = num_docs
+
+    def salient(self, index: Index, searcher, counts: Counter) -> list[str]:
+        """The `max_terms` words with the highest tf-idf"""
+        num_docs = searcher.num_docs
+        self._check_num_docs(num_docs)
+        candidates = sorted(counts, key=lambda w: (counts[w], len(w)), reverse=True)[:self.candidate_factor * self.max_terms]
+        scores = {}
+        for word in candidates:
+            _, doc_freq = self._term(index, searcher, word, count=True)
+            if doc_freq == 0:
+                # Nothing to match
+                continue
+            scores[word] = (1 + math.log(counts[word])) * math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        return sorted(scores, key=scores.get, reverse=True)[:self.max_terms]
+
+    def build(self, index: Index, searcher, text: str) -> Optional[Query]:
+        """The query of a text, or None if it has no words"""
+        counts = Counter(query_terms(text))
+        if len(counts) == 0:
+            return None
+        words, boosts = list(counts), counts
+        if self.max_terms > 0 and len(counts) > self.max_terms:
+            words = self.salient(index, searcher, counts)
+            boosts = {word: 1 + math.log(counts[word]) for word in words}
+            logger.debug(f"Querying {len(words)} of {len(counts)} terms")
+        subqueries = []
+        for word in words:
+            query, _ = self._term(index, searcher, word, count=False)
+            if boosts[word] != 1:
+                query = Query.boost_query(query, float(boosts[word]))
+            subqueries.append((Occur.Should, query))
+        return Query.boolean_query(subqueries)
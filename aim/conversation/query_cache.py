@@ -0,0 +1,157 @@
+# aim/conversation/query_cache.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import OrderedDict
+from collections.abc import Hashable
+import logging
+import numpy as np
+import pandas as pd
+import re
+import threading
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _freeze(value: Any) -> Hashable:
+    """A hashable form of a query parameter; sets are sorted, their order doesn't matter"""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if not isinstance(value, Hashable):
+        raise TypeError(f"Can't cache a query on {type(value).__name__}")
+    return value
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def query_key(query_texts: list[str], **params: Any) -> Optional[tuple]:
+    """
+    The cache key of a query: its whitespace normalized texts, in order, and its parameters. None when a
+    parameter can't be part of a key.
+    """
+    try:
+        return (tuple(normalize_text(text) for text in query_texts), _freeze(params))
+    except TypeError:
+        return None
+
+
+class QueryCache:
+    """
+    A bounded cache of query results, for the current generation of the index.
+
+    Every result is only valid for the index generation it was computed under, and is put after a lookup under
+    that generation; the first lookup under a new generation drops them all. The least recently used results are evicted past `max_bytes`. The embeddings
+    of query texts don't depend on the index, and are kept across generations, up to `max_vectors`.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_vectors: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_vectors = max_vectors
+        self.total_bytes = 0
+        self.generation : Optional[Hashable] = None
+        self.entries : OrderedDict[tuple, tuple[pd.DataFrame, int]] = OrderedDict()
+        self.vectors : OrderedDict[str, np.ndarray] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.vector_hits = 0
+        self.vector_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _check_generation(self, generation: Hashable) -> None:
+        if generation == self.generation:
+            return
+        if len(self.entries) > 0:
+            self.invalidations += 1
+            logger.debug(f"Index changed, dropping {len(self.entries)} cached queries")
+        self.entries.clear()
+        self.total_bytes = 0
+        self.generation = generation
+
+    def get(self, key: Optional[tuple], generation: Hashable) -> Optional[pd.DataFrame]:
+        if key is None or not self.enabled:
+            return None
+        with self.lock:
+            self._check_generation(generation)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0].copy()
+
+    def put(self, key: Optional[tuple], generation: Hashable, results: pd.DataFrame) -> None:
+        if key is None or not self.enabled:
+            return
+        size = int(results.memory_usage(deep=True).sum())
+        with self.lock:
+            if generation != self.generation:
+                # The index changed while we were searching
+                return
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (results.copy(), size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                evicted = next(iter(self.entries))
+                self._remove(evicted)
+                self.evictions += 1
+
+    def _remove(self, key: tuple) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def vector(self, text: str, embed: Callable[[str], np.ndarray]) -> np.ndarray:
+        """The embedding of a query text, from `embed` the first time"""
+        if not self.enabled:
+            return embed(text)
+        text = normalize_text(text)
+        with self.lock:
+            vector = self.vectors.get(text)
+            if vector is not None:
+                self.vectors.move_to_end(text)
+                self.vector_hits += 1
+                return vector
+            self.vector_misses += 1
+        vector = embed(text)
+        with self.lock:
+            self.vectors[text] = vector
+            while len(self.vectors) > self.max_vectors:
+                self.vectors.popitem(last=False)
+        return vector
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.vectors.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "vectors": len(self.vectors),
+                "vector_hits": self.vector_hits,
+                "vector_misses": self.vector_misses,
+            }
@@ -0,0 +1,226 @@
+# aim/conversation/shards.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from pathlib import Path
+import threading
+from typing import Any, Callable, Optional
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+
+from .embedding import HuggingFaceEmbedding
+from .index import SearchIndex
+from .message import QUERY_COLUMNS
+from .vectors import similarity
+from .writer import file_lock
+
+logger = logging.getLogger(__name__)
+
+SHARD_KEYS = ("persona_id", "user_id")
+# The directory of the shard of an empty key; quote never produces a lone %
+EMPTY_KEY = "%"
+
+
+class ShardedIndex:
+    """
+    The conversation index split into one SearchIndex per persona (or per user), with the same interface.
+
+    Writes go to the shard of each document's key. A search for a single key only touches its shard; any other
+    search fans out over every shard in parallel, and the per-shard top hits are merged. Shards live in
+    `<index_path>/by_<shard_by>/<key>`, and are opened on first use. An unsharded index already at
+    `<index_path>` is split into shards when first opened sharded.
+    """
+
+    def __init__(self, index_path: Path, shard_by: str = "persona_id", max_workers: int = 8, **index_args: Any):
+        if shard_by not in SHARD_KEYS:
+            raise ValueError(f"Can't shard by {shard_by}, expected one of {', '.join(SHARD_KEYS)}")
+        self.index_path = index_path / f"by_{shard_by}"
+        self.shard_by = shard_by
+        self.index_args = index_args
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.open_shards : dict[str, SearchIndex] = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="index-shard")
+        # The same model as every shard's, from the process wide model cache
+        self.vectorizer = HuggingFaceEmbedding(model_name=index_args["embedding_model"], device=index_args.get("device", "cpu"),
+                                               backend=index_args.get("embedding_backend", "torch"),
+                                               threads=index_args.get("embedding_threads", 0),
+                                               pooling=index_args.get("embedding_pooling", "cls"))
+        if (index_path / "meta.json").exists():
+            self._split(index_path)
+
+    def _split(self, root: Path) -> None:
+        """
+        Copy the unsharded index at the root into shards, with the vectors it has, and set it aside in
+        `<root>/.unsharded`.
+        """
+        with file_lock(self.index_path):
+            # Another process may have split it while we waited
+            if not (root / "meta.json").exists():
+                return
+            logger.info(f"Splitting the unsharded index in {root} by {self.shard_by}")
+            unsharded = SearchIndex(root, **self.index_args)
+            count = 0
+            for batch in unsharded.documents():
+                by_key = defaultdict(list)
+                for doc, vector in batch:
+                    by_key[doc.get(self.shard_by, "")].append((doc, vector))
+                for key, pairs in by_key.items():
+                    docs, vectors = [doc for doc, _ in pairs], [vector for _, vector in pairs]
+                    missing = [i for i, vector in enumerate(vectors) if vector is None]
+                    if len(missing) > 0:
+                        for i, vector in zip(missing, self.vectorizer.transform([docs[i]["content"] for i in missing])):
+                            vectors[i] = vector
+                    self.shard(key).add_documents(docs, vectors)
+                count += len(batch)
+            del unsharded
+
+            aside = root / ".unsharded"
+            aside.mkdir(exist_ok=True)
+            for path in root.iterdir():
+                if path != aside and not path.name.startswith("by_"):
+                    path.rename(aside / path.name)
+            logger.info(f"Split {count} documents into {len(self.keys())} shards; the unsharded index is kept in {aside}")
+
+    def shard_path(self, key: str) -> Path:
+        return self.index_path / (quote(key, safe="") if key else EMPTY_KEY)
+
+    def keys(self) -> list[str]:
+        """The keys of every shard on disk"""
+        return sorted("" if p.name == EMPTY_KEY else unquote(p.name)
+                      for p in self.index_path.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+    def shard(self, key: str) -> SearchIndex:
+        """The shard of a key, created if it doesn't exist yet"""
+        with self.lock:
+            if key not in self.open_shards:
+                self.open_shards[key] = SearchIndex(self.shard_path(key), **self.index_args)
+            return self.open_shards[key]
+
+    def _fan_out(self, fn: Callable[[SearchIndex], Any], key: Optional[str] = None) -> dict[str, Any]:
+        """
+        Call a function on the shard of a key, or on every shard in parallel, returning the results by key.
+        """
+        keys = ([key] if self.shard_path(key).exists() else []) if key is not None else self.keys()
+        shards = [self.shard(k) for k in keys]
+        if len(shards) <= 1:
+            return {k: fn(shard) for k, shard in zip(keys, shards)}
+        return dict(zip(keys, self.executor.map(fn, shards)))
+
+    def reload(self) -> None:
+        self._fan_out(lambda shard: shard.reload())
+
+    def generation(self) -> tuple:
+        """The generations of every shard; a new shard changes it too"""
+        return tuple((key, self.shard(key).generation()) for key in self.keys())
+
+    def add_document(self, doc: dict) -> None:
+        self.shard(doc[self.shard_by]).add_document(doc)
+
+    def add_documents(self, documents: list[dict]) -> None:
+        by_key = defaultdict(list)
+        for doc in documents:
+            by_key[doc[self.shard_by]].append(doc)
+        for key, docs in by_key.items():
+            self.shard(key).add_documents(docs)
+
+    def _locate(self, doc_ids: list[str]) -> dict[str, list[str]]:
+        """The doc_ids found in each shard, by shard key"""
+        wanted = set(doc_ids)
+        found = self._fan_out(lambda shard: [doc_id for doc_id in wanted if shard.get_document(doc_id, quiet=True) is not None])
+        located = {key: ids for key, ids in found.items() if len(ids) > 0}
+        missing = wanted - {doc_id for ids in located.values() for doc_id in ids}
+        if len(missing) > 0:
+            logger.warning(f"No indexed documents {', '.join(sorted(missing))} in any shard")
+        return located
+
+    def update_documents(self, updates: list[tuple[str, dict]] = [], deletes: list[str] = []) -> None:
+        if len(updates) == 0 and len(deletes) == 0:
+            return
+        located = self._locate([doc_id for doc_id, _ in updates] + list(deletes))
+        for key, doc_ids in located.items():
+            in_shard = set(doc_ids)
+            self.shard(key).update_documents(updates=[(doc_id, update) for doc_id, update in updates if doc_id in in_shard],
+                                             deletes=[doc_id for doc_id in deletes if doc_id in in_shard])
+
+    def find_doc_ids(self, conversation_id: str, persona_id: Optional[str] = None, user_id: Optional[str] = None) -> list[str]:
+        key = persona_id if self.shard_by == "persona_id" else user_id
+        found = self._fan_out(lambda shard: shard.find_doc_ids(conversation_id, persona_id=persona_id, user_id=user_id), key)
+        return [doc_id for doc_ids in found.values() for doc_id in doc_ids]
+
+    def get_document(self, doc_id: str, quiet: bool = False) -> Optional[dict]:
+        for doc in self._fan_out(lambda shard: shard.get_document(doc_id, quiet=True)).values():
+            if doc is not None:
+                return doc
+        if not quiet:
+            logger.warning(f"No results found for {doc_id}")
+        return None
+
+    def search(self, query_texts: list[str] = [], query_persona_id: Optional[str] = None, query_user_id: Optional[str] = None,
+               query_limit: int = 20, descending: Optional[bool] = None, query_vector: Optional[np.ndarray] = None,
+               **kwargs: Any) -> pd.DataFrame:
+        """
+        Search the shard of the queried key, or every shard, keeping the top `query_limit` hits: by score, or
+        by timestamp when `descending` is given.
+
+        BM25 scores depend on each shard's own term statistics, so they aren't compared across shards; hits
+        are merged by their score normalized to their shard's best hit, plus their similarity to
+        `query_vector`, the caller's embedding of the query, if given.
+        """
+        key = query_persona_id if self.shard_by == "persona_id" else query_user_id
+        frames = self._fan_out(lambda shard: shard.search(query_texts, query_persona_id=query_persona_id, query_user_id=query_user_id,
+                                                          query_limit=query_limit, descending=descending, **kwargs), key)
+        frames = [frame for frame in frames.values() if len(frame) > 0]
+        if len(frames) == 0:
+            return pd.DataFrame(columns=QUERY_COLUMNS + ['distance', 'hits'])
+        if len(frames) == 1:
+            return frames[0]
+        if descending is not None:
+            results = pd.concat(frames, ignore_index=True).sort_values('timestamp', ascending=not descending)
+            return results.head(query_limit).reset_index(drop=True)
+        results = pd.concat([frame.assign(merge_score=self._normalized(frame['distance'])) for frame in frames], ignore_index=True)
+        if query_vector is not None:
+            results['merge_score'] += similarity(query_vector, results['index_a'])
+        results = results.sort_values('merge_score', ascending=False).drop(columns=['merge_score'])
+        return results.head(query_limit).reset_index(drop=True)
+
+    @staticmethod
+    def _normalized(scores: pd.Series) -> pd.Series:
+        """Scores relative to the best of them"""
+        best = scores.max()
+        return scores / best if best > 0 else scores * 0
+
+    def migrate_vectors(self, batch_size: int = 1000) -> int:
+        return sum(self._fan_out(lambda shard: shard.migrate_vectors(batch_size=batch_size)).values())
+
+    def compact(self, key: Optional[str] = None, vacuum: bool = False) -> None:
+        """Compact one shard, or every shard"""
+        self._fan_out(lambda shard: shard.compact(vacuum=vacuum), key)
+
+    def rebuild(self, documents: list[dict], key: Optional[str] = None) -> None:
+        """
+        Clear and rebuild one shard from its documents, or every shard from all of them; shards with no
+        documents left are rebuilt empty.
+        """
+        by_key = defaultdict(list)
+        for doc in documents:
+            if key is None or doc[self.shard_by] == key:
+                by_key[doc[self.shard_by]].append(doc)
+        for stale in ([key] if key is not None else self.keys()):
+            by_key.setdefault(stale, [])
+        for shard_key, docs in by_key.items():
+            self.shard(shard_key).rebuild(docs)
+        logger.info(f"Rebuilt {len(by_key)} shards with {sum(len(docs) for docs in by_key.values())} documents")
+
+
+def open_index(index_path: Path, shard_by: Optional[str] = None, **index_args: Any) -> SearchIndex | ShardedIndex:
+    """
+    The conversation index at a path, sharded by persona_id or user_id if `shard_by` is given.
+    """
+    if shard_by:
+        return ShardedIndex(index_path, shard_by=shard_by, **index_args)
+    return SearchIndex(index_path, **index_args)
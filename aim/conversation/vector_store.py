@@ -0,0 +1,330 @@
+# aim/conversation/vector_store.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from contextlib import contextmanager
+import logging
+import numpy as np
+import os
+from pathlib import Path
+import shutil
+import struct
+import threading
+import time
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock, only one process may write to a store at a time
+    fcntl = None
+
+from .vectors import DTYPES, DTYPE_FLOAT16, DTYPE_FLOAT32, DTYPE_INT8, POOLINGS, POOLING_CLS, normalize, quantize_int8
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"AVS1"
+# magic, dtype code, pooling code, dimension; padded to HEADER_SIZE
+_HEADER = struct.Struct("<4sBBxxI")
+HEADER_SIZE = 16
+DELETED = -1
+
+
+class VectorStore:
+    """
+    Embeddings in memory-mapped sidecar files, addressed by doc_id, so retrieval doesn't go through the doc store.
+
+    `vectors.bin` is a header and fixed size rows of normalized vectors, in the store's dtype (int8 rows lead
+    with their float32 scale). `vectors.ids` is an append-only log of `doc_id<TAB>row` records, replayed on open
+    and whenever another process may have appended; a row of -1 deletes the doc_id. A re-added doc_id is
+    overwritten in its row; deleted rows are only reclaimed by `rewrite`.
+
+    Rows are written before the ids that point at them, so a crash never leaves an id pointing past the data.
+    """
+
+    def __init__(self, path: Path, dtype: str = DTYPE_FLOAT32, pooling: str = POOLING_CLS):
+        self.path = Path(path)
+        self.lock = threading.RLock()
+        self.default_format = (dtype, pooling)
+        # A rewrite that crashed between its renames leaves the previous store aside; put it back
+        previous = self._previous_path()
+        if not self.path.exists() and previous.exists():
+            previous.rename(self.path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._reset()
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.path / "vectors.bin"
+
+    @property
+    def ids_path(self) -> Path:
+        return self.path / "vectors.ids"
+
+    def _previous_path(self) -> Path:
+        return self.path.with_name(f".{self.path.name}.previous")
+
+    def _reset(self) -> None:
+        self.slots : dict[str, int] = {}
+        self.rows = 0
+        self.dtype, self.pooling = self.default_format
+        self.dim = 0
+        self._ids_offset = 0
+        self._ids_inode : Optional[int] = None
+        self._map : Optional[np.ndarray] = None
+        self._read_header()
+        self._refresh()
+
+    @property
+    def format(self) -> tuple[str, str]:
+        return self.dtype, self.pooling
+
+    @property
+    def row_size(self) -> int:
+        if self.dtype == DTYPE_FLOAT32:
+            return self.dim * 4
+        if self.dtype == DTYPE_FLOAT16:
+            return self.dim * 2
+        return 4 + self.dim
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.slots
+
+    @property
+    def dead_rows(self) -> int:
+        """Rows of deleted doc_ids, reclaimed by a rewrite"""
+        return self.rows - len(self.slots)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in (self.vectors_path, self.ids_path) if p.exists())
+
+    def _read_header(self) -> None:
+        if not self.vectors_path.exists() or self.vectors_path.stat().st_size < HEADER_SIZE:
+            return
+        with open(self.vectors_path, 'rb') as f:
+            magic, dtype, pooling, dim = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.vectors_path} is not a vector store")
+        self.dtype, self.pooling, self.dim = DTYPES[dtype], POOLINGS[pooling], dim
+
+    def _refresh(self) -> None:
+        """
+        Replay ids appended since we last looked, by us or another process. A store swapped out by a rewrite
+        is reloaded from scratch.
+        """
+        try:
+            inode = self.ids_path.stat().st_ino
+        except FileNotFoundError:
+            return
+        if self._ids_inode is not None and inode != self._ids_inode:
+            self._reset()
+            return
+        self._ids_inode = inode
+        if self.dim == 0:
+            self._read_header()
+
+        with open(self.ids_path, 'rb') as f:
+            f.seek(self._ids_offset)
+            data = f.read()
+        # Only complete records; a record being appended right now is picked up next time
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            doc_id, slot = line.decode('utf-8').rsplit('\t', 1)
+            slot = int(slot)
+            if slot == DELETED:
+                self.slots.pop(doc_id, None)
+            else:
+                self.slots[doc_id] = slot
+                self.rows = max(self.rows, slot + 1)
+        self._ids_offset += end
+
+    def _view(self) -> Optional[np.ndarray]:
+        """
+        The rows, memory-mapped; mapped again when the store has grown.
+        """
+        if self.rows == 0:
+            return None
+        if self._map is None or len(self._map) < self.rows:
+            if self.dtype == DTYPE_INT8:
+                row_dtype = np.dtype([("scale", "<f4"), ("values", "i1", (self.dim,))])
+                self._map = np.memmap(self.vectors_path, dtype=row_dtype, mode='r', offset=HEADER_SIZE, shape=(self.rows,))
+            else:
+                dtype = np.float32 if self.dtype == DTYPE_FLOAT32 else np.float16
+                self._map = np.memmap(self.vectors_path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(self.rows, self.dim))
+        return self._map
+
+    def _decode(self, view: np.ndarray, slot: int) -> np.ndarray:
+        if self.dtype == DTYPE_FLOAT32:
+            # A view straight into the mapped file, no copy
+            return view[slot]
+        if self.dtype == DTYPE_FLOAT16:
+            return view[slot].astype(np.float32)
+        row = view[slot]
+        return row["values"].astype(np.float32) * row["scale"]
+
+    def _encode(self, vector: np.ndarray) -> bytes:
+        vector = normalize(vector)
+        if self.dtype == DTYPE_FLOAT32:
+            return vector.tobytes()
+        if self.dtype == DTYPE_FLOAT16:
+            return vector.astype(np.float16).tobytes()
+        scale, quantized = quantize_int8(vector)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+
+    def get(self, doc_id: str) -> Optional[np.ndarray]:
+        return self.get_many([doc_id])[0]
+
+    def get_many(self, doc_ids: list[str]) -> list[Optional[np.ndarray]]:
+        """
+        The normalized float32 vectors of the given doc_ids, None for those without one.
+        """
+        with self.lock:
+            self._refresh()
+            view = self._view()
+            if view is None:
+                return [None] * len(doc_ids)
+            return [self._decode(view, self.slots[doc_id]) if doc_id in self.slots else None for doc_id in doc_ids]
+
+    def items(self) -> Iterator[tuple[str, np.ndarray]]:
+        """
+        Every live doc_id and its vector.
+        """
+        with self.lock:
+            self._refresh()
+            view = self._view()
+            slots = list(self.slots.items())
+        for doc_id, slot in slots:
+            yield doc_id, self._decode(view, slot)
+
+    def _open_locked(self) -> BinaryIO:
+        """
+        Open the ids log for appending and lock it, again if a rewrite swapped the store while we waited.
+        """
+        while True:
+            try:
+                f = open(self.ids_path, 'ab')
+            except FileNotFoundError:
+                # Between the renames of a rewrite's swap
+                time.sleep(0.01)
+                continue
+            if fcntl is None:
+                return f
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == self.ids_path.stat().st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[BinaryIO]:
+        """
+        Hold the ids log open for appending, locked against other processes.
+        """
+        with self._open_locked() as f:
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append_ids(self, f: BinaryIO, records: list[str]) -> None:
+        f.write("".join(records).encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+        # Under the lock nobody else appended, so everything up to here has been replayed
+        self._ids_offset = f.tell()
+
+    def put_many(self, items: Iterable[tuple[str, np.ndarray]]) -> None:
+        """
+        Store vectors, replacing those of doc_ids already in the store.
+        """
+        items = list(items)
+        if len(items) == 0:
+            return
+        with self.lock, self._exclusive() as ids:
+            self._refresh()
+            if self.dim == 0:
+                self.dim = len(items[0][1])
+                with open(self.vectors_path, 'wb') as f:
+                    f.write(_HEADER.pack(MAGIC, DTYPES.index(self.dtype), POOLINGS.index(self.pooling), self.dim).ljust(HEADER_SIZE, b'\0'))
+
+            records, assigned = [], {}
+            with open(self.vectors_path, 'r+b') as f:
+                for doc_id, vector in items:
+                    if len(vector) != self.dim:
+                        raise ValueError(f"Vector for {doc_id} has dimension {len(vector)}, the store has {self.dim}")
+                    slot = self.slots.get(doc_id, assigned.get(doc_id))
+                    if slot is None:
+                        slot = self.rows
+                        self.rows += 1
+                        assigned[doc_id] = slot
+                        records.append(f"{doc_id}\t{slot}\n")
+                    f.seek(HEADER_SIZE + slot * self.row_size)
+                    f.write(self._encode(vector))
+                f.flush()
+                os.fsync(f.fileno())
+
+            if len(records) > 0:
+                self._append_ids(ids, records)
+                self.slots.update(assigned)
+
+    def put(self, doc_id: str, vector: np.ndarray) -> None:
+        self.put_many([(doc_id, vector)])
+
+    def delete_many(self, doc_ids: Iterable[str]) -> None:
+        with self.lock, self._exclusive() as ids:
+            self._refresh()
+            deleted = [doc_id for doc_id in set(doc_ids) if doc_id in self.slots]
+            if len(deleted) == 0:
+                return
+            self._append_ids(ids, [f"{doc_id}\t{DELETED}\n" for doc_id in deleted])
+            for doc_id in deleted:
+                del self.slots[doc_id]
+
+    def rewrite(self, items: Iterable[tuple[str, np.ndarray]], dtype: Optional[str] = None, pooling: Optional[str] = None) -> int:
+        """
+        Replace the store with the given vectors, in the given format, dropping the rows of deleted doc_ids.
+
+        The new store is built aside and swapped in by renaming directories, holding the lock of the ids log
+        throughout, so no writer in any process puts or deletes a vector that the copy misses. Other
+        processes notice the swap on their next read.
+
+        Returns:
+            The number of vectors written.
+        """
+        dtype, pooling = dtype or self.dtype, pooling or self.pooling
+        temp_path = self.path.with_name(f".{self.path.name}.rewrite")
+        previous = self._previous_path()
+        with self.lock, self._exclusive():
+            shutil.rmtree(temp_path, ignore_errors=True)
+            written = VectorStore(temp_path, dtype, pooling)
+            batch = []
+            for item in items:
+                batch.append(item)
+                if len(batch) >= 1000:
+                    written.put_many(batch)
+                    batch = []
+            written.put_many(batch)
+
+            shutil.rmtree(previous, ignore_errors=True)
+            self.path.rename(previous)
+            temp_path.rename(self.path)
+            shutil.rmtree(previous, ignore_errors=True)
+            self.default_format = (dtype, pooling)
+            self._reset()
+        logger.info(f"Rewrote {self.path} with {len(written)} vectors as {dtype}")
+        return len(written)
+
+    def move(self, path: Path) -> None:
+        """
+        Move the store to another directory, once no writer in any process is using it.
+        """
+        with self.lock, self._exclusive():
+            self.path.rename(path)
+            self._map = None
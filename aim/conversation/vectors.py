@@ -0,0 +1,103 @@
+# aim/conversation/vectors.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+import numpy as np
+from typing import Iterable, Optional
+
+DTYPE_FLOAT32 = "float32"
+DTYPE_FLOAT16 = "float16"
+DTYPE_INT8 = "int8"
+DTYPES = (DTYPE_FLOAT32, DTYPE_FLOAT16, DTYPE_INT8)
+
+POOLING_CLS = "cls"
+POOLING_MEAN = "mean"
+POOLING_DEFAULT = "default"
+POOLINGS = (POOLING_CLS, POOLING_MEAN, POOLING_DEFAULT)
+
+# Encoded vectors start with a four byte header: the magic, the dtype code and the pooling code. Read as the
+# first component of a legacy vector (raw, unnormalized float32), the header is a float below 1e-37, which
+# no embedding model produces, so headerless legacy vectors can be told apart.
+MAGIC = b"\xffv"
+HEADER_SIZE = 4
+_DTYPE_CODES = {DTYPE_FLOAT32: 0, DTYPE_FLOAT16: 1, DTYPE_INT8: 2}
+_POOLING_CODES = {POOLING_CLS: 0, POOLING_MEAN: 1}
+_DTYPE_NAMES = {code: name for name, code in _DTYPE_CODES.items()}
+_POOLING_NAMES = {code: name for name, code in _POOLING_CODES.items()}
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    """
+    The vector as float32, scaled to unit length; a zero vector stays zero.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm > 0 else vector
+
+
+def quantize_int8(vector: np.ndarray) -> tuple[float, np.ndarray]:
+    """
+    Symmetric int8 quantization of a normalized vector: its scale, and its values divided by the scale.
+    """
+    scale = float(np.abs(vector).max(initial=0.0)) / 127 or 1.0
+    return scale, np.round(vector / scale).astype(np.int8)
+
+
+def encode_vector(vector: np.ndarray, dtype: str = DTYPE_FLOAT32, pooling: str = POOLING_CLS) -> bytes:
+    """
+    Encode a normalized vector for storage.
+
+    float16 halves the size of a float32 vector; int8 quarters it, with a float32 scale per vector.
+    """
+    header = MAGIC + bytes([_DTYPE_CODES[dtype], _POOLING_CODES[pooling]])
+    vector = normalize(vector)
+    if dtype == DTYPE_FLOAT32:
+        return header + vector.tobytes()
+    if dtype == DTYPE_FLOAT16:
+        return header + vector.astype(np.float16).tobytes()
+    scale, quantized = quantize_int8(vector)
+    return header + np.float32(scale).tobytes() + quantized.tobytes()
+
+
+def vector_format(data: bytes | list[int]) -> Optional[tuple[str, str]]:
+    """
+    The (dtype, pooling) of an encoded vector, or None for a legacy vector.
+    """
+    data = bytes(data)
+    if len(data) < HEADER_SIZE or data[:2] != MAGIC:
+        return None
+    dtype, pooling = _DTYPE_NAMES.get(data[2]), _POOLING_NAMES.get(data[3])
+    if dtype is None or pooling is None:
+        return None
+    return dtype, pooling
+
+
+def decode_vector(data: bytes | list[int]) -> np.ndarray:
+    """
+    Decode a stored vector to a normalized float32 vector. Legacy vectors are normalized as they're read.
+    """
+    data = bytes(data)
+    format = vector_format(data)
+    if format is None:
+        return normalize(np.frombuffer(data, dtype=np.float32))
+    dtype, _ = format
+    if dtype == DTYPE_FLOAT32:
+        return np.frombuffer(data, dtype=np.float32, offset=HEADER_SIZE)
+    if dtype == DTYPE_FLOAT16:
+        return np.frombuffer(data, dtype=np.float16, offset=HEADER_SIZE).astype(np.float32)
+    scale = np.frombuffer(data, dtype=np.float32, count=1, offset=HEADER_SIZE)[0]
+    return np.frombuffer(data, dtype=np.int8, offset=HEADER_SIZE + 4).astype(np.float32) * scale
+
+
+def similarity(query: np.ndarray, vectors: Iterable[np.ndarray]) -> np.ndarray:
+    """
+    The inner product of a normalized query with each normalized vector, as a single matrix product.
+
+    Vectors of another dimension (missing, or from another model) score zero.
+    """
+    query = normalize(query)
+    vectors = list(vectors)
+    scores = np.zeros(len(vectors), dtype=np.float32)
+    rows = [i for i, v in enumerate(vectors) if v.shape == query.shape]
+    if len(rows) > 0:
+        scores[rows] = np.stack([vectors[i] for i in rows]) @ query
+    return scores
@@ -0,0 +1,310 @@
+# aim/conversation/writer.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock, appends and rewrites are only kept apart within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def lock_path(path: Path) -> Path:
+    """The lock file of a file; it outlives the file being replaced or removed"""
+    return path.with_name(f".{path.name}.lock")
+
+
+@contextmanager
+def file_lock(path: Path, exclusive: bool = True) -> Iterator[None]:
+    """
+    Lock a file against other processes, through its lock file. Appends share the lock; reading and rewriting
+    the file, or removing it, hold it exclusively.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path(path), 'ab') as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def fsync_dir(path: Path) -> None:
+    """
+    Sync a directory, so a rename or unlink inside it is durable.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        # Not every platform lets us open a directory
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, lines: Iterable[str]) -> None:
+    """
+    Replace a file with the given lines, writing to a temporary file and renaming it into place.
+
+    A crash leaves either the old file or the new one, never a truncated mix of the two.
+    """
+    temp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with open(temp_path, 'w') as f:
+            for line in lines:
+                f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    fsync_dir(path.parent)
+
+
+@dataclass
+class PooledFile:
+    """
+    A pooled file, with its lock file, which stays open while it's pooled, so appends only flock it.
+    """
+    lock_file : Optional[BinaryIO] = None
+    handle : Optional[BinaryIO] = None
+    # Appenders using it; it isn't evicted while there are any
+    users : int = 0
+    # Appenders holding the shared lock; the first takes it and the last releases it, as they share the fd
+    holders : int = 0
+    guard : threading.Lock = field(default_factory=threading.Lock)
+
+
+class ConversationWriter:
+    """
+    Appends to conversation files through a bounded LRU pool of open file handles, with group commit.
+
+    Every append is written and flushed to the OS straight away. A single committer thread then fsyncs all
+    the files written to since its last pass, and wakes every appender waiting on that batch; appenders
+    arriving while a commit is in progress share the next one, so a burst of messages costs one fsync per file.
+
+    Appends share a file's lock with other processes, and a pooled handle is reopened if the file was replaced
+    or removed since it was opened, so nothing is appended to an unlinked file. Whoever replaces or removes a
+    file holds its lock exclusively, from reading it until it's replaced.
+    """
+
+    def __init__(self, max_handles: int = 32, commit_interval: float = 0.005, recover: Optional[Callable[[Path], int]] = None):
+        self.max_handles = max_handles
+        self.commit_interval = commit_interval
+        # Repairs a torn trailing line before we append after it
+        self.recover = recover
+        self.handles : OrderedDict[Path, PooledFile] = OrderedDict()
+        self.dirty : set[Path] = set()
+        self.written = 0
+        self.synced = 0
+        self.lock = threading.Lock()
+        self.committed = threading.Condition(self.lock)
+        # One commit at a time, so a commit never reports another's files as synced before they are
+        self.committing = threading.Lock()
+        self.committer : Optional[threading.Thread] = None
+
+    def _pooled(self, path: Path) -> PooledFile:
+        pooled = self.handles.get(path)
+        if pooled is None:
+            pooled = PooledFile(lock_file=open(lock_path(path), 'ab') if fcntl is not None else None)
+            self.handles[path] = pooled
+        self.handles.move_to_end(path)
+        return pooled
+
+    def _evict(self) -> None:
+        """Close the least recently used files beyond the pool's size, that no appender is using"""
+        for path in list(self.handles):
+            if len(self.handles) <= self.max_handles:
+                break
+            pooled = self.handles[path]
+            if pooled.users == 0:
+                del self.handles[path]
+                self._close(path, pooled)
+
+    def _handle(self, path: Path, pooled: PooledFile) -> BinaryIO:
+        if pooled.handle is not None:
+            if self._current(path, pooled.handle):
+                return pooled.handle
+            logger.info(f"{path} was replaced, reopening it")
+            self._close_handle(path, pooled)
+
+        if self.recover is not None and path.exists():
+            self.recover(path)
+        pooled.handle = open(path, 'ab')
+        return pooled.handle
+
+    @staticmethod
+    def _current(path: Path, handle: BinaryIO) -> bool:
+        """Whether a handle is still open on the file at its path"""
+        try:
+            opened, current = os.fstat(handle.fileno()), os.stat(path)
+        except FileNotFoundError:
+            return False
+        return (opened.st_ino, opened.st_dev) == (current.st_ino, current.st_dev)
+
+    def _close_handle(self, path: Path, pooled: PooledFile) -> None:
+        """Sync and close a pooled file's handle, keeping its lock file open"""
+        if pooled.handle is None:
+            return
+        try:
+            if path in self.dirty:
+                os.fsync(pooled.handle.fileno())
+                self.dirty.discard(path)
+        finally:
+            pooled.handle.close()
+            pooled.handle = None
+
+    def _close(self, path: Path, pooled: PooledFile) -> None:
+        try:
+            self._close_handle(path, pooled)
+        finally:
+            if pooled.lock_file is not None:
+                pooled.lock_file.close()
+
+    @contextmanager
+    def _shared(self, pooled: PooledFile) -> Iterator[None]:
+        """Share a pooled file's lock with other appenders, in any process"""
+        if pooled.lock_file is None:
+            yield
+            return
+        with pooled.guard:
+            if pooled.holders == 0:
+                fcntl.flock(pooled.lock_file, fcntl.LOCK_SH)
+            pooled.holders += 1
+        try:
+            yield
+        finally:
+            with pooled.guard:
+                pooled.holders -= 1
+                if pooled.holders == 0:
+                    fcntl.flock(pooled.lock_file, fcntl.LOCK_UN)
+
+    def append(self, path: Path, data: str, sync: bool = True) -> int:
+        """
+        Append to a file. With `sync`, waits until the data is on disk.
+
+        Returns:
+            The commit ticket of the append, to `wait` on later if not synced now.
+        """
+        with self.lock:
+            pooled = self._pooled(path)
+            pooled.users += 1
+        try:
+            # The file lock is taken before ours, as whoever rewrites the file takes it before calling `rewrite`
+            with self._shared(pooled), self.lock:
+                created = not path.exists()
+                handle = self._handle(path, pooled)
+                handle.write(data.encode('utf-8'))
+                handle.flush()
+                self.dirty.add(path)
+                if created:
+                    self.dirty.add(path.parent)
+                self.written += 1
+                ticket = self.written
+        finally:
+            with self.lock:
+                pooled.users -= 1
+                self._evict()
+
+        if sync:
+            self.wait(ticket)
+        return ticket
+
+    def wait(self, ticket: int) -> None:
+        """
+        Wait until the commit that covers an append's ticket is done.
+        """
+        with self.lock:
+            if self.committer is None or not self.committer.is_alive():
+                self.committer = threading.Thread(target=self._commit_loop, name="conversation-commit", daemon=True)
+                self.committer.start()
+            self.committed.notify_all()
+            while self.synced < ticket:
+                self.committed.wait()
+
+    def _commit_loop(self) -> None:
+        while True:
+            with self.lock:
+                while len(self.dirty) == 0:
+                    self.committed.wait()
+            # Give concurrent appenders a moment to join this commit
+            time.sleep(self.commit_interval)
+            self._commit()
+
+    def _commit(self) -> None:
+        """
+        Sync every dirty file. Our lock is only held to take the dirty files, so appends carry on during the
+        fsyncs; each file is synced through a duplicate of its handle, in case the handle is closed meanwhile.
+        """
+        with self.committing:
+            with self.lock:
+                ticket = self.written
+                dirty, self.dirty = self.dirty, set()
+                fds = {path: os.dup(self.handles[path].handle.fileno()) for path in dirty
+                       if path in self.handles and self.handles[path].handle is not None}
+            for path in dirty:
+                try:
+                    if path in fds:
+                        os.fsync(fds[path])
+                    elif path.is_dir():
+                        fsync_dir(path)
+                except OSError as e:
+                    logger.error(f"Error syncing {path}: {e}")
+                finally:
+                    if path in fds:
+                        os.close(fds[path])
+            with self.lock:
+                self.synced = max(self.synced, ticket)
+                self.committed.notify_all()
+
+    def flush(self) -> None:
+        """
+        Sync everything written so far.
+        """
+        self._commit()
+
+    def release(self, path: Path) -> None:
+        """
+        Sync and close the handle for a file, before it is replaced or removed.
+        """
+        with self.lock:
+            pooled = self.handles.get(path)
+            if pooled is not None:
+                self._close_handle(path, pooled)
+
+    def rewrite(self, path: Path, lines: Iterable[str]) -> None:
+        """
+        Atomically replace a file, closing any open handle to the old one first. Hold `file_lock(path)` from
+        reading what is rewritten until this returns.
+        """
+        with self.lock:
+            pooled = self.handles.get(path)
+            if pooled is not None:
+                self._close_handle(path, pooled)
+            atomic_write(path, lines)
+
+    def close(self) -> None:
+        """
+        Sync and close every open handle.
+        """
+        self._commit()
+        with self.lock:
+            for path, pooled in list(self.handles.items()):
+                self._close(path, pooled)
+            self.handles.clear()
@@ -0,0 +1,233 @@
+# aim/io/document_index.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from pathlib import Path
+from typing import Optional
+import logging
+import re
+import threading
+
+import pandas as pd
+from tantivy import Index, Document as TantivyDocument, SchemaBuilder, Query, Occur
+
+from ..config import ChatConfig
+from ..conversation.embedding import HuggingFaceEmbedding
+from ..conversation.vectors import DTYPE_FLOAT32, decode_vector, encode_vector, similarity
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLUMNS = ['document', 'chunk_no', 'offset', 'content']
+
+# One index per path in the process, so every Library shares its writer
+_indexes : dict[Path, "DocumentIndex"] = {}
+_indexes_lock = threading.Lock()
+
+
+def chunk_text(text: str, chunk_size: int = 1500) -> list[tuple[int, str]]:
+    """
+    Split a document into chunks of about `chunk_size` characters, on paragraph boundaries where possible.
+
+    Returns:
+        A list of (character offset, chunk text) tuples, in document order.
+    """
+    chunks : list[tuple[int, str]] = []
+    start, end = None, 0
+    for match in re.finditer(r"\S(?:.|\n(?!\s*\n))*", text):
+        p_start, p_end = match.span()
+        if start is not None and p_end - start > chunk_size:
+            chunks.append((start, text[start:end]))
+            start = None
+        # Paragraphs longer than a chunk are hard split
+        while p_end - p_start > chunk_size:
+            chunks.append((p_start, text[p_start:p_start + chunk_size]))
+            p_start += chunk_size
+        if start is None:
+            start = p_start
+        end = p_end
+    if start is not None:
+        chunks.append((start, text[start:end]))
+    return chunks
+
+
+class DocumentIndex:
+    """
+    Tantivy-based full-text and vector index of the chunks of the documents in the library.
+
+    This index is kept separate from the conversation index. Each document is indexed with its modification
+    time, so stale documents can be detected and re-indexed on read.
+    """
+
+    def __init__(self, index_path: Path, vectorizer: Optional[HuggingFaceEmbedding] = None, chunk_size: int = 1500,
+                 vector_dtype: str = DTYPE_FLOAT32):
+        self.index_path = index_path
+        self.vectorizer = vectorizer
+        self.chunk_size = chunk_size
+        self.vector_dtype = vector_dtype
+        self.lock = threading.Lock()
+
+        builder = SchemaBuilder()
+        builder.add_text_field("document", stored=True, tokenizer_name="raw")
+        builder.add_integer_field("chunk_no", stored=True)
+        builder.add_integer_field("offset", stored=True)
+        builder.add_integer_field("mtime_ns", stored=True)
+        builder.add_text_field("content", stored=True, tokenizer_name="en_stem")
+        builder.add_bytes_field("index_a", stored=True)
+
+        self.schema = builder.build()
+        self.index_path.mkdir(parents=True, exist_ok=True)
+        self.index = Index(self.schema, str(self.index_path))
+
+    def _document_query(self, document: str) -> Query:
+        return Query.term_query(schema=self.schema, field_name="document", field_value=document)
+
+    def indexed_mtime(self, document: str) -> Optional[int]:
+        """
+        The modification time of the indexed version of a document, or None if it isn't indexed.
+        """
+        searcher = self.index.searcher()
+        results = searcher.search(self._document_query(document), limit=1)
+        if not results.hits:
+            return None
+        _, doc_addr = results.hits[0]
+        return searcher.doc(doc_addr).get_first("mtime_ns")
+
+    def add_document(self, document: str, text: str, mtime_ns: int) -> int:
+        """
+        Chunk and index a document, replacing any previously indexed version.
+
+        Returns:
+            The number of chunks indexed.
+        """
+        chunks = chunk_text(text, self.chunk_size)
+        if self.vectorizer is not None and len(chunks) > 0:
+            vectors = [encode_vector(v, self.vector_dtype, self.vectorizer.pooling) for v in self.vectorizer.transform([c for _, c in chunks])]
+        else:
+            vectors = [b""] * len(chunks)
+
+        with self.lock:
+            writer = self.index.writer()
+            writer.delete_documents("document", document)
+            for chunk_no, ((offset, content), vector) in enumerate(zip(chunks, vectors)):
+                writer.add_document(TantivyDocument(
+                    document=document,
+                    chunk_no=chunk_no,
+                    offset=offset,
+                    mtime_ns=mtime_ns,
+                    content=content,
+                    index_a=vector,
+                ))
+            writer.commit()
+            self.index.reload()
+        logger.info(f"Indexed {document}: {len(chunks)} chunks")
+        return len(chunks)
+
+    def remove_document(self, document: str) -> None:
+        """
+        Remove all chunks of a document from the index.
+        """
+        with self.lock:
+            writer = self.index.writer()
+            writer.delete_documents("document", document)
+            writer.commit()
+            self.index.reload()
+        logger.info(f"Removed {document} from the document index")
+
+    def indexed_documents(self) -> dict[str, int]:
+        """
+        All indexed documents, with the modification time of their indexed version.
+        """
+        searcher = self.index.searcher()
+        if searcher.num_docs == 0:
+            return {}
+        results = searcher.search(Query.all_query(), limit=searcher.num_docs)
+        documents = {}
+        for _, doc_addr in results.hits:
+            doc = searcher.doc(doc_addr)
+            documents[doc.get_first("document")] = doc.get_first("mtime_ns")
+        return documents
+
+    def _text_query(self, query_texts: list[str]) -> Optional[Query]:
+        text_subqueries = []
+        for query_text in query_texts:
+            query_text = re.sub(r"\s+", ' ', re.sub(r'[^\w\s]|\n', ' ', query_text)).strip().lower()
+            if len(query_text) > 0:
+                text_subqueries.append((Occur.Should, self.index.parse_query(query=query_text, default_field_names=["content"])))
+        if len(text_subqueries) == 0:
+            return None
+        return Query.boolean_query(text_subqueries)
+
+    def _to_frame(self, searcher, hits: list[tuple[float, object]]) -> pd.DataFrame:
+        rows = []
+        for score, doc_addr in hits:
+            doc = searcher.doc(doc_addr)
+            row = {k: doc.get_first(k) for k in CHUNK_COLUMNS}
+            row['bm25'] = score
+            row['index_a'] = decode_vector(doc.get_first("index_a"))
+            rows.append(row)
+        return pd.DataFrame(rows, columns=CHUNK_COLUMNS + ['bm25', 'index_a'])
+
+    def _score(self, results: pd.DataFrame, query_texts: list[str]) -> pd.DataFrame:
+        """
+        Hybrid score: the BM25 score normalized to the best hit, plus the cosine similarity to the query.
+        """
+        max_bm25 = results['bm25'].max()
+        score = results['bm25'] / max_bm25 if max_bm25 > 0 else results['bm25'] * 0
+        if self.vectorizer is not None and len(query_texts) > 0:
+            query_vector = self.vectorizer(" ".join(query_texts))
+            score = score + similarity(query_vector, results['index_a'])
+        results = results.assign(score=score)
+        return results.drop(columns=['index_a'])
+
+    def search(self, query_texts: list[str], document: Optional[str] = None, top_n: int = 10) -> pd.DataFrame:
+        """
+        Ranked search over the chunks of the library, or of a single document.
+        """
+        text_query = self._text_query(query_texts)
+        if text_query is None:
+            return pd.DataFrame(columns=CHUNK_COLUMNS + ['bm25', 'score'])
+        subqueries = [(Occur.Must, text_query)]
+        if document is not None:
+            subqueries.append((Occur.Must, self._document_query(document)))
+
+        searcher = self.index.searcher()
+        # Over-fetch by BM25, so the vector rerank has some candidates to choose from
+        hits = searcher.search(Query.boolean_query(subqueries), limit=top_n * 4).hits
+        if len(hits) == 0:
+            return pd.DataFrame(columns=CHUNK_COLUMNS + ['bm25', 'score'])
+        results = self._score(self._to_frame(searcher, hits), query_texts)
+        return results.sort_values('score', ascending=False).head(top_n)
+
+    def relevant_chunks(self, document: str, query_texts: list[str], top_n: int = 8) -> pd.DataFrame:
+        """
+        The `top_n` chunks of a document most relevant to the queries, in document order.
+        """
+        searcher = self.index.searcher()
+        document_query = self._document_query(document)
+        text_query = self._text_query(query_texts)
+        if text_query is not None:
+            # Every chunk of the document matches, and the text query only adds to the score
+            query = Query.boolean_query([(Occur.Must, document_query), (Occur.Should, text_query)])
+        else:
+            query = document_query
+
+        total = searcher.search(document_query, limit=1, count=True).count
+        if total == 0:
+            return pd.DataFrame(columns=CHUNK_COLUMNS + ['bm25', 'score'])
+        hits = searcher.search(query, limit=total).hits
+        results = self._score(self._to_frame(searcher, hits), query_texts)
+        results = results.sort_values(['score', 'chunk_no'], ascending=[False, True]).head(top_n)
+        return results.sort_values('chunk_no')
+
+    @classmethod
+    def from_config(cls, config: ChatConfig, vectorizer: Optional[HuggingFaceEmbedding] = None) -> "DocumentIndex":
+        """
+        The document index of the process, created on first use, loading the embedding model if one isn't given.
+        """
+        index_path = Path('.', config.memory_path, 'documents').resolve()
+        with _indexes_lock:
+            if index_path not in _indexes:
+                if vectorizer is None:
+                    vectorizer = HuggingFaceEmbedding.from_config(config)
+                _indexes[index_path] = cls(index_path, vectorizer=vectorizer, chunk_size=config.document_chunk_size,
+                                           vector_dtype=config.vector_dtype)
+            return _indexes[index_path]
@@ -1,17 +1,149 @@
 # aim/io/documents.py
-# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
 
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
 import os
-from typing import List, Dict, Tuple
+import threading
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
 import chardet
 
+if TYPE_CHECKING:
+    from .document_index import DocumentIndex
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedDocument:
+    """
+    A decoded document, valid for one version (mtime and size) of the file.
+    """
+    mtime_ns: int
+    size: int
+    encoding: str
+    text: str
+
+
+class DocumentCache:
+    """
+    A bounded cache of decoded documents, keyed by path and validated against the file's mtime and size.
+
+    Encoding detection and decoding happen once per file version; the least recently used documents are
+    evicted when the decoded text exceeds `max_chars`.
+    """
+    def __init__(self, max_chars: int = 64 * 1024 * 1024):
+        self.max_chars = max_chars
+        self.total_chars = 0
+        self.entries : OrderedDict[str, CachedDocument] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path: str, mtime_ns: int, size: int) -> Optional[CachedDocument]:
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            if entry.mtime_ns != mtime_ns or entry.size != size:
+                self._remove(path)
+                return None
+            self.entries.move_to_end(path)
+            return entry
+
+    def put(self, path: str, entry: CachedDocument) -> None:
+        with self.lock:
+            self._remove(path)
+            if len(entry.text) > self.max_chars:
+                return
+            self.entries[path] = entry
+            self.total_chars += len(entry.text)
+            while self.total_chars > self.max_chars:
+                evicted, _ = next(iter(self.entries.items()))
+                self._remove(evicted)
+
+    def invalidate(self, path: str) -> None:
+        with self.lock:
+            self._remove(path)
+
+    def _remove(self, path: str) -> None:
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.total_chars -= len(entry.text)
+
+
+# Documents are shared across every Library in the process
+_document_cache = DocumentCache()
+_watchers : dict[str, object] = {}
+_watchers_lock = threading.Lock()
+# Documents being indexed in the background
+_indexing : set[str] = set()
+_indexing_lock = threading.Lock()
+
+
+def decode_document(raw_data: bytes) -> Tuple[str, str]:
+    """
+    Decode the raw bytes of a document, detecting the encoding if it isn't UTF-8.
+
+    Returns:
+        A tuple of the decoded text and the encoding used.
+    """
+    try:
+        return raw_data.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    encoding = chardet.detect(raw_data)['encoding']
+    if encoding is not None:
+        try:
+            return raw_data.decode(encoding), encoding
+        except (UnicodeDecodeError, LookupError):
+            pass
+    return raw_data.decode('utf-8', errors='replace'), 'utf-8'
+
+
 class Library:
     """
     Wraps a directory of documents, and provides a way to query them.
     """
-    def __init__(self, documents_dir: str):
+    def __init__(self, documents_dir: str, cache: Optional[DocumentCache] = None, watch: bool = False, index: Optional["DocumentIndex"] = None):
         self.documents_dir = documents_dir
         self.extensions = {'org', 'txt', 'md', 'py', 'js', 'ts', 'json', 'yaml', 'yml', 'csv', 'log', 'xml', 'html', 'css', 'svelte'}
+        self.cache = cache if cache is not None else _document_cache
+        self.index = index
+        if watch:
+            self.watch()
+
+    def watch(self) -> None:
+        """
+        Watch the documents directory, dropping cached documents as soon as their files change.
+        """
+        if self.documents_dir is None or not os.path.isdir(self.documents_dir):
+            return
+
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+
+        cache = self.cache
+
+        class Invalidator(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                cache.invalidate(os.path.abspath(event.src_path))
+                dest_path = getattr(event, 'dest_path', None)
+                if dest_path:
+                    cache.invalidate(os.path.abspath(dest_path))
+
+        watch_path = os.path.abspath(self.documents_dir)
+        with _watchers_lock:
+            if watch_path in _watchers:
+                return
+            observer = Observer()
+            observer.daemon = True
+            observer.schedule(Invalidator(), path=watch_path, recursive=False)
+            observer.start()
+            _watchers[watch_path] = observer
+            logger.info(f"Watching {watch_path} for document changes")
 
     @property
     def list_documents(self) -> List[Tuple[str, float, int]]:
@@ -21,14 +153,13 @@ class Library:
         Returns:
         A list of tuples, each containing the document name, last modified time, and file size.
         """
+        extensions = tuple(self.extensions)
         files = []
-        for f in os.listdir(self.documents_dir):
-            for ext in self.extensions:
-                last_modified = os.path.getmtime(os.path.join(self.documents_dir, f))
-                file_size = os.path.getsize(os.path.join(self.documents_dir, f))
-                if f.endswith(ext):
-                    files.append((f, last_modified, file_size))
-                    break
+        with os.scandir(self.documents_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(extensions) and entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.name, stat.st_mtime, stat.st_size))
         return files
 
     def exists(self, document_name: str) -> bool:
@@ -37,35 +168,139 @@ class Library:
         """
         return os.path.exists(os.path.join(self.documents_dir, document_name))
 
+    def _load(self, document_name: str) -> CachedDocument:
+        file_path = os.path.abspath(os.path.join(self.documents_dir, document_name))
+
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Document '{document_name}' not found in the library.")
+
+        entry = self.cache.get(file_path, stat.st_mtime_ns, stat.st_size)
+        if entry is not None:
+            return entry
+
+        with open(file_path, 'rb') as file:
+            raw_data = file.read()
+
+        text, encoding = decode_document(raw_data)
+        entry = CachedDocument(mtime_ns=stat.st_mtime_ns, size=stat.st_size, encoding=encoding, text=text)
+        # Only cache what we read if the file didn't change underneath us
+        if len(raw_data) == stat.st_size:
+            self.cache.put(file_path, entry)
+        return entry
+
     def read_document(self, document_name: str) -> str:
         """
         Read a document from the library, fixing any encoding issues.
         """
+        return self._load(document_name).text
+
+    def document_encoding(self, document_name: str) -> str:
+        """
+        The detected encoding of a document in the library.
+        """
+        return self._load(document_name).encoding
+
+    def index_document(self, document_name: str) -> None:
+        """
+        Index a document, if it isn't indexed already at its current version.
+        """
+        if self.index is None:
+            return
         file_path = os.path.join(self.documents_dir, document_name)
-        
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"Document '{document_name}' not found in the library.")
-        
-        with open(file_path, 'rb') as file:
-            raw_data = file.read()
-        
-        detected = chardet.detect(raw_data)
-        encoding = detected['encoding']
-        
-        try:
-            return raw_data.decode(encoding)
-        except UnicodeDecodeError:
-            return raw_data.decode('utf-8', errors='replace')
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        if self.index.indexed_mtime(document_name) != mtime_ns:
+            self.index.add_document(document_name, self.read_document(document_name), mtime_ns)
+
+    def index_in_background(self, document_name: str) -> None:
+        """
+        Index a document in a background thread, unless it is being indexed already.
+        """
+        file_path = os.path.abspath(os.path.join(self.documents_dir, document_name))
+        with _indexing_lock:
+            if file_path in _indexing:
+                return
+            _indexing.add(file_path)
+
+        def run():
+            try:
+                self.index_document(document_name)
+            except Exception as e:
+                logger.error(f"Error indexing {document_name}: {e}")
+            finally:
+                with _indexing_lock:
+                    _indexing.discard(file_path)
+
+        threading.Thread(target=run, name="document-index", daemon=True).start()
+
+    def remove_document(self, document_name: str) -> None:
+        """
+        Remove a document from the library, and from the index.
+        """
+        file_path = os.path.join(self.documents_dir, document_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        self.cache.invalidate(os.path.abspath(file_path))
+        if self.index is not None:
+            self.index.remove_document(document_name)
+
+    def sync_index(self) -> None:
+        """
+        Bring the index up to date with the library: index new and changed documents, and drop removed ones.
+        """
+        if self.index is None or self.documents_dir is None or not os.path.isdir(self.documents_dir):
+            return
+        indexed = self.index.indexed_documents()
+        present = set()
+        for doc_name, _, _ in self.list_documents:
+            present.add(doc_name)
+            try:
+                self.index_document(doc_name)
+            except Exception as e:
+                logger.error(f"Error indexing {doc_name}: {e}")
+        for doc_name in set(indexed.keys()) - present:
+            self.index.remove_document(doc_name)
+
+    def relevant_chunks(self, document_name: str, query_texts: list[str], top_n: int = 8) -> Optional[List[Tuple[int, str]]]:
+        """
+        The chunks of a document most relevant to the queries, as (offset, text) tuples in document order.
+
+        Returns None if there is no index, or the current version of the document isn't indexed yet; it is then
+        indexed in the background rather than holding up the caller.
+        """
+        if self.index is None:
+            return None
+        mtime_ns = os.stat(os.path.join(self.documents_dir, document_name)).st_mtime_ns
+        if self.index.indexed_mtime(document_name) != mtime_ns:
+            self.index_in_background(document_name)
+            return None
+        chunks = self.index.relevant_chunks(document_name, query_texts, top_n=top_n)
+        return [(row['offset'], row['content']) for _, row in chunks.iterrows()]
 
     def search_documents(self, query: str) -> Dict[str, List[str]]:
         """
         Search for a query across all documents in the library.
-        Returns a dictionary with document names as keys and lists of matching lines as values.
+        Returns a dictionary with document names as keys and lists of matching lines (or chunks, ranked, for the
+        documents indexed at their current version) as values.
         """
         results = {}
-        for doc_name, _, _ in self.list_documents:
+        scanned = [doc_name for doc_name, _, _ in self.list_documents]
+        if self.index is not None:
+            # Documents not indexed at their current version are scanned line by line, and indexed meanwhile
+            current = {doc_name for doc_name in scanned if self.index.indexed_mtime(doc_name) ==
+                       os.stat(os.path.join(self.documents_dir, doc_name)).st_mtime_ns}
+            for _, row in self.index.search([query]).iterrows():
+                if row['document'] in current:
+                    results.setdefault(row['document'], []).append(row['content'])
+            scanned = [doc_name for doc_name in scanned if doc_name not in current]
+            for doc_name in scanned:
+                self.index_in_background(doc_name)
+
+        lowered = query.lower()
+        for doc_name in scanned:
             content = self.read_document(doc_name)
-            matching_lines = [line.strip() for line in content.split('\n') if query.lower() in line.lower()]
+            matching_lines = [line.strip() for line in content.split('\n') if lowered in line.lower()]
             if matching_lines:
                 results[doc_name] = matching_lines
         return results
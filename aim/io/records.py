@@ -0,0 +1,168 @@
+# aim/io/records.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from ..conversation.writer import atomic_write
+
+logger = logging.getLogger(__name__)
+
+FORMAT_JSONL = "jsonl"
+FORMAT_PARQUET = "parquet"
+FORMATS = (FORMAT_JSONL, FORMAT_PARQUET)
+
+
+def record_format(path: Path | str, format: Optional[str] = None) -> str:
+    """The format of a record file: as given, or by its suffix"""
+    if format is not None:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown record format {format}, expected one of {', '.join(FORMATS)}")
+        return format
+    return FORMAT_PARQUET if Path(path).suffix == ".parquet" else FORMAT_JSONL
+
+
+def _parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Parquet needs pyarrow installed") from e
+    return pa, pq
+
+
+def record_count(path: Path | str, format: Optional[str] = None) -> int:
+    """
+    The size of a record file in positions, for progress: bytes for JSONL, rows for Parquet.
+    """
+    if record_format(path, format) == FORMAT_PARQUET:
+        _, pq = _parquet()
+        return pq.ParquetFile(path).metadata.num_rows
+    return Path(path).stat().st_size
+
+
+def read_records(path: Path | str, format: Optional[str] = None, position: int = 0,
+                 batch_size: int = 1000) -> Iterator[tuple[dict[str, Any], int]]:
+    """
+    Stream the records of a JSONL or Parquet file, starting from a position, in constant memory.
+
+    Yields:
+        Each record, and the position just after it: the byte offset for JSONL, the row number for Parquet.
+        Reading again from a yielded position resumes after that record.
+    """
+    if record_format(path, format) == FORMAT_PARQUET:
+        _, pq = _parquet()
+        row = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            if row + batch.num_rows <= position:
+                row += batch.num_rows
+                continue
+            for record in batch.to_pylist():
+                row += 1
+                if row > position:
+                    yield record, row
+        return
+
+    with open(path, 'rb') as f:
+        f.seek(position)
+        offset = position
+        for line in f:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                if line.endswith(b'\n'):
+                    raise
+                # A torn trailing line, from a dump still being written
+                logger.warning(f"Skipping torn line at the end of {path}")
+                return
+            yield record, offset
+
+
+class RecordWriter:
+    """
+    Writes records to a JSONL or Parquet file in batches, in constant memory.
+
+    JSONL is appended from a position, truncating whatever was written after it, so an interrupted export
+    can be resumed; Parquet is written from scratch, a row group per batch.
+    """
+
+    def __init__(self, path: Path | str, format: Optional[str] = None, position: int = 0):
+        self.path = Path(path)
+        self.format = record_format(path, format)
+        self._writer = None
+        if self.format == FORMAT_PARQUET:
+            if position > 0:
+                raise ValueError("Parquet files can't be resumed")
+            self._file = None
+        else:
+            self._file = open(self.path, 'r+b' if position > 0 else 'wb')
+            self._file.truncate(position)
+            self._file.seek(position)
+
+    @property
+    def position(self) -> int:
+        """The position to resume from, once the records written so far are flushed"""
+        if self._file is not None:
+            return self._file.tell()
+        return 0
+
+    def write(self, records: list[dict[str, Any]]) -> None:
+        if len(records) == 0:
+            return
+        if self.format == FORMAT_PARQUET:
+            pa, pq = _parquet()
+            if self._writer is None:
+                schema = pa.Table.from_pylist(records).schema
+                # Columns that are all empty in the first batch may hold text later
+                schema = pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema])
+                self._writer = pq.ParquetWriter(self.path, schema)
+            self._writer.write_table(pa.Table.from_pylist(records, schema=self._writer.schema))
+            return
+        self._file.write("".join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+
+    def flush(self) -> None:
+        """Make the records written so far durable"""
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class Checkpoint:
+    """
+    The progress of a resumable export or import, kept in a small JSON file replaced atomically.
+    """
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+    def load(self) -> Optional[dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        return json.loads(self.path.read_text())
+
+    def save(self, state: dict[str, Any]) -> None:
+        atomic_write(self.path, [json.dumps(state) + '\n'])
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,213 @@
+# aim/llm/cache.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from concurrent.futures import Future
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Any, Callable, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Without flock, identical requests are only coalesced within a process
+    fcntl = None
+
+from ..config import ChatConfig
+from ..conversation.writer import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+def completion_key(model: Optional[str], messages: list[dict[str, str]], config: ChatConfig) -> str:
+    """
+    The content address of a completion: a hash of the model, the sampler parameters, the system message
+    and every message sent.
+    """
+    request = {
+        "model": model,
+        "system": config.system_message,
+        "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "sampler": {
+            "max_tokens": config.max_tokens,
+            "temperature": config.temperature,
+            "top_p": config.top_p,
+            "top_k": config.top_k,
+            "min_p": config.min_p,
+            "presence_penalty": config.presence_penalty,
+            "frequency_penalty": config.frequency_penalty,
+            "repetition_penalty": config.repetition_penalty,
+            "seed": config.seed,
+            "stop_sequences": config.stop_sequences,
+            "response_format": config.response_format,
+            "generations": config.generations,
+        },
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CompletionCache:
+    """
+    Completions on disk, one file per content address, kept for `ttl` seconds.
+
+    Every completion is stored, but only reused when asked to: for deterministic requests, or when a failed
+    job is resumed, so its steps that already succeeded replay from here and generation picks up at the step
+    that failed. While a completion is being generated, identical requests wait for it instead of generating
+    their own; within a process on a future, across processes on a lock file.
+    """
+
+    def __init__(self, cache_path: Optional[str], ttl: float = 7 * 24 * 3600):
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.inflight : dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        if self.cache_path is not None:
+            self.cache_path.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: ChatConfig) -> "CompletionCache":
+        return cls(config.completion_cache_path, ttl=config.completion_cache_ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self.cache_path is not None
+
+    def _path(self, key: str) -> Path:
+        return self.cache_path / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            if self.ttl > 0 and time.time() - path.stat().st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                return None
+            return json.loads(path.read_text())["response"]
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError) as e:
+            logger.warning(f"Dropping unreadable completion {key}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, key: str, response: str, model: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        atomic_write(self._path(key), [json.dumps({"model": model, "response": response, "created": int(time.time())})])
+
+    def discard(self, key: str) -> None:
+        """Forget a completion that was rejected, so it isn't reused"""
+        if self.enabled:
+            self._path(key).unlink(missing_ok=True)
+
+    def generate(self, key: str, generate: Callable[[], str], reuse: bool = False, model: Optional[str] = None) -> str:
+        """
+        The completion for `key`: stored, when `reuse` allows; otherwise from `generate`, which is stored for
+        later. Only reusable requests are coalesced; the others each want their own sample.
+        """
+        if not self.enabled:
+            return generate()
+        if not reuse:
+            response = generate()
+            self.put(key, response, model)
+            return response
+
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            logger.info(f"Reusing completion {key[:12]}")
+            return response
+
+        with self.lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if not owner:
+            self.coalesced += 1
+            logger.info(f"Waiting on identical completion {key[:12]}")
+            try:
+                return future.result()
+            except Exception:
+                # Their generation failed; ours may not
+                return self.generate(key, generate, reuse=reuse, model=model)
+
+        try:
+            response = self._generate_locked(key, generate, model)
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _lock_path(self, key: str) -> Path:
+        return self.cache_path / f".{key}.lock"
+
+    def _generate_locked(self, key: str, generate: Callable[[], str], model: Optional[str]) -> str:
+        """Generate under the key's lock file, unless another process finished it while we waited"""
+        lock_path = self._lock_path(key)
+        while True:
+            f = open(lock_path, 'a')
+            if fcntl is None:
+                break
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                # The lock file stays in place, but `prune` may have removed it while we waited
+                if os.fstat(f.fileno()).st_ino == lock_path.stat().st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()
+        with f:
+            try:
+                response = self.get(key)
+                if response is not None:
+                    self.coalesced += 1
+                    return response
+                self.misses += 1
+                response = generate()
+                self.put(key, response, model)
+                return response
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def prune(self) -> int:
+        """
+        Remove the completions older than `ttl`, and the lock files of keys not generated since, returning
+        how many completions were removed.
+        """
+        if not self.enabled or self.ttl <= 0:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for path in self.cache_path.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        for path in self.cache_path.glob(".*.lock"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                continue
+        if removed > 0:
+            logger.info(f"Pruned {removed} expired completions")
+        return removed
+
+    def stats(self) -> dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
@@ -192,6 +192,7 @@ async def analysis_pipeline(self: BasePipeline, **kwargs):
                 return None
 
     results = []
+    step, results = self.resume_run(step, results)
 
     while True:
         try:
@@ -203,6 +204,7 @@ async def analysis_pipeline(self: BasePipeline, **kwargs):
                 break
             results.append(turn_config)
             step += 1
+            self.checkpoint_run(step, results)
         except RetryException:
             continue
 
@@ -13,8 +13,10 @@ from ..config import ChatConfig
 from ..constants import LISTENER_SELF, ROLE_ASSISTANT, ROLE_USER, TOKEN_CHARS
 from ..conversation.message import ConversationMessage
 from ..io.documents import Library
+from ..llm.cache import CompletionCache, completion_key
 from ..llm.models import LanguageModelV2, ModelCategory, CompletionProvider, LLMProvider
 from ..conversation.model import ConversationModel
+from .state import PipelineRunState, PipelineStateStore
 from ..agents import Persona
 from ..utils.string import word_count, Patterns
 
@@ -81,6 +83,15 @@ class BasePipeline:
         self.core_documents : list[str] = []
         self.enhancement_documents : Optional[list[str]] = None
 
+        # Stored completions, reused for deterministic requests and when resuming a failed job
+        self.completions = CompletionCache.from_config(config)
+        self._completion_key : Optional[str] = None
+
+        # With a run id, the run is checkpointed after every step, and resumed from there when run again
+        self.run_id : Optional[str] = None
+        self.pipeline_type : Optional[str] = None
+        self.run_store = PipelineStateStore.from_config(config)
+
     def used_characters(self) -> int:
         system_len = len(self.config.system_message)
         format_len = len(self.format_all())
@@ -93,7 +104,6 @@ class BasePipeline:
 
     def generate_response(self, provider_type: str, turns: list[dict[str, str]], config: ChatConfig, max_retries: int = 10,
                           retries: int = 0, evictions: int = 0, is_thought: bool = False, is_codex: bool = False) -> str:
-        chunks = []
         print(f"Assistant: ", end='', flush=True)
         if is_thought:
             model = self.thought
@@ -119,15 +129,23 @@ class BasePipeline:
             content += expansion
             logger.info(f"Processing Length: {sum([word_count(v) for e in my_turns for k, v in e.items()])}")
             # pull the provider from the dict if it exists, otherwise use analysis
-            for t in model.stream_turns(my_turns, config):
-                if t is not None:
-                    print(t, end='', flush=True)
-                    chunks.append(t)
-                else:
-                    print('', flush=True)
-            response = ''.join(chunks)
-            if self.validate_response(response) == False:
-                raise RetryException("Invalid response")
+            def stream() -> str:
+                chunks = []
+                for t in model.stream_turns(my_turns, config):
+                    if t is not None:
+                        print(t, end='', flush=True)
+                        chunks.append(t)
+                    else:
+                        print('', flush=True)
+                response = ''.join(chunks)
+                if self.validate_response(response) == False:
+                    raise RetryException("Invalid response")
+                return response
+
+            # Only valid responses are stored, so a reused one needs no checking
+            self._completion_key = completion_key(model.model, my_turns, config)
+            reuse = config.temperature == 0 or config.resume
+            response = self.completions.generate(self._completion_key, stream, reuse=reuse, model=model.model)
         except Exception as e:
             logger.info(f"Error generating response: {e}")
             if '429' in str(e):
@@ -347,11 +365,13 @@ class BasePipeline:
 
         if len(response) < 100:
             logger.error(f"Response is too short: {response}")
+            self.reject_response()
             raise RetryException("Response is too short")
 
         if self.config.no_retry == False and retry == True:
             ui = input("** -=[ Enter or (r)etry ]=- **")
             if ui == 'r':
+                self.reject_response()
                 raise RetryException("User requested a retry")
 
         if self.progrsss_callback is not None:
@@ -364,6 +384,40 @@ class BasePipeline:
 
         return response
 
+    def resume_run(self, step: int, responses: list[dict]) -> tuple[int, list[dict]]:
+        """
+        The step to run next and the responses so far: those of this run's last checkpoint, restoring the turns,
+        recall and extras it had; or the given ones, for a new run.
+        """
+        if self.run_id is None:
+            return step, responses
+        state = self.run_store.load(self.run_id)
+        if state is None or state.finished:
+            return step, responses
+        if state.pipeline_type != self.pipeline_type:
+            logger.warning(f"Run {self.run_id} was a {state.pipeline_type} pipeline, not {self.pipeline_type}; starting over")
+            return step, responses
+        self.turns, self.recall, self.extra = state.turns, state.recall, state.extra
+        logger.info(f"Resuming run {self.run_id} at step {state.step}, {len(state.responses)} responses kept")
+        return state.step, state.responses
+
+    def checkpoint_run(self, step: int, responses: list[dict]) -> None:
+        """Save where the run is, once a step is done; `step` is the one to run next"""
+        if self.run_id is None:
+            return
+        self.run_store.save(PipelineRunState(run_id=self.run_id, pipeline_type=self.pipeline_type, step=step,
+                                             responses=responses, turns=self.turns, recall=self.recall, extra=self.extra))
+
+    def finish_run(self) -> None:
+        """Mark a run whose responses were all saved as finished, in place of its checkpoint"""
+        if self.run_id is not None:
+            self.run_store.finish(self.run_id, self.pipeline_type)
+
+    def reject_response(self) -> None:
+        """Forget the last stored completion, so retrying the turn generates a new one"""
+        if self._completion_key is not None:
+            self.completions.discard(self._completion_key)
+
     def apply_to_turns(self, role: str, content: str):
         self.turns.append({"role": role, "content": content})
 
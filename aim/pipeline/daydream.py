@@ -81,6 +81,7 @@ async def daydream_pipeline(self: BasePipeline, query_text: str, save: bool = Tr
     self.accumulate(step, queries=results)
     
     responses = []
+    step, responses = self.resume_run(step, responses)
 
     while True:
         try:
@@ -115,6 +116,7 @@ async def daydream_pipeline(self: BasePipeline, query_text: str, save: bool = Tr
             
 
             step += 1
+            self.checkpoint_run(step, responses)
 
         except RetryException:
             continue
@@ -139,6 +139,7 @@ async def journal_pipeline(self: BasePipeline, query_text: Optional[str] = None,
     branch = 0
     
     responses = []
+    step, responses = self.resume_run(step, responses)
     
     while True:
         try:
@@ -155,6 +156,7 @@ async def journal_pipeline(self: BasePipeline, query_text: Optional[str] = None,
             self.apply_to_turns(ROLE_ASSISTANT, response)
             responses.append(turn_config)
             step += 1
+            self.checkpoint_run(step, responses)
         except RetryException:
             continue
     
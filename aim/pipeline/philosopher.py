@@ -169,6 +169,7 @@ async def ponder_pipeline(self: BasePipeline, query_text: str, **kwargs):
     self.accumulate(step, queries=results)
 
     responses = []
+    step, responses = self.resume_run(step, responses)
 
     while True:
         try:
@@ -187,6 +188,7 @@ async def ponder_pipeline(self: BasePipeline, query_text: str, **kwargs):
             responses.append(turn_config)
             logger.info("Saving response")
             step += 1
+            self.checkpoint_run(step, responses)
         except RetryException:
             continue
 
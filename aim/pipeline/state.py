@@ -0,0 +1,112 @@
+# aim/pipeline/state.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from dataclasses import dataclass, field, asdict
+import json
+import logging
+from pathlib import Path
+import re
+import time
+from typing import Any, Optional
+
+from ..config import ChatConfig
+from ..conversation.writer import atomic_write
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PipelineRunState:
+    """
+    Where a pipeline run is: the step to run next, the responses of the steps before it, and the turns, recall
+    and extra considerations they left behind.
+    """
+    run_id: str
+    pipeline_type: str
+    step: int
+    responses: list[dict[str, Any]] = field(default_factory=list)
+    turns: list[dict[str, str]] = field(default_factory=list)
+    recall: dict[int, list[dict[str, Any]]] = field(default_factory=dict)
+    extra: list[str] = field(default_factory=list)
+    finished: bool = False
+    updated: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "PipelineRunState":
+        # JSON object keys are strings, our recall is keyed by step
+        return cls(**{**data, "recall": {int(k): v for k, v in data.get("recall", {}).items()}})
+
+
+class PipelineStateStore:
+    """
+    The state of each pipeline run, in a JSON file per run id, replaced atomically after every step. Once all
+    of a run's responses are saved, its state is replaced by a marker that it finished, kept for `ttl` seconds.
+    """
+
+    def __init__(self, state_path: Optional[str], ttl: float = 7 * 24 * 3600):
+        self.state_path = Path(state_path) if state_path else None
+        self.ttl = ttl
+        if self.state_path is not None:
+            self.state_path.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: ChatConfig) -> "PipelineStateStore":
+        return cls(config.pipeline_state_path, ttl=config.pipeline_state_ttl)
+
+    @property
+    def enabled(self) -> bool:
+        return self.state_path is not None
+
+    def _path(self, run_id: str) -> Path:
+        # Run ids come from the queue; keep them to one safe file name
+        return self.state_path / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', str(run_id))}.json"
+
+    def load(self, run_id: str) -> Optional[PipelineRunState]:
+        if not self.enabled:
+            return None
+        path = self._path(run_id)
+        if not path.exists():
+            return None
+        try:
+            return PipelineRunState.from_dict(json.loads(path.read_text()))
+        except (json.JSONDecodeError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable state of pipeline run {run_id}: {e}")
+            return None
+
+    def save(self, state: PipelineRunState) -> None:
+        if not self.enabled:
+            return
+        state.updated = time.time()
+        atomic_write(self._path(state.run_id), [json.dumps(state.to_dict())])
+
+    def finish(self, run_id: str, pipeline_type: Optional[str]) -> None:
+        """Mark a run finished, dropping its checkpoint"""
+        self.save(PipelineRunState(run_id=run_id, pipeline_type=pipeline_type, step=0, finished=True))
+
+    def finished(self, run_id: str) -> bool:
+        state = self.load(run_id)
+        return state is not None and state.finished
+
+    def clear(self, run_id: str) -> None:
+        if self.enabled:
+            self._path(run_id).unlink(missing_ok=True)
+
+    def prune(self) -> int:
+        """Remove the states not updated for `ttl` seconds, returning how many were removed"""
+        if not self.enabled or self.ttl <= 0:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl
+        for path in self.state_path.glob("*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                continue
+        if removed > 0:
+            logger.info(f"Pruned {removed} expired pipeline run states")
+        return removed
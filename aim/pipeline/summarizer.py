@@ -172,12 +172,19 @@ async def summary_pipeline(self: BasePipeline, density_iterations: int = 2, max_
 
     self.total_steps = (bin_count + 1) * (1 + density_iterations * 2)
 
-    for q in range(bin_count + 1):
+    # Checkpointed after every step, at a cursor over the strides and the steps within them
+    steps_per_stride = 2 + density_iterations * 2
+    cursor, responses = self.resume_run(0, responses)
+    first_stride, first_step = divmod(cursor, steps_per_stride)
+
+    for q in range(first_stride, bin_count + 1):
         # So the flow on this goes - we perform a summary on the first chunk, then improve, and then resummarize, then we set the resummarization as the summary (branch + 1) and improve and resummarize again. We do this three times in total.
         stride = results[results['bin'] == q]
-        step = 0
+        step = first_step if q == first_stride else 0
         logger.info(f"Beginning summarization for stride {q}: {stride.shape[0]} documents")
-        self.turns = []
+        if step == 0:
+            # A resumed stride keeps the turns it had
+            self.turns = []
 
         async def generate_response(turn_config: dict, retries = 0) -> dict:
             turn_config['branch'] = q + branch
@@ -205,51 +212,40 @@ async def summary_pipeline(self: BasePipeline, density_iterations: int = 2, max_
             self.apply_to_turns(ROLE_ASSISTANT, turn_config['response'])
             responses.append(turn_config)
 
+        # The turns of the stride, in order, and whether each rolls the improvement off the turns after it
+        turn_t = {**timeline_turn}
+        turn_t['merged_prompt'] = turn_t['base_prompt'] % (q + 1, bin_count + 1)
+        turn_s = {**summary_turn}
+        if q > 0:
+            turn_s['merged_prompt'] = turn_s['base_prompt'] % (", but while you have the full summary up till now for context, focus on the memories that you have in front of you")
+        else:
+            turn_s['merged_prompt'] = turn_s['base_prompt'] % ("")
+        stride_turns = [(turn_t, False), (turn_s, False)]
+        for d in range(density_iterations):
+            turn_i = {**improve_turn}
+            turn_i['merged_prompt'] = turn_i['base_prompt']
+            turn_r = {**resummarize_turn}
+            turn_r['merged_prompt'] = turn_r['base_prompt']
+            if d == density_iterations - 1:
+                turn_r['document_type'] = DOC_SUMMARY
+                turn_r['document_weight'] = 1.3
+            stride_turns += [(turn_i, False), (turn_r, True)]
+
         try:
-            self.accumulate(step=step, queries=stride, append=False)
-
-            logger.info(f"Beginning timeline stride {q}")
-            turn_t = {**timeline_turn}
-            turn_t['merged_prompt'] = turn_t['base_prompt'] % (q + 1, bin_count + 1)
-            turn_t['prompt'] = turn_t['merged_prompt']
-            logger.info(f"{turn_t['prompt']}")
-            turn_t = await generate_response(turn_t)
-            accept_response(turn_t)
-            step += 1
-            
-            logger.info(f"Beginning summary stride {q}")
-            turn_s = {**summary_turn}
-            if q > 0:
-                turn_s['merged_prompt'] = turn_s['base_prompt'] % (", but while you have the full summary up till now for context, focus on the memories that you have in front of you")
-            else:
-                turn_s['merged_prompt'] = turn_s['base_prompt'] % ("")
-            turn_s['prompt'] = turn_s['merged_prompt']
-            logger.info(f"{turn_s['prompt']}")
-            turn_s = await  generate_response(turn_s)
-            accept_response(turn_s)
-            step += 1
-            
-            for d in range(density_iterations):
-                logger.info(f"Beginning improvement {d} for stride {q}")
-                turn_i = {**improve_turn}
-                turn_i['merged_prompt'] = turn_i['base_prompt']
-                turn_i['prompt'] = turn_i['merged_prompt']
-                turn_i = await generate_response(turn_i)
-                accept_response(turn_i)
-                step += 1
-            
-                logger.info(f"Beginning resummarization {d} for stride {q}")
-                turn_r = {**resummarize_turn}
-                turn_r['merged_prompt'] = turn_r['base_prompt']
-                turn_r['prompt'] = turn_r['merged_prompt']
-                if d == density_iterations - 1:
-                    turn_r['document_type'] = DOC_SUMMARY
-                    turn_r['document_weight'] = 1.3
-                turn_r = await generate_response(turn_r)
-                accept_response(turn_r)
-                self.turns = self.turns[:-3]
+            self.accumulate(step=0, queries=stride, append=False)
+
+            while step < len(stride_turns):
+                turn_config, roll_off = stride_turns[step]
+                turn_config = {**turn_config, 'prompt': turn_config['merged_prompt']}
+                logger.info(f"Beginning step {step} of stride {q}: {turn_config['prompt']}")
+                turn_config = await generate_response(turn_config)
+                accept_response(turn_config)
+                if roll_off:
+                    self.turns = self.turns[:-3]
                 step += 1
-            self.extra.append(responses[-1]['response'])
+                if step == len(stride_turns):
+                    self.extra.append(responses[-1]['response'])
+                self.checkpoint_run(q * steps_per_stride + step, responses)
         except RetryException:
             # the pipeline failed
             logger.error("Pipeline failed")
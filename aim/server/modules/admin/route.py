@@ -2,44 +2,49 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 import logging
-from pathlib import Path
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from ....config import ChatConfig
 from ....conversation.loader import ConversationLoader
 from ....conversation.index import SearchIndex
+from ....conversation.maintenance import IndexMaintenance
+from ....conversation.shards import ShardedIndex
+from ...resources import ServerResources
 
 logger = logging.getLogger(__name__)
 
 class AdminModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/api/admin", tags=["admin"])
         self.security = security
         self.config = config
-        self.index_path = Path("memory/indices")
+        self.resources = resources
         self.loader = ConversationLoader()
         
         self.setup_routes()
 
-    async def rebuild_index_task(self) -> None:
-        """Background task to rebuild the index"""
+    def rebuild_index_task(self, shard: Optional[str] = None) -> None:
+        """Background task to rebuild the index, or a single shard of it"""
         try:
-            # Create a new index
-            index = SearchIndex(self.index_path, embedding_model=self.config.embedding_model)
+            index = self.index
             
             # Load all conversations
             messages = self.loader.load_all()
             
             # Convert to index documents
             documents = [
-                msg.to_index_doc()
+                msg.to_dict()
                 for msg in messages
             ]
             
             # Index the documents
             logger.info("Starting indexing...")
-            index.add_documents(documents)
+            if shard is not None:
+                index.rebuild(documents, key=shard)
+            else:
+                index.rebuild(documents)
             
             logger.info("Index rebuild complete")
             
@@ -47,18 +52,39 @@ class AdminModule:
             logger.error(f"Error rebuilding index: {e}")
             raise
 
+    @property
+    def index(self) -> SearchIndex | ShardedIndex:
+        """The conversation index the other modules search, so a rebuild is seen by them at once"""
+        return self.resources.chat.cvm.index
+
+    def compact_index_task(self, shard: Optional[str] = None, force: bool = False, vacuum: bool = False) -> None:
+        """Background task to compact the index, or a single shard of it"""
+        try:
+            maintenance = IndexMaintenance.from_config(self.config, index=self.index)
+            done = maintenance.run_once(key=shard, force=force, vacuum=vacuum)
+            logger.info(f"Index compaction complete: {done}")
+        except Exception as e:
+            logger.error(f"Error compacting index: {e}")
+            raise
+
+    def check_auth(self, credentials: HTTPAuthorizationCredentials, shard: Optional[str] = None) -> None:
+        if self.config.server_api_key and credentials.credentials != self.config.server_api_key:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        if shard is not None and not self.config.index_shard_by:
+            raise HTTPException(status_code=400, detail="The index is not sharded")
+
     def setup_routes(self):
         @self.router.post("/rebuild_index")
         async def rebuild_index(
             background_tasks: BackgroundTasks,
+            shard: Optional[str] = None,
             credentials: HTTPAuthorizationCredentials = Depends(self.security)
         ):
-            """Rebuild the search index from JSONL files"""
+            """Rebuild the search index from JSONL files; with `shard`, only that persona's or user's shard"""
             try:
-                if self.config.server_api_key and credentials.credentials != self.config.server_api_key:
-                    raise HTTPException(status_code=401, detail="Invalid API key")
+                self.check_auth(credentials, shard)
                 
-                background_tasks.add_task(self.rebuild_index_task)
+                background_tasks.add_task(self.rebuild_index_task, shard)
                 
                 return {
                     "status": "success",
@@ -67,4 +93,57 @@ class AdminModule:
                 
             except Exception as e:
                 logger.exception(e)
-                raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+                raise HTTPException(status_code=500, detail=str(e))
+        @self.router.get("/index_stats")
+        async def index_stats(
+            shard: Optional[str] = None,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """Segment count, deleted document ratio and size of the index, or of each shard, and whether compaction is due"""
+            try:
+                self.check_auth(credentials, shard)
+
+                maintenance = IndexMaintenance.from_config(self.config, index=self.index)
+                stats = maintenance.stats(shard)
+
+                return {
+                    "status": "success",
+                    "indexes": {
+                        key: {**s.to_dict(), "due": maintenance.policy.due(s), "idle": maintenance.policy.idle(s)}
+                        for key, s in stats.items()
+                    }
+                }
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.exception(e)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.post("/compact_index")
+        async def compact_index(
+            background_tasks: BackgroundTasks,
+            shard: Optional[str] = None,
+            force: bool = False,
+            vacuum: bool = False,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """
+            Compact the index, or one shard, where it is idle and due; `force` compacts now, `vacuum` copies the
+            live documents into a single segment
+            """
+            try:
+                self.check_auth(credentials, shard)
+
+                background_tasks.add_task(self.compact_index_task, shard, force, vacuum)
+
+                return {
+                    "status": "success",
+                    "message": "Index compaction started in background"
+                }
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.exception(e)
+                raise HTTPException(status_code=500, detail=str(e))
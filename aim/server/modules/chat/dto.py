@@ -22,6 +22,8 @@ class Metadata(BaseModel):
     disable_guidance: Optional[bool] = Field(False, description="Disable guidance")
     disable_pif: Optional[bool] = Field(False, description="Disable pif")
     location: Optional[str] = Field(None, description="Location")
+    conversation_id: Optional[str] = Field(None, description="ID of the conversation")
+    branch: Optional[int] = Field(0, description="Branch of the conversation")
 
 
 class ChatCompletionRequest(BaseModel):
@@ -16,6 +16,7 @@ from fastapi.responses import StreamingResponse
 
 from ....llm.models import LanguageModelV2, LLMProvider, ModelCategory
 from ....chat import ChatManager, chat_strategy_for
+from ...resources import ServerResources
 from ....config import ChatConfig
 from ....utils.turns import validate_turns
 from ....utils.xml import XmlFormatter
@@ -83,16 +84,26 @@ class ModelClasses:
 
 
 class ChatModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/v1/chat", tags=["chat"])
         self.security = security
         self.config = config
-        self.chat = ChatManager.from_config(config)
-        self.chat_strategy = chat_strategy_for("xmlmemory", self.chat)
+        self.resources = resources
+        self._chat_strategy = None
         self.models = LanguageModelV2.index_models(self.config)
         
         self.setup_routes()
 
+    @property
+    def chat(self) -> ChatManager:
+        return self.resources.chat
+
+    @property
+    def chat_strategy(self):
+        if self._chat_strategy is None:
+            self._chat_strategy = chat_strategy_for(self.config.chat_strategy, self.chat)
+        return self._chat_strategy
+
     def setup_routes(self):
         @self.router.post("/completions")
         async def chat_completions(
@@ -171,6 +182,8 @@ class ChatModule:
 
         self.config.user_id = metadata.user_id
         self.config.persona_id = metadata.persona_id
+        self.config.conversation_id = metadata.conversation_id
+        self.chat.current_branch = metadata.branch or 0
         self.config.temperature = request.temperature
         self.config.max_tokens = request.max_tokens or self.config.max_tokens
         self.config.repetition = request.repetition_penalty
@@ -5,11 +5,14 @@ import time
 import logging
 from typing import List
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import JSONResponse
 
 from ....config import ChatConfig
 from ....chat import ChatManager
+from ...resources import ServerResources
+from ....conversation.ingest import BulkIngest
 from ....conversation.message import ConversationMessage
 from ....constants import DOC_CONVERSATION
 
@@ -18,14 +21,23 @@ from .dto import SaveConversationRequest
 logger = logging.getLogger(__name__)
 
 class ConversationModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/api/conversation", tags=["conversation"])
         self.security = security
         self.config = config
-        self.chat = ChatManager.from_config(config)
+        self.resources = resources
         
         self.setup_routes()
 
+    @property
+    def chat(self) -> ChatManager:
+        return self.resources.chat
+
+    @property
+    def ingest(self) -> BulkIngest:
+        """Shared with the other modules, so there is one bulk insert at a time in the process"""
+        return self.resources.ingest
+
     def setup_routes(self):
         @self.router.get("")
         async def list_conversations(
@@ -48,11 +60,12 @@ class ConversationModule:
             request: SaveConversationRequest,
             credentials: HTTPAuthorizationCredentials = Depends(self.security)
         ):
-            """Save a new conversation"""
+            """Save a new conversation; long ones are saved in the background, as a job to poll"""
             try:
+                messages = []
                 for i, msg in enumerate(request.messages):
                     timestamp = msg.timestamp if msg.timestamp else int(time.time())
-                    message = ConversationMessage(
+                    messages.append(ConversationMessage(
                         doc_id=ConversationMessage.next_doc_id(),
                         document_type=DOC_CONVERSATION,
                         user_id=self.config.user_id,
@@ -65,16 +78,34 @@ class ConversationModule:
                         role=msg.role,
                         content=msg.content,
                         timestamp=timestamp,
-                    )
-                    self.chat.cvm.insert(message)
+                    ))
 
-                self.chat.cvm.refresh()
+                # Embedded, appended and committed in batches, not a message at a time
+                if self.ingest.is_async(len(messages)):
+                    job = self.ingest.submit(messages)
+                    return JSONResponse(status_code=202, content={
+                        "status": "success",
+                        "message": f"Saving {len(messages)} messages in background",
+                        "job": job.to_dict()
+                    })
+                await run_in_threadpool(self.ingest.ingest, messages)
                 
                 return {"status": "success", "message": "Conversation saved successfully"}
             except Exception as e:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.get("/bulk/{job_id}")
+        async def save_job(
+            job_id: str,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """The progress of a conversation saved in the background"""
+            job = self.ingest.job(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail=f"No conversation save {job_id}")
+            return {"status": "success", "job": job.to_dict()}
+
         @self.router.get("/{conversation_id}")
         async def get_conversation(
             conversation_id: str,
@@ -16,3 +16,19 @@ class DocumentListResponse(BaseModel):
     status: str = Field(..., description="Response status")
     message: str = Field(..., description="Response message")
     documents: List[DocumentInfo] = Field(..., description="List of documents")
+
+
+class DocumentSearchResult(BaseModel):
+    """A chunk of a document matching a search"""
+    document: str = Field(..., description="Name of the document")
+    chunk_no: int = Field(..., description="Chunk number within the document")
+    offset: int = Field(..., description="Character offset of the chunk in the document")
+    content: str = Field(..., description="Text of the chunk")
+    score: float = Field(..., description="Relevance score")
+
+
+class DocumentSearchResponse(BaseModel):
+    """Response model for searching documents"""
+    status: str = Field(..., description="Response status")
+    message: str = Field(..., description="Response message")
+    results: List[DocumentSearchResult] = Field(..., description="Matching chunks, best first")
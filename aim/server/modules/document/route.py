@@ -3,25 +3,122 @@
 
 import os
 import logging
-from fastapi import APIRouter, HTTPException, Depends, UploadFile, File
+import re
+import tempfile
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse, Response
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from ....config import ChatConfig
 from ....io.documents import Library
-from .dto import DocumentInfo, DocumentListResponse
+from ...resources import ServerResources
+from .dto import DocumentInfo, DocumentListResponse, DocumentSearchResult, DocumentSearchResponse
 
 logger = logging.getLogger(__name__)
 
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def parse_range(range_header: str, file_size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single `bytes=` range header into an inclusive (start, end) byte range.
+
+    Returns None if the header isn't a single byte range we can serve; raises a 416 if it is out of bounds.
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", range_header)
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        # A suffix range, the last N bytes
+        start, end = max(0, file_size - int(match.group(2))), file_size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), file_size - 1) if match.group(2) else file_size - 1
+    if start >= file_size or start > end:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{file_size}"})
+    return start, end
+
+
+async def stream_file_range(file_path: str, start: int, end: int):
+    """
+    Stream an inclusive byte range of a file, reading off the event loop.
+    """
+    with open(file_path, "rb") as f:
+        await run_in_threadpool(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
 class DocumentModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/api/document", tags=["document"])
         self.security = security
         self.config = config
-        self.library = Library(documents_dir=config.documents_dir)
-        
+        self.resources = resources
+
         self.setup_routes()
 
+    @property
+    def library(self) -> Library:
+        """The chat's library, so both share one document index"""
+        return self.resources.library
+
+    def document_path(self, document_name: str) -> str:
+        """
+        The path of a document in the library, refusing names that would escape the documents directory.
+        """
+        if os.path.basename(document_name) != document_name or document_name in ("", ".", ".."):
+            raise HTTPException(status_code=400, detail=f"Invalid document name {document_name}")
+        return os.path.join(self.config.documents_dir, document_name)
+
+    async def write_upload(self, file: UploadFile, file_path: str) -> int:
+        """
+        Stream an upload to a temporary file in chunks, then atomically move it into place.
+
+        Returns:
+            The size of the upload in bytes.
+        """
+        max_size = self.config.max_upload_size
+        fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=self.config.documents_dir, prefix=".upload-", suffix=".part")
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = await file.read(STREAM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_size > 0 and size > max_size:
+                        raise HTTPException(status_code=413, detail=f"Document is larger than the {max_size} byte limit")
+                    await run_in_threadpool(f.write, chunk)
+                await run_in_threadpool(f.flush)
+                await run_in_threadpool(os.fsync, f.fileno())
+            # mkstemp creates the file private to us, but documents are shared
+            os.chmod(temp_path, 0o644)
+            await run_in_threadpool(os.replace, temp_path, file_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return size
+
+    def index_document(self, document_name: str) -> None:
+        """
+        Index a document in the background, logging rather than raising any errors.
+        """
+        try:
+            self.library.index_document(document_name)
+        except Exception as e:
+            logger.error(f"Error indexing {document_name}: {e}")
+
     def setup_routes(self):
         @self.router.get("/list")
         async def list_documents(
@@ -46,28 +143,90 @@ class DocumentModule:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.get("/search")
+        async def search_documents(
+            query: str,
+            top_n: int = 10,
+            document: Optional[str] = None,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """Ranked search over the chunks of the documents in the library"""
+            try:
+                if self.library.index is None:
+                    raise HTTPException(status_code=503, detail="The document index is not available")
+                results = self.library.index.search([query], document=document, top_n=top_n)
+                return DocumentSearchResponse(
+                    status="success",
+                    message=f"Found {len(results)} chunks",
+                    results=[
+                        DocumentSearchResult(
+                            document=row['document'],
+                            chunk_no=row['chunk_no'],
+                            offset=row['offset'],
+                            content=row['content'],
+                            score=row['score']
+                        )
+                        for _, row in results.iterrows()
+                    ]
+                )
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.exception(e)
+                raise HTTPException(status_code=500, detail=str(e))
+
         @self.router.get("/{document_name}")
         async def download_document(
             document_name: str,
+            request: Request,
             credentials: HTTPAuthorizationCredentials = Depends(self.security)
         ):
-            """Download a specific document"""
+            """Download a specific document, or a byte range of it"""
             try:
-                file_path = os.path.join(self.config.documents_dir, document_name)
-                if not os.path.exists(file_path):
+                file_path = self.document_path(document_name)
+                if not await run_in_threadpool(os.path.isfile, file_path):
                     raise HTTPException(status_code=404, detail=f"Document {document_name} not found")
 
-                return FileResponse(
-                    path=file_path,
-                    filename=document_name,
-                    media_type="application/octet-stream"
+                range_header = request.headers.get("range")
+                if range_header is None:
+                    return FileResponse(
+                        path=file_path,
+                        filename=document_name,
+                        media_type="application/octet-stream",
+                        headers={"Accept-Ranges": "bytes"}
+                    )
+
+                file_size = (await run_in_threadpool(os.stat, file_path)).st_size
+                byte_range = parse_range(range_header, file_size)
+                if byte_range is None:
+                    return FileResponse(
+                        path=file_path,
+                        filename=document_name,
+                        media_type="application/octet-stream",
+                        headers={"Accept-Ranges": "bytes"}
+                    )
+
+                start, end = byte_range
+                return StreamingResponse(
+                    stream_file_range(file_path, start, end),
+                    status_code=206,
+                    media_type="application/octet-stream",
+                    headers={
+                        "Accept-Ranges": "bytes",
+                        "Content-Range": f"bytes {start}-{end}/{file_size}",
+                        "Content-Length": str(end - start + 1),
+                        "Content-Disposition": f'attachment; filename="{document_name}"'
+                    }
                 )
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
 
         @self.router.post("/upload")
         async def upload_document(
+            background_tasks: BackgroundTasks,
             file: UploadFile = File(...),
             credentials: HTTPAuthorizationCredentials = Depends(self.security)
         ):
@@ -81,18 +240,20 @@ class DocumentModule:
                         detail=f"Invalid file extension. Supported extensions: {valid_extensions}"
                     )
 
-                file_path = os.path.join(self.config.documents_dir, file.filename)
-                
-                # Read file content and write to documents directory
-                content = await file.read()
-                with open(file_path, "wb") as f:
-                    f.write(content)
+                file_path = self.document_path(file.filename)
+                size = await self.write_upload(file, file_path)
+                logger.info(f"Uploaded {file.filename}: {size} bytes")
+
+                # Index the new document once the response is sent
+                background_tasks.add_task(self.index_document, file.filename)
 
                 return {
                     "status": "success",
                     "message": f"Document {file.filename} uploaded successfully",
                     "filename": file.filename
                 }
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
@@ -104,15 +265,17 @@ class DocumentModule:
         ):
             """Delete a document"""
             try:
-                file_path = os.path.join(self.config.documents_dir, document_name)
-                if not os.path.exists(file_path):
+                file_path = self.document_path(document_name)
+                if not await run_in_threadpool(os.path.exists, file_path):
                     raise HTTPException(status_code=404, detail=f"Document {document_name} not found")
 
-                os.remove(file_path)
+                await run_in_threadpool(self.library.remove_document, document_name)
                 return {
                     "status": "success", 
                     "message": f"Document {document_name} deleted"
                 }
+            except HTTPException:
+                raise
             except Exception as e:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
@@ -124,8 +287,8 @@ class DocumentModule:
         ):
             """Get the contents of a specific document for browser display"""
             try:
-                file_path = os.path.join(self.config.documents_dir, document_name)
-                if not os.path.exists(file_path):
+                file_path = self.document_path(document_name)
+                if not await run_in_threadpool(os.path.exists, file_path):
                     raise HTTPException(status_code=404, detail=f"Document {document_name} not found")
                 
                 # Check if file is text-based (you may want to expand this list)
@@ -135,10 +298,13 @@ class DocumentModule:
                         detail="File type not supported for text viewing"
                     )
 
+                def read_utf8() -> str:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        return f.read()
+
                 try:
                     # Try to read file as UTF-8
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
+                    content = await run_in_threadpool(read_utf8)
                 except UnicodeDecodeError:
                     # If UTF-8 fails, this might not be a text file
                     raise HTTPException(
@@ -1,7 +1,7 @@
 # aim/server/modules/memory/dto.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import Any
 
 from ....conversation.message import ConversationMessage
@@ -11,4 +11,7 @@ class DocumentUpdate(BaseModel):
     data: dict[str, Any]
 
 class CreateDocumentRequest(BaseModel):
-    message: ConversationMessage
\ No newline at end of file
+    message: ConversationMessage
+
+# Validates a whole bulk payload in one pass, reporting every invalid field by its record's index
+BulkMessages = TypeAdapter(list[ConversationMessage])
@@ -1,36 +1,126 @@
 # aim/server/modules/memory/route.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
+import json
 import logging
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Any, Optional
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 
 from ....config import ChatConfig
 from ....chat import ChatManager
+from ...resources import ServerResources
+from ....conversation.index import last_days
+from ....conversation.ingest import BulkIngest
+from ....conversation.message import ConversationMessage
+from ....conversation.model import ConversationModel
 
-from .dto import DocumentUpdate, CreateDocumentRequest
+from .dto import DocumentUpdate, CreateDocumentRequest, BulkMessages
 
 logger = logging.getLogger(__name__)
 
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+# Enough to fix a payload by, without echoing all of a badly broken one
+MAX_REPORTED_ERRORS = 50
+
+
+async def read_bulk_records(request: Request, max_size: int) -> list[Any]:
+    """
+    The records of a bulk payload: a JSON array, or one JSON object per line for an NDJSON content type.
+    NDJSON is parsed as it streams in.
+    """
+    ndjson = request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_TYPES
+    records, errors, pending, line_no, size = [], [], b"", 0, 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if max_size > 0 and size > max_size:
+            raise HTTPException(status_code=413, detail=f"Payload is larger than the {max_size} byte limit")
+        if not ndjson:
+            pending += chunk
+            continue
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    errors.append({"line": line_no, "error": str(e)})
+    if ndjson:
+        if pending.strip():
+            try:
+                records.append(json.loads(pending))
+            except json.JSONDecodeError as e:
+                errors.append({"line": line_no + 1, "error": str(e)})
+    else:
+        try:
+            records = json.loads(pending)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(records, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of messages")
+    if len(errors) > 0:
+        raise HTTPException(status_code=400, detail={"message": f"{len(errors)} invalid lines", "errors": errors[:MAX_REPORTED_ERRORS]})
+    return records
+
+
+def validate_messages(records: list[Any]) -> list[ConversationMessage]:
+    """Validate every record of a bulk payload at once; nothing is inserted unless all of them are valid"""
+    try:
+        messages = BulkMessages.validate_python(records)
+    except ValidationError as e:
+        errors = [{"index": error["loc"][0], "field": ".".join(str(loc) for loc in error["loc"][1:]), "error": error["msg"]}
+                  for error in e.errors()[:MAX_REPORTED_ERRORS]]
+        raise HTTPException(status_code=422, detail={"message": f"{e.error_count()} invalid fields", "errors": errors})
+    seen, duplicates = set(), []
+    for i, message in enumerate(messages):
+        if message.doc_id in seen:
+            duplicates.append({"index": i, "field": "doc_id", "error": f"Duplicate doc_id {message.doc_id}"})
+        seen.add(message.doc_id)
+    if len(duplicates) > 0:
+        raise HTTPException(status_code=422, detail={"message": f"{len(duplicates)} duplicate doc_ids", "errors": duplicates[:MAX_REPORTED_ERRORS]})
+    return messages
+
+
+def reject_indexed(cvm: ConversationModel, messages: list[ConversationMessage]) -> None:
+    """Refuse a bulk payload if any of its doc_ids is already indexed, as inserting it again would duplicate it"""
+    existing = [{"index": i, "field": "doc_id", "error": f"doc_id {message.doc_id} already exists"}
+                for i, message in enumerate(messages) if cvm.index.get_document(message.doc_id, quiet=True) is not None]
+    if len(existing) > 0:
+        raise HTTPException(status_code=409, detail={"message": f"{len(existing)} doc_ids already exist", "errors": existing[:MAX_REPORTED_ERRORS]})
+
 
 class MemoryModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/api/memory", tags=["memory"])
         self.security = security
         self.config = config
-        self.chat = ChatManager.from_config(config)
+        self.resources = resources
         
         self.setup_routes()
 
+    @property
+    def chat(self) -> ChatManager:
+        return self.resources.chat
+
+    @property
+    def ingest(self) -> BulkIngest:
+        """Shared with the other modules, so there is one bulk insert at a time in the process"""
+        return self.resources.ingest
+
     def setup_routes(self):
         @self.router.get("/search")
         async def search_memory(
             query: str,
             top_n: int = 5,
             document_type: str = 'all',
+            days: Optional[float] = None,
             credentials: HTTPAuthorizationCredentials = Depends(self.security)
         ):
-            """Search through memory documents"""
+            """Search through memory documents, optionally only those of the last `days` days"""
             try:
                 if document_type == 'all':
                     document_type = None
@@ -38,6 +128,7 @@ class MemoryModule:
                     [query],
                     top_n=top_n,
                     query_document_type=document_type,
+                    query_time_range=last_days(days) if days is not None else None,
                 )
                 
                 formatted_results = []
@@ -62,6 +153,13 @@ class MemoryModule:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.get("/cache_stats")
+        async def cache_stats(
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """Hits, misses, evictions and size of the memory query cache"""
+            return {"status": "success", "cache": self.chat.cvm.query_cache.stats()}
+
         @self.router.put("/{conversation_id}/{document_id}")
         async def update_document(
             conversation_id: str,
@@ -91,6 +189,45 @@ class MemoryModule:
                 logger.exception(e)
                 raise HTTPException(status_code=500, detail=str(e))
 
+        @self.router.post("/bulk")
+        async def bulk_create_documents(
+            request: Request,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """
+            Create many documents, from a JSON array or an NDJSON body. All of them are validated before any is
+            inserted; more than `INGEST_ASYNC_THRESHOLD` are inserted in the background, as a job to poll.
+            """
+            try:
+                records = await read_bulk_records(request, self.config.max_upload_size)
+                messages = validate_messages(records)
+                await run_in_threadpool(reject_indexed, self.chat.cvm, messages)
+                if self.ingest.is_async(len(messages)):
+                    job = self.ingest.submit(messages)
+                    return JSONResponse(status_code=202, content={
+                        "status": "success",
+                        "message": f"Inserting {len(messages)} documents in background",
+                        "job": job.to_dict()
+                    })
+                inserted = await run_in_threadpool(self.ingest.ingest, messages)
+                return {"status": "success", "message": f"{inserted} documents created"}
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.exception(e)
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @self.router.get("/bulk/{job_id}")
+        async def bulk_job(
+            job_id: str,
+            credentials: HTTPAuthorizationCredentials = Depends(self.security)
+        ):
+            """The progress of a background bulk insert"""
+            job = self.ingest.job(job_id)
+            if job is None:
+                raise HTTPException(status_code=404, detail=f"No bulk insert {job_id}")
+            return {"status": "success", "job": job.to_dict()}
+
         @self.router.get("/{document_id}")
         async def get_document(
             document_id: str,
@@ -7,19 +7,24 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from ....config import ChatConfig
 from ....chat import ChatManager
+from ...resources import ServerResources
 from ....utils.keywords import get_all_keywords
 
 logger = logging.getLogger(__name__)
 
 class ReportModule:
-    def __init__(self, config: ChatConfig, security: HTTPBearer):
+    def __init__(self, config: ChatConfig, security: HTTPBearer, resources: ServerResources):
         self.router = APIRouter(prefix="/api/report", tags=["report"])
         self.security = security
         self.config = config
-        self.chat = ChatManager.from_config(config)
+        self.resources = resources
         
         self.setup_routes()
 
+    @property
+    def chat(self) -> ChatManager:
+        return self.resources.chat
+
     def setup_routes(self):
         @self.router.get("/conversation_matrix")
         async def get_conversation_matrix(
@@ -0,0 +1,53 @@
+# aim/server/resources.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+import logging
+import threading
+from typing import Optional
+
+from ..chat import ChatManager
+from ..config import ChatConfig
+from ..conversation.ingest import BulkIngest
+from ..io.documents import Library
+
+logger = logging.getLogger(__name__)
+
+
+class ServerResources:
+    """
+    The heavy objects the server modules share: one chat manager, with its conversation model and index, its
+    document library, and the bulk ingester that inserts into them one job at a time. Each is built on first
+    use, or ahead of it by the warm-up thread, so the server answers health checks while they load, and no
+    two modules open the same index.
+    """
+
+    def __init__(self, config: ChatConfig):
+        self.config = config
+        self.lock = threading.RLock()
+        self._chat : Optional[ChatManager] = None
+        self._ingest : Optional[BulkIngest] = None
+
+    @property
+    def chat(self) -> ChatManager:
+        with self.lock:
+            if self._chat is None:
+                self._chat = ChatManager.from_config(self.config)
+            return self._chat
+
+    @property
+    def ingest(self) -> BulkIngest:
+        with self.lock:
+            if self._ingest is None:
+                self._ingest = BulkIngest.from_config(self.config, self.chat.cvm)
+            return self._ingest
+
+    @property
+    def library(self) -> Library:
+        return self.chat.library
+
+    def load(self) -> None:
+        """Build everything now, rather than on first use"""
+        chat = self.chat
+        chat.cvm.index.vectorizer.load()
+        # Catch the document index up with any changes made while we were down
+        threading.Thread(target=chat.library.sync_index, name="document-sync", daemon=True).start()
@@ -2,7 +2,11 @@
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
 import logging
+import threading
+import time
+from typing import Optional
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -19,6 +23,7 @@ from .modules.pipeline.route import PipelineModule
 from .modules.report.route import ReportModule
 from .modules.roster.route import RosterModule
 from .modules.tools.route import ToolsModule
+from .resources import ServerResources
 
 logger = logging.getLogger(__name__)
 
@@ -32,16 +37,23 @@ class ServerApi:
         
         # Load config
         self.config = ChatConfig.from_env()
+
+        # Models and indexes are loaded in the background, so we can answer health checks straight away
+        self.started = time.time()
+        self.ready = threading.Event()
+        self.load_error : Optional[str] = None
+        self.resources = ServerResources(self.config)
+        self.setup_probes()
         
         # Initialize all modules
-        admin_module = AdminModule(self.config, self.security)
-        chat_module = ChatModule(self.config, self.security)
+        admin_module = AdminModule(self.config, self.security, self.resources)
+        chat_module = ChatModule(self.config, self.security, self.resources)
         completion_module = CompletionModule(self.config, self.security)
-        conversation_module = ConversationModule(self.config, self.security)
-        document_module = DocumentModule(self.config, self.security)
-        memory_module = MemoryModule(self.config, self.security)
+        conversation_module = ConversationModule(self.config, self.security, self.resources)
+        document_module = DocumentModule(self.config, self.security, self.resources)
+        memory_module = MemoryModule(self.config, self.security, self.resources)
         pipeline_module = PipelineModule(self.config, self.security)
-        report_module = ReportModule(self.config, self.security)
+        report_module = ReportModule(self.config, self.security, self.resources)
         roster_module = RosterModule(self.config, self.security)
         tools_module = ToolsModule(self.config, self.security)
         
@@ -69,6 +81,35 @@ class ServerApi:
         # Mount static files last
         self.app.mount("/", StaticFiles(directory="public", html=True), name="static")
 
+        threading.Thread(target=self.warm_up, name="warm-up", daemon=True).start()
+
+    def warm_up(self):
+        """Open the indexes and load the models every module shares, then mark the server ready."""
+        try:
+            self.resources.load()
+        except Exception as e:
+            # Whatever failed is tried again on first use, so we can still serve, but we aren't ready
+            logger.exception(e)
+            self.load_error = str(e)
+            return
+        self.ready.set()
+        logger.info(f"Server ready in {time.time() - self.started:.1f}s")
+
+    def setup_probes(self):
+        @self.app.get("/api/health")
+        async def health():
+            """Liveness: the server is up and answering"""
+            return {"status": "ok"}
+
+        @self.app.get("/api/ready")
+        async def ready():
+            """Readiness: the indexes and models are loaded, and requests won't wait on them"""
+            if self.load_error is not None:
+                return JSONResponse(status_code=503, content={"status": "failed", "error": self.load_error})
+            if not self.ready.is_set():
+                return JSONResponse(status_code=503, content={"status": "loading"})
+            return {"status": "ready"}
+
 def create_app():
     """Create and configure a new FastAPI application instance."""
     server_api = ServerApi()
@@ -0,0 +1,108 @@
+# aim/utils/ids.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+from importlib import resources
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+# Crockford's base32, lower case; it sorts the same as the values it encodes
+ALPHABET = "0123456789abcdefghjkmnpqrstvwxyz"
+RANDOM_BITS = 80
+RANDOM_MAX = (1 << RANDOM_BITS) - 1
+
+
+def encode_base32(value: int, length: int) -> str:
+    chars = []
+    for _ in range(length):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+class IdGenerator:
+    """
+    Generates ULID-style ids: 48 bits of millisecond timestamp and 80 random bits, as 26 base32 characters.
+
+    Ids sort by creation time. Within a millisecond, the random part is incremented rather than redrawn,
+    so ids from one process are strictly increasing; across processes and forks, 80 bits of os.urandom
+    make collisions practically impossible.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.last_random = 0
+
+    def reset(self) -> None:
+        """
+        Forget the last id, so a forked child doesn't continue its parent's sequence.
+        """
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.last_random = 0
+
+    def new_id(self) -> str:
+        with self.lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms <= self.last_ms and self.last_random < RANDOM_MAX:
+                # Same millisecond (or the clock went back): stay monotonic
+                now_ms = self.last_ms
+                self.last_random += 1
+            else:
+                self.last_random = int.from_bytes(os.urandom(RANDOM_BITS // 8), "big")
+            self.last_ms = now_ms
+            return encode_base32(now_ms, 10) + encode_base32(self.last_random, 16)
+
+
+class WordList:
+    """
+    The wonderwords word lists, read once on first use.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.adjectives : Optional[list[str]] = None
+        self.nouns : Optional[list[str]] = None
+
+    def _load(self) -> None:
+        from wonderwords import assets
+
+        def read(name: str) -> list[str]:
+            text = resources.files(assets).joinpath(name).read_text()
+            return [w for w in (line.strip() for line in text.splitlines()) if w.isalpha()]
+
+        with self.lock:
+            if self.nouns is None:
+                self.adjectives = read("adjectivelist.txt")
+                self.nouns = read("nounlist.txt")
+
+    def alias(self, words: int = 2) -> str:
+        """
+        A random, human readable alias: adjectives followed by a noun.
+        """
+        if self.nouns is None:
+            self._load()
+        return "-".join([*(random.choice(self.adjectives) for _ in range(words - 1)), random.choice(self.nouns)]).lower()
+
+
+_generator = IdGenerator()
+_words = WordList()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_generator.reset)
+
+
+def new_id() -> str:
+    """
+    A new, unique, time ordered id.
+    """
+    return _generator.new_id()
+
+
+def new_alias_id(words: int = 2) -> str:
+    """
+    A new, unique, time ordered id, followed by a human readable word alias.
+    """
+    return f"{_generator.new_id()}-{_words.alias(words)}"
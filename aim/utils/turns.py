@@ -1,6 +1,8 @@
 # aim/utils/turns.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
+from bisect import bisect_left
+from itertools import accumulate
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,4 +34,35 @@ def validate_turns(turns: list[dict[str, str]]) -> None:
         else:
             logger.warning(', '.join([turn['role'] for turn in turns]))
             raise ValueError(f"Turn {i + offset} is not a user or assistant turn: {turn['role']}")
-    
\ No newline at end of file
+
+
+def trim_history(history: list[dict[str, str]], max_length: int, block_size: int = 8, min_turns: int = 4) -> tuple[list[dict[str, str]], int]:
+    """
+    Deterministically trims the history to fit in `max_length` characters, by dropping the oldest whole blocks of `block_size` turns.
+
+    Blocks are counted from the start of the conversation, so the trimmed history only changes its first turn when a
+    block boundary is crossed; the same history always trims the same way. At least `min_turns` turns are kept.
+
+    Args:
+        history (list[dict[str, str]]): The chat history, oldest turn first.
+        max_length (int): The character budget for the history.
+        block_size (int): The number of turns dropped at a time. Should be even, to keep the user/assistant alternation.
+        min_turns (int): The number of most recent turns that are never dropped.
+
+    Returns:
+        tuple[list[dict[str, str]], int]: The trimmed history, and the number of turns dropped.
+    """
+    # prefix[k] is the length of the first k turns
+    prefix = [0, *accumulate(len(h['content']) for h in history)]
+    total = prefix[-1]
+    if total <= max_length:
+        return history, 0
+
+    # The fewest turns we can drop from the front to fit, rounded up to a whole block
+    drop = bisect_left(prefix, total - max_length)
+    drop = -(-drop // block_size) * block_size
+    max_drop = max(0, len(history) - min_turns)
+    if drop > max_drop:
+        drop = (max_drop // block_size) * block_size
+
+    return history[drop:], drop
@@ -1,7 +1,7 @@
 # aim/utils/xml.py
 # AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0 
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import logging
 import re
 from collections import OrderedDict
@@ -33,6 +33,37 @@ class XmlLeaf:
             return ""
         return " " + " ".join(f'{k}="{v}"' for k, v in self.attrs.items())
 
+    def rendered_size(self, indent_str: str = "  ") -> tuple[int, int]:
+        """
+        The exact size of this leaf once rendered.
+
+        Returns:
+            tuple[int, int]: The number of characters (excluding newlines) and the number of lines.
+        """
+        indent_len = len(indent_str) * (max(0, self.depth) + 1)
+        name_len = len(self.name)
+        attrs_len = sum(len(str(k)) + len(str(v)) + 4 for k, v in self.attrs.items()) if self.attrs else 0
+        content_len = len(str(self.content))
+        if self.nowrap:
+            return indent_len + 2 * name_len + attrs_len + content_len + 5, 1
+        chars = 2 * indent_len + 2 * name_len + attrs_len + 5
+        if self.content:
+            return chars + indent_len + len(indent_str) + content_len, 3
+        return chars, 2
+
+    def render_into(self, out: list[str], indent_str: str = "  ") -> None:
+        """
+        Render the leaf, appending its lines to the output buffer.
+        """
+        leaf_indent = indent_str * (max(0, self.depth) + 1)
+        if self.nowrap:
+            out.append(f"{leaf_indent}<{self.name}{self.format_attrs}>{self.content}</{self.name}>")
+        else:
+            out.append(f"{leaf_indent}<{self.name}{self.format_attrs}>")
+            if self.content:
+                out.append(f"{leaf_indent}{indent_str}{self.content}")
+            out.append(f"{leaf_indent}</{self.name}>")
+
 
 @dataclass
 class XmlNode:
@@ -43,12 +74,15 @@ class XmlNode:
     leaves: list[XmlLeaf]
     children: OrderedDict[str, "XmlNode"]
     depth: int = 0
+    fragments: list[str] = field(default_factory=list)
 
-    def add_leaf(self, name: str, content: str, attrs: dict = {}, nowrap: bool = False) -> None:
+    def add_leaf(self, name: str, content: str, attrs: dict = {}, nowrap: bool = False) -> XmlLeaf:
         """
         Add a leaf node to the current node.
         """
-        self.leaves.append(XmlLeaf(depth=self.depth, name=name, content=content, attrs=attrs, nowrap=nowrap))
+        leaf = XmlLeaf(depth=self.depth, name=name, content=content, attrs=attrs, nowrap=nowrap)
+        self.leaves.append(leaf)
+        return leaf
 
     def add_child(self, name: str) -> "XmlNode":
         """
@@ -58,85 +92,132 @@ class XmlNode:
             self.children[name] = XmlNode(depth=self.depth + 1, name=name, leaves=[], children={})
             #logger.info(f"Added child node {name} to {self.name}")
         return self.children[name]
-        
-    def render(self, indent_str: str = "  ") -> list[str]:
+
+    def rendered_size(self, indent_str: str = "  ") -> tuple[int, int]:
         """
-        Render the XML node and its children to a string.
+        The size of the open and close tags of this node, without leaves or children.
+
+        Returns:
+            tuple[int, int]: The number of characters (excluding newlines) and the number of lines.
+        """
+        if self.depth == -1:
+            return len("<root>") + len("</root>"), 2
+        return 2 * len(indent_str) * max(0, self.depth) + 2 * len(self.name) + 5, 2
+
+    def render_into(self, out: list[str], indent_str: str = "  ") -> None:
+        """
+        Render the node and its children, appending lines to a single output buffer.
         """
-        result = []
-        indent = indent_str * max(0, self.depth)
-        
-        # Special handling for root node
         if self.depth == -1:
-            result.append("<root>")
-            
-            # Render any leaves attached directly to the root
-            for leaf in self.leaves:
-                leaf_indent = indent_str  
-                if leaf.nowrap:
-                    result.append(f"{leaf_indent}<{leaf.name}{leaf.format_attrs}>{leaf.content}</{leaf.name}>")
-                else:
-                    result.append(f"{leaf_indent}<{leaf.name}{leaf.format_attrs}>")
-                    if leaf.content:
-                        result.append(f"{leaf_indent}{indent_str}{leaf.content}")
-                    result.append(f"{leaf_indent}</{leaf.name}>")
-            
-            # Then render child nodes
-            for child in self.children.values():
-                result.extend(child.render(indent_str))
-            result.append("</root>")
-            return result
-        
-        # Start tag for non-root nodes
-        result.append(f"{indent}<{self.name}>")
-        
-        # Handle leaves first
+            # Special handling for root node
+            start_tag, end_tag = "<root>", "</root>"
+        else:
+            indent = indent_str * max(0, self.depth)
+            start_tag, end_tag = f"{indent}<{self.name}>", f"{indent}</{self.name}>"
+
+        out.append(start_tag)
+
+        # Pre-rendered fragments come straight after the start tag
+        out.extend(self.fragments)
+
+        # Then handle leaves
         for leaf in self.leaves:
-            leaf_indent = indent + indent_str
-            if leaf.nowrap:
-                result.append(f"{leaf_indent}<{leaf.name}{leaf.format_attrs}>{leaf.content}</{leaf.name}>")
-            else:
-                result.append(f"{leaf_indent}<{leaf.name}{leaf.format_attrs}>")
-                if leaf.content:
-                    result.append(f"{leaf_indent}{indent_str}{leaf.content}")
-                result.append(f"{leaf_indent}</{leaf.name}>")
-        
+            leaf.render_into(out, indent_str)
+
         # Then handle child nodes
         for child in self.children.values():
-            result.extend(child.render(indent_str))
-        
-        # End tag for non-root nodes
-        result.append(f"{indent}</{self.name}>")
-        
+            child.render_into(out, indent_str)
+
+        out.append(end_tag)
+
+    def render(self, indent_str: str = "  ") -> list[str]:
+        """
+        Render the XML node and its children to a list of lines.
+        """
+        result = []
+        self.render_into(result, indent_str)
         return result
 
 class XmlRoot:
     """
     The root node of an XML document.
+
+    Nodes are looked up by their full path through an interned path cache, and the
+    exact rendered size of the document is kept up to date as nodes and leaves are added.
     """
     root: XmlNode
 
-    def __init__(self):
+    def __init__(self, indent_str: str = "  "):
+        self.indent_str = indent_str
         self.root = XmlNode(depth=-1, name="root", leaves=[], children={})
+        self._paths : dict[tuple[str, ...], XmlNode] = {(): self.root}
+        self._chars, self._lines = self.root.rendered_size(indent_str)
+
+    @property
+    def rendered_length(self) -> int:
+        """
+        The exact length of the string returned by `render`.
+        """
+        return self._chars + self._lines - 1
+
+    def _account(self, size: tuple[int, int], sign: int = 1) -> None:
+        chars, lines = size
+        self._chars += sign * chars
+        self._lines += sign * lines
+
+    def node_at(self, path: tuple[str, ...]) -> XmlNode:
+        """
+        Return the node at the given path, creating any missing nodes along the way.
+        """
+        node = self._paths.get(path)
+        if node is not None:
+            return node
+
+        parent = self.node_at(path[:-1])
+        name = path[-1]
+        node = parent.children.get(name)
+        if node is None:
+            node = parent.add_child(name)
+            self._account(node.rendered_size(self.indent_str))
+        self._paths[path] = node
+        return node
 
     def drill(self, path: list[str]) -> XmlNode | None:
         """
         Drill down into the tree structure based on the given path.
         """
-        current_node = self.root
-        for part in path:
-            if part not in current_node.children:
-                #logger.warning(f"Path {part} not found in current node {current_node.name}")
-                current_node.add_child(part)
-            current_node = current_node.children[part]
+        return self.node_at(tuple(path))
+
+    def add_leaf(self, node: XmlNode, name: str, content: str, attrs: dict = {}, nowrap: bool = False) -> XmlLeaf:
+        """
+        Add a leaf to a node in this tree, tracking its rendered size.
+        """
+        leaf = node.add_leaf(name=name, content=content, attrs=attrs, nowrap=nowrap)
+        self._account(leaf.rendered_size(self.indent_str))
+        return leaf
+
+    def add_fragment(self, node: XmlNode, lines: list[str]) -> None:
+        """
+        Add pre-rendered lines to a node in this tree, tracking their rendered size.
+        """
+        node.fragments.extend(lines)
+        self._account((sum(len(line) for line in lines), len(lines)))
 
-        return current_node
+    def update_leaf(self, leaf: XmlLeaf, content: str) -> None:
+        """
+        Replace the content of a leaf in this tree, tracking its rendered size.
+        """
+        self._account(leaf.rendered_size(self.indent_str), sign=-1)
+        leaf.content = content
+        self._account(leaf.rendered_size(self.indent_str))
 
     def render(self) -> str:
         """
         Render the XML document to a string.
         """
-        return "\n".join(self.root.render())
+        out : list[str] = []
+        self.root.render_into(out, self.indent_str)
+        return "\n".join(out)
 
 class XmlFormatter:
     """
@@ -148,9 +229,9 @@ class XmlFormatter:
     nesting depths.
 
     Attributes:
-        tree (dict): Internal representation of the XML document structure
+        tree (XmlRoot): Internal representation of the XML document structure
         indent (str): String used for each level of indentation
-        _current_length (int): Running total of content length in characters
+        _content_length (int): Running total of content length in characters
     """
 
     def __init__(self, base_indent: str = "  "):
@@ -159,27 +240,38 @@ class XmlFormatter:
 
         Args:
             base_indent (str): String to use for each level of indentation
-                             Defaults to 4 spaces.
+                             Defaults to 2 spaces.
         """
-        self.tree = XmlRoot()
+        self.tree = XmlRoot(indent_str=base_indent)
         self.indent = base_indent
-        self._current_length = 0
+        self._content_length = 0
 
     @property
     def current_length(self) -> int:
         """
-        Total length of all content and attributes in characters.
+        Exact length of the rendered document in characters, including tags and indentation.
+
+        Returns:
+            int: Length of the string `render` would currently return
+        """
+        return self.tree.rendered_length
+
+    @property
+    def content_length(self) -> int:
+        """
+        Total length of all content and attributes in characters, ignoring markup.
 
         Returns:
             int: Current length of all content in the document
         """
-        return self._current_length
+        return self._content_length
 
     def add_element(self, *path: str, content: str = None, nowrap: bool = False, **attrs):
         """
         Add an element with content and optional attributes at the specified path.
 
-        Tracks the length of added content and attributes in current_length.
+        Tracks the length of added content and attributes in content_length, and the
+        exact rendered length in current_length.
 
         Args:
             *path (str): Variable length path to the element location
@@ -189,37 +281,49 @@ class XmlFormatter:
         if not path:
             raise ValueError("Path must contain at least one element name")
 
-        # Get the parent path and the leaf name
-        *parent_path, last = path
-        
-        # Always drill to the parent path first
-        current = self.tree.root
-        for part in parent_path:
-            current = current.add_child(part)
-
-        # If we have content, add it as a leaf to the parent
         if content is not None:
-            # Add new content length
-            current.add_leaf(name=last, content=content, attrs=attrs, nowrap=nowrap)
+            # Add the content as a leaf of the parent
+            current = self.tree.node_at(path[:-1])
+            self.tree.add_leaf(current, name=path[-1], content=content, attrs=attrs, nowrap=nowrap)
             new_attrs_length = sum(len(str(k)) + len(str(v)) + 4 for k, v in attrs.items())
-            self._current_length += len(str(content)) + new_attrs_length
+            self._content_length += len(str(content)) + new_attrs_length
         else:
             # If no content, create a new node
-            current = current.add_child(last)
+            self.tree.node_at(path)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"Added element {'/'.join(path)} "
+                f"with content length {len(str(content)) if content else 0} "
+                f"(total {self.current_length})"
+            )
+
+    def add_fragment(self, *path: str, lines: list[str]) -> None:
+        """
+        Add pre-rendered lines at the specified path.
+
+        The lines must already carry the indentation for their depth; they are rendered
+        before any leaves or children of the node, and are not re-rendered.
+
+        Args:
+            *path (str): Variable length path to the node location
+            lines (list[str]): The rendered lines to insert
+        """
+        if not path:
+            raise ValueError("Path must contain at least one element name")
 
-        logger.info(
-            f"Added element {'/'.join(path)} "
-            f"with content length {len(str(content)) if content else 0} "
-            f"(total {self._current_length})"
-        )
+        self.tree.add_fragment(self.tree.node_at(path), lines)
 
     def substitute(self, match_regex: str, replacement: str) -> None:
         """
         Substitute all occurrences of a regex pattern with a replacement string.
         """
+        pattern = re.compile(match_regex)
         for leaf in self.tree.root.leaves:
             if leaf.content:
-                leaf.content = re.sub(match_regex, replacement, leaf.content)
+                new_content = pattern.sub(replacement, leaf.content)
+                self._content_length += len(new_content) - len(str(leaf.content))
+                self.tree.update_leaf(leaf, new_content)
 
     def render(self) -> str:
         """
@@ -228,4 +332,4 @@ class XmlFormatter:
         Returns:
             str: The formatted XML document as a string with proper indentation
         """
-        return self.tree.render()
\ No newline at end of file
+        return self.tree.render()
@@ -9,7 +9,10 @@ import signal
 import sys
 
 from ..config  import ChatConfig
+from ..conversation.maintenance import IndexMaintenance
+from ..llm.cache import CompletionCache
 from ..pipeline.factory import pipeline_factory, BasePipeline
+from ..pipeline.state import PipelineStateStore
 
 logger = logging.getLogger(__name__)
 
@@ -18,19 +21,29 @@ async def process_pipeline_task(job: Job, job_token: str):
         pipeline_type = job.data['pipeline_type']
         job_config = job.data['config']
 
-        if job.progress > 0:
+        config = ChatConfig.from_env()
+        config.update(**job_config)
+
+        # Only a job marked finished is done; progress alone doesn't say its responses were saved
+        store = PipelineStateStore.from_config(config)
+        if store.finished(str(job.id)):
             logger.info(f"Pipeline {pipeline_type} already processed.")
             return f"Pipeline {pipeline_type} already processed."
 
         logger.info(f"Processing {pipeline_type} pipeline with config: {job_config}")
 
-        config = ChatConfig.from_env()
-        config.update(**job_config)
+        if job.attemptsMade > 0:
+            # A retry: completions generated before its last checkpoint are reused too
+            logger.info(f"Resuming {pipeline_type} pipeline after {job.attemptsMade} failed attempts")
+            config.resume = True
 
         pipeline = BasePipeline.from_config(config, **job_config)
         async def progress_callback(progress: int):
             await job.updateProgress(progress)
         pipeline.progrsss_callback = progress_callback
+        # Checkpointed after every step, so a retry resumes at the step that failed
+        pipeline.run_id = str(job.id)
+        pipeline.pipeline_type = pipeline_type
         pipeline_func = pipeline_factory(pipeline_type)
         
         # Run the pipeline
@@ -38,6 +51,7 @@ async def process_pipeline_task(job: Job, job_token: str):
 
         # Update the job status
         await job.updateProgress(100)
+        pipeline.finish_run()
         
         return f"Completed {pipeline_type} pipeline"
     except Exception as e:
@@ -46,6 +60,24 @@ async def process_pipeline_task(job: Job, job_token: str):
         traceback.print_exc()
         await job.moveToFailed(err=str(e))
 
+async def prune_expired(config: ChatConfig, stop: asyncio.Event, interval: float = 3600) -> None:
+    """Remove expired pipeline run states and stored completions until stopped"""
+    store = PipelineStateStore.from_config(config)
+    completions = CompletionCache.from_config(config)
+    while not stop.is_set():
+        try:
+            await asyncio.to_thread(store.prune)
+        except Exception as e:
+            logger.error(f"Error pruning pipeline run states: {e}")
+        try:
+            await asyncio.to_thread(completions.prune)
+        except Exception as e:
+            logger.error(f"Error pruning stored completions: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
 async def run_consumer(config : ChatConfig):
     try:
         worker_options : WorkerOptions = {
@@ -69,10 +101,21 @@ async def run_consumer(config : ChatConfig):
 
 
         logger.info("Consumer started successfully.")
+
+        # Compact the conversation index while it's idle
+        maintenance_task = None
+        if config.index_maintenance_interval > 0:
+            maintenance = IndexMaintenance.from_config(config)
+            maintenance_task = asyncio.create_task(maintenance.run(shutdown_event))
+        # Forget the states of long finished or abandoned pipeline runs, and the completions they stored
+        prune_task = asyncio.create_task(prune_expired(config, shutdown_event))
         
         await shutdown_event.wait()
 
         logger.info("Cleaning up worker...")
+        if maintenance_task is not None:
+            await maintenance_task
+        await prune_task
         await worker.close()
         logger.info("Worker shut down successfully.")
     except Exception as e:
@@ -0,0 +1,82 @@
+# benchmarks/embedding_backend.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Compares the CPU embedding backends against the eager torch model: per text latency, and the
+# cosine similarity of each backend's embeddings to the eager ones.
+#
+#   python -m benchmarks.embedding_backend --model sentence-transformers/all-MiniLM-L6-v2 --threads 4
+#
+# onnx needs onnxruntime installed; a backend that can't be built is reported and skipped.
+
+import click
+import numpy as np
+import random
+import time
+
+from aim.conversation.embedding import BACKENDS, BACKEND_TORCH, EagerRunner, build_runner
+
+WORDS = "the a memory garden spring we talked about roses never bloomed river quiet morning light remember said".split()
+
+
+def make_texts(count: int, words: int) -> list[str]:
+    return [" ".join(random.choices(WORDS, k=random.randint(words // 2, words))) for _ in range(count)]
+
+
+def embed(runner, tokenizer, texts: list[str]) -> tuple[np.ndarray, list[float]]:
+    vectors, latencies = [], []
+    for text in texts:
+        start = time.perf_counter()
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+        vectors.append(runner(inputs)[0, 0])
+        latencies.append(time.perf_counter() - start)
+    return np.array(vectors), latencies
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+@click.command()
+@click.option('--model', 'model_name', default="sentence-transformers/all-MiniLM-L6-v2", help='Embedding model')
+@click.option('--backend', 'backends', multiple=True, type=click.Choice(BACKENDS), help='Backends to compare, defaults to all')
+@click.option('--texts', default=200, help='Number of texts to embed')
+@click.option('--words', default=60, help='Maximum words per text')
+@click.option('--threads', default=0, help='Intra-op threads, 0 for the default')
+@click.option('--seed', default=0, help='Random seed')
+def main(model_name: str, backends: tuple[str, ...], texts: int, words: int, threads: int, seed: int):
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    random.seed(seed)
+    if threads > 0:
+        torch.set_num_threads(threads)
+    tokenizer = AutoTokenizer.from_pretrained(model_name, clean_up_tokenization_spaces=False)
+    model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+    corpus = make_texts(texts, words)
+
+    eager = EagerRunner(model)
+    embed(eager, tokenizer, corpus[:5])
+    baseline, baseline_latencies = embed(eager, tokenizer, corpus)
+    baseline_p50 = np.percentile(baseline_latencies, 50)
+
+    click.echo(f"{'backend':<8} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8} {'min cos':>8} {'mean cos':>9}")
+    for backend in backends or BACKENDS:
+        if backend == BACKEND_TORCH:
+            vectors, latencies = baseline, baseline_latencies
+        else:
+            try:
+                runner = build_runner(backend, model, tokenizer, model_name, threads)
+            except ImportError as e:
+                click.echo(f"{backend:<8} unavailable: {e}")
+                continue
+            # Warm up, as the server does at start up
+            embed(runner, tokenizer, corpus[:5])
+            vectors, latencies = embed(runner, tokenizer, corpus)
+        similarity = cosine(baseline, vectors)
+        p50, p95 = np.percentile(latencies, 50), np.percentile(latencies, 95)
+        click.echo(f"{backend:<8} {p50 * 1000:8.2f} {p95 * 1000:8.2f} {baseline_p50 / p50:7.2f}x "
+                   f"{similarity.min():8.4f} {similarity.mean():9.4f}")
+
+
+if __name__ == '__main__':
+    main()
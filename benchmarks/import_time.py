@@ -0,0 +1,61 @@
+# benchmarks/import_time.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Profiles the cold import of the entry points with `python -X importtime`, and summarizes
+# the total time and the most expensive packages, so regressions in start up time show up.
+#
+#   python -m benchmarks.import_time --top 15
+
+import click
+from collections import defaultdict
+import re
+import subprocess
+import sys
+
+ENTRY_POINTS = [
+    "aim.app.cli.__main__",
+    "aim.server.serverapi",
+    "aim.worker.consumer",
+]
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def profile(module: str) -> list[tuple[int, int, int, str]]:
+    """
+    Import a module in a fresh interpreter, returning (self us, cumulative us, depth, name) per import.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        tail = result.stderr.strip().splitlines()[-1:] or ["unknown error"]
+        raise click.ClickException(f"Importing {module} failed: {tail[0]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((int(self_us), int(cumulative_us), len(indent) // 2, name))
+    return imports
+
+
+@click.command()
+@click.option('--module', 'modules', multiple=True, help='Module to profile, defaults to the entry points')
+@click.option('--top', default=10, help='Number of packages to list')
+@click.option('--runs', default=3, help='Runs per module; the fastest is reported')
+def main(modules: tuple[str, ...], top: int, runs: int):
+    for module in modules or ENTRY_POINTS:
+        best = min((profile(module) for _ in range(runs)), key=lambda imports: sum(i[0] for i in imports))
+        total_ms = sum(i[0] for i in best) / 1000
+        click.echo(f"{module}: {total_ms:8.1f}ms, {len(best)} modules")
+
+        # Charge each import's own time to its top level package
+        packages = defaultdict(int)
+        for self_us, _, _, name in best:
+            packages[name.split(".")[0]] += self_us
+        for name, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[:top]:
+            click.echo(f"  {name:<24} {self_us / 1000:8.1f}ms  {self_us / 1000 / total_ms * 100:5.1f}%")
+
+
+if __name__ == '__main__':
+    main()
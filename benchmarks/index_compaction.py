@@ -0,0 +1,91 @@
+# benchmarks/index_compaction.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Builds an index the way a conversation does, one commit per document, deletes some of it, and measures
+# query latency and the index stats before compaction, after a merge, and after a vacuum.
+#
+#   python -m benchmarks.index_compaction --docs 1000 --delete 0.3
+#
+# Documents are written without vectors; the search doesn't need them, and no model is loaded.
+
+import click
+import numpy as np
+from pathlib import Path
+import random
+import tempfile
+import time
+
+from aim.conversation.index import SearchIndex
+from aim.conversation.maintenance import CompactionPolicy
+
+WORDS = "the a memory garden spring we talked about roses never bloomed river quiet morning light remember said".split()
+
+
+def make_doc(i: int, words: int) -> dict:
+    return {
+        "doc_id": f"doc-{i}",
+        "content": " ".join(random.choices(WORDS, k=random.randint(words // 2, words))),
+        "conversation_id": f"conversation-{i // 50}",
+        "user_id": "user",
+        "persona_id": "assistant",
+        "role": "user" if i % 2 == 0 else "assistant",
+        "timestamp": 1_700_000_000 + i * 60,
+        "sequence_no": i % 50,
+        "branch": 0,
+    }
+
+
+def measure(index: SearchIndex, queries: list[str], limit: int) -> list[float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search([query], query_persona_id="assistant", query_limit=limit)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+@click.command()
+@click.option('--docs', default=1000, help='Documents, each committed on its own')
+@click.option('--delete', default=0.3, help='Share of the documents deleted, one commit each')
+@click.option('--queries', default=200, help='Number of queries per measurement')
+@click.option('--words', default=60, help='Maximum words per document')
+@click.option('--limit', default=20, help='Hits per query')
+@click.option('--seed', default=0, help='Random seed')
+def main(docs: int, delete: float, queries: int, words: int, limit: int, seed: int):
+    random.seed(seed)
+    query_texts = [" ".join(random.choices(WORDS, k=3)) for _ in range(queries)]
+    policy = CompactionPolicy()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index = SearchIndex(Path(temp_dir) / "index", embedding_model="sentence-transformers/all-MiniLM-L6-v2")
+        start = time.perf_counter()
+        for i in range(docs):
+            writer = index.index.writer()
+            writer.add_document(index.to_doc(make_doc(i, words)))
+            writer.commit()
+            del writer
+        for i in random.sample(range(docs), int(docs * delete)):
+            writer = index.index.writer()
+            writer.delete_documents("doc_id", f"doc-{i}")
+            writer.commit()
+            del writer
+        index.reload()
+        click.echo(f"Indexed {docs} documents in {time.perf_counter() - start:.1f}s")
+
+        click.echo(f"{'stage':<8} {'segments':>8} {'deleted':>8} {'KiB':>8} {'due':>7} {'p50 ms':>8} {'p95 ms':>8} {'compact s':>10}")
+        for stage in ("before", "merge", "vacuum"):
+            elapsed = 0.0
+            if stage != "before":
+                start = time.perf_counter()
+                index.compact(vacuum=stage == "vacuum")
+                elapsed = time.perf_counter() - start
+            measure(index, query_texts[:10], limit)
+            latencies = measure(index, query_texts, limit)
+            stats = index.stats()
+            click.echo(f"{stage:<8} {stats.segments:8d} {stats.deleted_docs:8d} {stats.size_bytes / 1024:8.0f} "
+                       f"{policy.due(stats) or '-':>7} {np.percentile(latencies, 50) * 1000:8.2f} "
+                       f"{np.percentile(latencies, 95) * 1000:8.2f} {elapsed:10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/message_codec.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Measures ConversationMessage serialization throughput (to JSONL lines and back, the way the
+# conversation files are written and loaded), and the memory held per 1M messages.
+#
+#   python -m benchmarks.message_codec --messages 200000
+
+import click
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from aim.conversation.message import ConversationMessage
+
+
+def make_messages(count: int, content_size: int) -> list[ConversationMessage]:
+    messages = []
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(ConversationMessage.create(
+            conversation_id=f"conversation-{i // 100}",
+            sequence_no=i % 100,
+            role=role,
+            content="".join(random.choices("abcdefghij klmnop", k=content_size)),
+            speaker_id="user" if role == "user" else "assistant",
+            doc_id=f"doc-{i}",
+            emotion_a="Curious" if i % 3 == 0 else None,
+            timestamp=1_700_000_000 + i,
+        ))
+    return messages
+
+
+def rate(count: int, seconds: float) -> str:
+    return f"{count / seconds:12,.0f} msg/s"
+
+
+@click.command()
+@click.option('--messages', default=200_000, help='Number of messages to encode and decode')
+@click.option('--content-size', default=400, help='Characters of content per message')
+@click.option('--seed', default=0, help='Random seed')
+def main(messages: int, content_size: int, seed: int):
+    random.seed(seed)
+    corpus = make_messages(messages, content_size)
+
+    start = time.perf_counter()
+    dicts = [m.to_dict() for m in corpus]
+    click.echo(f"to_dict    {rate(messages, time.perf_counter() - start)}")
+
+    start = time.perf_counter()
+    lines = [m.to_json() for m in corpus]
+    click.echo(f"to_json    {rate(messages, time.perf_counter() - start)}")
+
+    start = time.perf_counter()
+    [ConversationMessage.from_dict(d) for d in dicts]
+    click.echo(f"from_dict  {rate(messages, time.perf_counter() - start)}")
+
+    encoded = [line.encode("utf-8") for line in lines]
+    start = time.perf_counter()
+    [ConversationMessage.from_json(line) for line in encoded]
+    click.echo(f"from_json  {rate(messages, time.perf_counter() - start)}")
+
+    # The decoded representation must round trip exactly
+    assert all(json.loads(line) == d for line, d in zip(lines, dicts))
+
+    # Memory of the message objects themselves, without the content strings they share with the corpus
+    del dicts, lines
+    gc.collect()
+    sample = min(messages, 100_000)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [ConversationMessage.from_dict({**m.to_dict(), "content": m.content}) for m in corpus[:sample]]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_message = (after - before) / len(held)
+    click.echo(f"memory     {per_message:8.0f} bytes/msg  {per_message * 1_000_000 / 1024 / 1024:8.1f} MiB per 1M messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/prefix_cache.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Simulates a growing conversation through the xmlmemory strategy, and measures how much of
+# each prompt is shared with the previous request - the part an inference server with prefix
+# caching (vLLM, llama.cpp) can reuse - for the default and the prefix-stable layouts.
+#
+#   python -m benchmarks.prefix_cache --turns 40
+
+import click
+import random
+import statistics
+import time
+
+import pandas as pd
+
+from aim.agents.persona import Persona
+from aim.chat.strategy.xmlmemory import XMLMemoryTurnStrategy
+from aim.config import ChatConfig
+from aim.conversation.message import VISIBLE_COLUMNS
+from aim.utils.xml import XmlFormatter
+
+
+class StubConversationModel:
+    """Returns a fresh set of random memories on every call, like a real recall would."""
+
+    def __init__(self, memory_size: int):
+        self.memory_size = memory_size
+
+    def _memories(self, count: int) -> pd.DataFrame:
+        rows = []
+        for _ in range(count):
+            doc_id = f"doc-{random.randint(0, 1_000_000)}"
+            row = {c: None for c in VISIBLE_COLUMNS}
+            row.update({
+                "doc_id": doc_id,
+                "document_type": "conversation",
+                "conversation_id": "bench",
+                "content": f"{doc_id} " + "m" * self.memory_size,
+                "date": "2025-01-01 00:00:00",
+                "emotion_a": "Curious",
+            })
+            rows.append(row)
+        return pd.DataFrame(rows, columns=VISIBLE_COLUMNS + ['date'])
+
+    def get_motd(self, top_n: int) -> pd.DataFrame:
+        return pd.DataFrame(columns=VISIBLE_COLUMNS + ['date'])
+
+    def get_conscious(self, persona_id: str, top_n: int) -> pd.DataFrame:
+        return self._memories(top_n)
+
+    def get_documents(self, message_ids: list[str]) -> pd.DataFrame:
+        return self._memories(len(message_ids))
+
+    def query(self, query_texts: list[str], top_n: int, **kwargs) -> pd.DataFrame:
+        return self._memories(max(0, top_n))
+
+
+class StubChat:
+    def __init__(self, config: ChatConfig, memory_size: int):
+        self.config = config
+        self.cvm = StubConversationModel(memory_size)
+        self.library = None
+        self.current_document = None
+        self.current_workspace = None
+
+
+def serialize(system_message: str, turns: list[dict[str, str]]) -> str:
+    return system_message + "".join(f"<|{t['role']}|>{t['content']}" for t in turns)
+
+
+def shared_prefix(a: str, b: str) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def simulate(persona: Persona, prefix_stable: bool, turns: int, turn_size: int, memory_size: int) -> tuple[list[float], list[int], list[float]]:
+    config = ChatConfig()
+    strategy = XMLMemoryTurnStrategy(StubChat(config, memory_size), prefix_stable=prefix_stable)
+    system_formatter = persona.xml_decorator(XmlFormatter(), user_id="user")
+    system_message = system_formatter.render()
+
+    history = []
+    previous = None
+    ratios, expected, timings = [], [], []
+    for i in range(turns):
+        user_input = f"user turn {i} " + "u" * turn_size
+        start = time.perf_counter()
+        prepared = strategy.chat_turns_for(persona=persona, user_input=user_input, history=history, content_len=len(system_message))
+        timings.append((time.perf_counter() - start) * 1000)
+        prompt = serialize(system_message, prepared)
+        if previous is not None:
+            ratios.append(shared_prefix(previous, prompt) / len(prompt))
+        expected.append(strategy.cacheable_prefix_length)
+        previous = prompt
+        history = [*history,
+                   {"role": "user", "content": user_input},
+                   {"role": "assistant", "content": f"assistant turn {i} " + "a" * turn_size}]
+    return ratios, expected, timings
+
+
+@click.command()
+@click.option('--persona-file', default="config/persona/Andi.json", help='Persona to build the system prompt for')
+@click.option('--turns', default=40, help='Number of requests in the simulated conversation')
+@click.option('--turn-size', default=800, help='Characters per user and assistant turn')
+@click.option('--memory-size', default=600, help='Characters per recalled memory')
+@click.option('--seed', default=0, help='Random seed')
+def main(persona_file: str, turns: int, turn_size: int, memory_size: int, seed: int):
+    persona = Persona.from_json_file(persona_file)
+    for prefix_stable in (False, True):
+        random.seed(seed)
+        ratios, expected, timings = simulate(persona, prefix_stable, turns, turn_size, memory_size)
+        name = "prefix-stable" if prefix_stable else "default"
+        click.echo(
+            f"{name:<14} shared prefix mean {statistics.mean(ratios) * 100:5.1f}%  "
+            f"min {min(ratios) * 100:5.1f}%  "
+            f"expected cacheable mean {statistics.mean(expected):9.0f} chars  "
+            f"build mean {statistics.mean(timings):7.3f}ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
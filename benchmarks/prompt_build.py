@@ -0,0 +1,69 @@
+# benchmarks/prompt_build.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Times building the chat system prompt (persona XML) and the HUD memory block,
+# the way the chat route and the xmlmemory strategy build them on every request.
+#
+#   python -m benchmarks.prompt_build --persona-file config/persona/Andi.json
+
+import click
+import statistics
+import time
+
+from aim.agents.persona import Persona
+from aim.utils.xml import XmlFormatter
+
+
+def build_system_prompt(persona: Persona, user_id: str) -> str:
+    formatter = XmlFormatter()
+    formatter = persona.xml_decorator(formatter, mood="Inquisitive", user_id=user_id)
+    return formatter.render().replace("{{user}}", user_id)
+
+
+def build_hud(persona: Persona, memories: int, memory_size: int) -> str:
+    hud_name = "HUD Display Output"
+    formatter = XmlFormatter()
+    formatter.add_element("PraxOS", content="--== PraxOS Conscious Memory **Online** ==--", nowrap=True)
+    for thought in persona.thoughts:
+        formatter.add_element(hud_name, "thought", content=thought, nowrap=True)
+    for i in range(memories):
+        formatter.add_element(hud_name, "Active Memory", "memory",
+                              date="2025-01-01 00:00:00", type="conversation",
+                              content=f"memory {i} " + "x" * memory_size)
+    formatter.add_element(hud_name, "emotions", content="Curious, Warm")
+    formatter.add_element(hud_name, "keywords", content="**Semantic Keywords**")
+    return formatter.render()
+
+
+def timed(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    click.echo(f"{name:<16} mean {statistics.mean(samples):8.3f}ms  p50 {statistics.median(samples):8.3f}ms  p95 {p95:8.3f}ms")
+
+
+@click.command()
+@click.option('--persona-file', default="config/persona/Andi.json", help='Persona to build the system prompt for')
+@click.option('--iterations', default=500, help='Number of timed iterations')
+@click.option('--memories', default=200, help='Number of memory elements in the HUD')
+@click.option('--memory-size', default=1024, help='Characters per memory element')
+def main(persona_file: str, iterations: int, memories: int, memory_size: int):
+    persona = Persona.from_json_file(persona_file)
+
+    report("system prompt", timed(lambda: build_system_prompt(persona, "user"), iterations))
+    report("hud", timed(lambda: build_hud(persona, memories, memory_size), iterations))
+
+    click.echo(f"system prompt length: {len(build_system_prompt(persona, 'user'))}")
+    click.echo(f"hud length: {len(build_hud(persona, memories, memory_size))}")
+
+
+if __name__ == '__main__':
+    main()
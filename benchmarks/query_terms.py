@@ -0,0 +1,100 @@
+# benchmarks/query_terms.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Compares parsing whole recalled memories as queries against querying their most salient terms: query
+# latency, clause count, how often an indexed document quoted in the query text is in the top hits, and
+# the overlap of the top hits.
+#
+#   python -m benchmarks.query_terms --docs 20000 --query-words 1000 --max-terms 32
+#
+# Documents are written without vectors; the search doesn't need them, and no model is loaded.
+
+import click
+import numpy as np
+from pathlib import Path
+import re
+import tempfile
+import time
+
+from tantivy import Occur, Query
+
+from aim.conversation.index import SearchIndex
+from aim.conversation.query_builder import query_terms
+
+
+def make_vocabulary(size: int, rng: np.random.Generator) -> list[str]:
+    letters = list("abcdefghijklmnopqrstuvwxyz")
+    return ["".join(rng.choice(letters, size=rng.integers(3, 10))) for _ in range(size)]
+
+
+def make_text(vocabulary: list[str], words: int, rng: np.random.Generator) -> str:
+    # Zipf distributed, like natural language
+    ranks = np.minimum(rng.zipf(1.2, size=words), len(vocabulary)) - 1
+    return " ".join(vocabulary[r] for r in ranks)
+
+
+def parse_whole(index: SearchIndex, text: str) -> Query:
+    """The query as it was built before the query builder"""
+    text = re.sub(r"\s+", ' ', re.sub(r'[^\w\s]|\n', ' ', text)).lower()
+    return index.index.parse_query(query=text, default_field_names=["content"])
+
+
+def run(index: SearchIndex, build, texts: list[str], limit: int) -> tuple[list[float], list[set]]:
+    latencies, tops = [], []
+    for text in texts:
+        start = time.perf_counter()
+        searcher = index.index.searcher()
+        query = Query.boolean_query([(Occur.Should, build(searcher, text))])
+        hits = searcher.search(query, limit).hits
+        latencies.append(time.perf_counter() - start)
+        tops.append({searcher.doc(addr).get_first("doc_id") for _, addr in hits})
+    return latencies, tops
+
+
+@click.command()
+@click.option('--docs', default=20000, help='Documents in the index')
+@click.option('--doc-words', default=80, help='Words per document')
+@click.option('--vocabulary', 'vocabulary_size', default=20000, help='Distinct words')
+@click.option('--queries', default=50, help='Number of query texts')
+@click.option('--query-words', default=1000, help='Words per query text, as in a recalled memory')
+@click.option('--max-terms', default=32, help='Terms kept per query text')
+@click.option('--limit', default=20, help='Top hits compared')
+@click.option('--seed', default=0, help='Random seed')
+def main(docs: int, doc_words: int, vocabulary_size: int, queries: int, query_words: int, max_terms: int, limit: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index = SearchIndex(Path(temp_dir) / "index", embedding_model="sentence-transformers/all-MiniLM-L6-v2", query_max_terms=max_terms)
+        contents = [make_text(vocabulary, doc_words, rng) for _ in range(docs)]
+        writer = index.index.writer()
+        for i, content in enumerate(contents):
+            writer.add_document(index.to_doc({"doc_id": f"doc-{i}", "content": content,
+                                              "conversation_id": "conversation", "user_id": "user", "persona_id": "assistant",
+                                              "role": "assistant", "timestamp": i, "sequence_no": i, "branch": 0}))
+        writer.commit()
+        del writer
+        index.reload()
+
+        # Each query text quotes a document among its other words
+        targets = rng.integers(0, docs, queries)
+        texts = [contents[t] + " " + make_text(vocabulary, max(query_words - doc_words, 0), rng) for t in targets]
+        clauses = np.mean([len(set(query_terms(text))) for text in texts])
+
+        whole_latencies, whole_tops = run(index, lambda searcher, text: parse_whole(index, text), texts, limit)
+        cold_latencies, salient_tops = run(index, lambda searcher, text: index.query_builder.build(index.index, searcher, text), texts, limit)
+        warm_latencies, _ = run(index, lambda searcher, text: index.query_builder.build(index.index, searcher, text), texts, limit)
+        overlap = np.mean([len(a & b) / max(len(a), 1) for a, b in zip(whole_tops, salient_tops)])
+        found = {name: np.mean([f"doc-{t}" in top for t, top in zip(targets, tops)])
+                 for name, tops in (("whole", whole_tops), ("salient", salient_tops))}
+
+        click.echo(f"{'query':<14} {'clauses':>8} {'p50 ms':>8} {'p95 ms':>8} {'quoted@' + str(limit):>10} {'overlap@' + str(limit):>11}")
+        for name, count, latencies, quoted, shared in (("whole text", clauses, whole_latencies, found["whole"], 1.0),
+                                                       ("salient cold", min(clauses, max_terms), cold_latencies, found["salient"], overlap),
+                                                       ("salient warm", min(clauses, max_terms), warm_latencies, found["salient"], overlap)):
+            click.echo(f"{name:<14} {count:8.0f} {np.percentile(latencies, 50) * 1000:8.2f} "
+                       f"{np.percentile(latencies, 95) * 1000:8.2f} {quoted:10.2f} {shared:11.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/vector_rerank.py
+# AI-Mind © 2025 by Martin Bukowski is licensed under CC BY-NC-SA 4.0
+
+# Measures the stored vector formats: bytes per vector, decode and rerank latency, and the recall@k of each
+# dtype's inner-product ranking against exact float32 cosine similarity. Also reports where the old
+# 1 / L2 distance rerank put an exact match of the query.
+#
+#   python -m benchmarks.vector_rerank --candidates 200 --dim 1024
+
+import click
+import numpy as np
+import time
+
+from aim.conversation.vectors import DTYPES, decode_vector, encode_vector, normalize, similarity
+
+
+def make_vectors(count: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    # Clustered, like real embeddings, so the top-k is not trivially separated
+    centers = rng.normal(size=(max(count // 20, 1), dim))
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.normal(scale=0.5, size=(count, dim))
+    return vectors.astype(np.float32)
+
+
+@click.command()
+@click.option('--candidates', default=200, help='Candidates reranked per query, as returned by the search')
+@click.option('--queries', default=200, help='Number of queries')
+@click.option('--dim', default=1024, help='Embedding dimension')
+@click.option('--k', default=10, help='Top k for recall')
+@click.option('--seed', default=0, help='Random seed')
+def main(candidates: int, queries: int, dim: int, k: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = make_vectors(candidates, dim, rng)
+    query_vectors = make_vectors(queries, dim, rng)
+    exact = [np.argsort(-(np.stack([normalize(v) for v in vectors]) @ normalize(q)))[:k] for q in query_vectors]
+
+    click.echo(f"{'dtype':<8} {'bytes':>6} {'decode us':>10} {'rerank us':>10} {'recall@' + str(k):>10}")
+    for dtype in DTYPES:
+        encoded = [encode_vector(v, dtype) for v in vectors]
+
+        start = time.perf_counter()
+        for _ in range(queries):
+            decoded = [decode_vector(data) for data in encoded]
+        decode_us = (time.perf_counter() - start) / queries * 1e6
+
+        start = time.perf_counter()
+        scores = [similarity(q, decoded) for q in query_vectors]
+        rerank_us = (time.perf_counter() - start) / queries * 1e6
+
+        recall = np.mean([len(set(np.argsort(-s)[:k]) & set(e)) / k for s, e in zip(scores, exact)])
+        click.echo(f"{dtype:<8} {len(encoded[0]):6d} {decode_us:10.1f} {rerank_us:10.1f} {recall:10.4f}")
+
+    # The old rerank, 1 / squared L2 distance with 0 for a distance of 0, on the raw vectors
+    start = time.perf_counter()
+    ranks = []
+    for q in query_vectors:
+        candidates_with_query = np.vstack([vectors, q])
+        distance = ((candidates_with_query - q) ** 2).sum(axis=1)
+        rerank = np.array([1 / d if d > 0 else 0 for d in distance])
+        ranks.append(int(np.argsort(-rerank).tolist().index(len(vectors))) + 1)
+    old_us = (time.perf_counter() - start) / queries * 1e6
+    new_ranks = [int(np.argsort(-similarity(q, [*decoded, normalize(q)])).tolist().index(len(vectors))) + 1 for q in query_vectors]
+    click.echo(f"exact match rank of {candidates + 1}: 1/L2 {np.mean(ranks):.0f} ({old_us:.1f}us), inner product {np.mean(new_ranks):.0f}")
+
+
+if __name__ == '__main__':
+    main()